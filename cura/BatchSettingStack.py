@@ -0,0 +1,276 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import ast
+import builtins
+import json
+import math
+import os
+
+
+##  The setting definitions of a machine or extruder, read from its definition
+#   file and the files it inherits from.
+class BatchDefinition:
+    ##  \param definition_id The ID of the definition, which is the name of its
+    #   file without .def.json.
+    #   \param search_paths Directories to find the definition files in.
+    def __init__(self, definition_id, search_paths):
+        self.id = definition_id
+        self.metadata = {}
+        self.settings = {}  # Per setting key, a dictionary of its properties.
+        self._load(definition_id, search_paths)
+
+    def _load(self, definition_id, search_paths):
+        for search_path in search_paths:
+            path = os.path.join(search_path, definition_id + ".def.json")
+            if os.path.isfile(path):
+                break
+        else:
+            raise ValueError("Definition {0} was not found in {1}.".format(definition_id, ", ".join(search_paths)))
+
+        with open(path, encoding = "utf-8") as f:
+            data = json.load(f)
+        if "inherits" in data:
+            self._load(data["inherits"], search_paths)
+        self.metadata.update(data.get("metadata", {}))
+        self._addSettings(data.get("settings", {}))
+        for key, properties in data.get("overrides", {}).items():
+            if key in self.settings:
+                self.settings[key].update(properties)
+
+    def _addSettings(self, settings):
+        for key, properties in settings.items():
+            if properties.get("type") != "category":
+                self.settings.setdefault(key, {}).update((name, value) for name, value in properties.items() if name != "children")
+            self._addSettings(properties.get("children", {}))
+
+
+##  A formula of a setting property, such as the "value" of most settings.
+class _Formula:
+    ##  Functions that Cura offers to formulas, see CuraApplication.
+    Operators = {"extruderValue", "extruderValues", "resolveOrValue"}
+
+    def __init__(self, expression):
+        self.expression = expression
+        tree = ast.parse(expression.strip(), mode = "eval")
+        self.code = compile(tree, "<setting formula>", "eval")
+        self.used_keys = set(node.id for node in ast.walk(tree) if isinstance(node, ast.Name)) - self.Operators - {"math"} - set(dir(builtins))
+
+
+##  The setting values of a machine or one of its extruders, without Cura's
+#   setting stacks.
+#
+#   This looks up settings like the global and extruder stacks of Cura do. A
+#   value is taken from the first layer of values that has it, or else from the
+#   definition. Formulas are evaluated in the same way as Uranium's
+#   SettingFunction, with the functions that Cura adds for them. Settings that
+#   an extruder stack doesn't have are taken from the global stack.
+#
+#   Unlike in Cura, a formula that can't be evaluated raises a ValueError
+#   instead of falling back to a default, so no value is ever guessed.
+class BatchSettingStack:
+    ##  \param definition \type{BatchDefinition} The machine or extruder
+    #   definition.
+    #   \param values List of dictionaries of setting values, highest first.
+    #   Values can be strings as they are in profiles, where strings starting
+    #   with = are formulas.
+    #   \param global_stack \type{BatchSettingStack} The global stack, if this
+    #   is an extruder stack.
+    #   \param position The position of the extruder, if this is an extruder
+    #   stack.
+    def __init__(self, definition, values = (), global_stack = None, position = None):
+        self._definition = definition
+        self._values = [dict(layer) for layer in values]
+        self._global_stack = global_stack
+        self._position = position
+        self._extruders = {}  # Per position as a string, the extruder stacks of a global stack.
+        self._resolving_settings = set()
+        self._evaluating = set()
+        self._cache = {}
+        if global_stack is not None:
+            global_stack._extruders[str(position)] = self
+
+    def getPosition(self):
+        return self._position
+
+    ##  Get the extruder stacks of a global stack, by position.
+    def getExtruders(self):
+        return self._extruders
+
+    ##  Get the keys of all settings in the stack.
+    def getAllKeys(self):
+        keys = set(self._definition.settings)
+        if self._global_stack is not None:
+            keys |= self._global_stack.getAllKeys()
+        return keys
+
+    ##  Get a property of a setting, with formulas evaluated.
+    #
+    #   \param key The key of the setting.
+    #   \param property_name The name of the property, such as "value".
+    #   \return The evaluated property, or None if the setting doesn't exist.
+    def getProperty(self, key, property_name):
+        global_stack = self._global_stack if self._global_stack is not None else self
+        if global_stack._resolving_settings:
+            # Values found while a setting is being resolved may differ from their normal values.
+            return self._getProperty(key, property_name)
+        if (key, property_name) not in self._cache:
+            self._cache[(key, property_name)] = self._getProperty(key, property_name)
+        return self._cache[(key, property_name)]
+
+    ##  Get a property of a setting without evaluating it. Like in Uranium,
+    #   this falls back to the global stack for settings the stack doesn't have.
+    #
+    #   \return The property, which may be a formula, or None if the setting
+    #   doesn't exist.
+    def getRawProperty(self, key, property_name):
+        if property_name == "value":
+            for layer in self._values:
+                if key in layer:
+                    return self._convertValue(key, layer[key])
+        properties = self._definition.settings.get(key)
+        if properties is not None:
+            if property_name == "value":
+                property_name = "value" if "value" in properties else "default_value"
+            if property_name not in properties:
+                return _property_defaults.get(property_name)
+            value = properties[property_name]
+            if property_name in ("value", "limit_to_extruder", "resolve") and isinstance(value, str):
+                return _Formula(value)
+            return value
+        if self._global_stack is not None:
+            return self._global_stack.getRawProperty(key, property_name)
+        return None
+
+    def _getProperty(self, key, property_name):
+        if self._global_stack is None:
+            return self._getGlobalProperty(key, property_name)
+        return self._getExtruderProperty(key, property_name)
+
+    ##  Like GlobalStack.getProperty, including the resolve and
+    #   limit_to_extruder properties.
+    def _getGlobalProperty(self, key, property_name):
+        if key not in self._definition.settings:
+            return None
+
+        if property_name == "value" and key not in self._resolving_settings and not any(key in layer for layer in self._values):
+            self._resolving_settings.add(key)
+            try:
+                resolve = self._getStackProperty(key, "resolve")
+            finally:
+                self._resolving_settings.remove(key)
+            if resolve is not None:
+                return resolve
+
+        limit_to_extruder = self._getStackProperty(key, "limit_to_extruder")
+        if limit_to_extruder is not None and str(limit_to_extruder) != "-1" and str(limit_to_extruder) in self._extruders:
+            if self._getStackProperty(key, "settable_per_extruder"):
+                result = self._extruders[str(limit_to_extruder)].getProperty(key, property_name)
+                if result is not None:
+                    return result
+
+        return self._getStackProperty(key, property_name)
+
+    ##  Like ExtruderStack.getProperty.
+    def _getExtruderProperty(self, key, property_name):
+        if not self._getStackProperty(key, "settable_per_extruder"):
+            return self._global_stack.getProperty(key, property_name)
+
+        limit_to_extruder = self._getStackProperty(key, "limit_to_extruder")
+        if limit_to_extruder is not None and str(limit_to_extruder) != "-1" and str(limit_to_extruder) != str(self._position):
+            if str(limit_to_extruder) in self._global_stack._extruders:
+                result = self._global_stack._extruders[str(limit_to_extruder)].getProperty(key, property_name)
+                if result is not None:
+                    return result
+
+        return self._getStackProperty(key, property_name)
+
+    ##  Like ContainerStack.getProperty: the property from this stack, or from
+    #   the global stack if this stack doesn't have the setting, evaluated with
+    #   this stack as the context.
+    def _getStackProperty(self, key, property_name):
+        return self._evaluate(key, property_name, self.getRawProperty(key, property_name))
+
+    ##  Evaluate a formula with this stack as the context, like Uranium's
+    #   SettingFunction.
+    def _evaluate(self, key, property_name, value):
+        if not isinstance(value, _Formula):
+            return value
+        if (key, property_name) in self._evaluating:
+            raise ValueError("The {0} of setting {1} depends on itself.".format(property_name, key))
+
+        self._evaluating.add((key, property_name))
+        try:
+            namespace = {"math": math, "extruderValue": self._extruderValue, "extruderValues": self._extruderValues, "resolveOrValue": self._resolveOrValue}
+            for used_key in value.used_keys:
+                used_value = self.getProperty(used_key, "value")
+                if used_value is not None:
+                    namespace[used_key] = used_value
+            try:
+                return eval(value.code, namespace)
+            except Exception as e:
+                raise ValueError("Unable to evaluate the {0} of setting {1}, '{2}': {3}".format(property_name, key, value.expression, e)) from e
+        finally:
+            self._evaluating.remove((key, property_name))
+
+    def _getGlobalStack(self):
+        return self._global_stack if self._global_stack is not None else self
+
+    ##  Like ExtruderManager.getExtruderValue.
+    def _extruderValue(self, extruder_position, key):
+        extruder = self._getGlobalStack()._extruders.get(str(extruder_position))
+        if extruder is None:
+            return self._getGlobalStack().getProperty(key, "value")
+        return extruder._evaluate(key, "value", extruder.getRawProperty(key, "value"))
+
+    ##  Like ExtruderManager.getExtruderValues.
+    def _extruderValues(self, key):
+        global_stack = self._getGlobalStack()
+        extruder_count = global_stack.getProperty("machine_extruder_count", "value")
+        result = []
+        for position, extruder in sorted(global_stack._extruders.items(), key = lambda item: int(item[0])):
+            if int(position) >= extruder_count:
+                continue
+            value = extruder.getRawProperty(key, "value")
+            if value is None:
+                continue
+            result.append(extruder._evaluate(key, "value", value))
+        if not result:
+            result.append(global_stack.getProperty(key, "value"))
+        return result
+
+    ##  Like ExtruderManager.getResolveOrValue.
+    def _resolveOrValue(self, key):
+        return self._getGlobalStack().getProperty(key, "value")
+
+    ##  Convert a value from a profile to the type of its setting.
+    def _convertValue(self, key, value):
+        if not isinstance(value, str):
+            return value
+        if value.startswith("="):
+            return _Formula(value[1:])
+        setting_type = self.getRawProperty(key, "type")
+        try:
+            if setting_type == "float":
+                return float(value)
+            if setting_type == "int":
+                return int(value)
+            if setting_type == "bool":
+                return value.strip().lower() in ("true", "1", "yes")
+            if setting_type in ("polygon", "polygons", "[int]"):
+                return ast.literal_eval(value)
+        except (ValueError, SyntaxError) as e:
+            raise ValueError("Value '{0}' of setting {1} is not a valid {2}.".format(value, key, setting_type)) from e
+        return value
+
+
+##  The defaults of the properties that Cura adds to setting definitions, see
+#   CuraApplication.
+_property_defaults = {
+    "settable_per_mesh": True,
+    "settable_per_extruder": True,
+    "settable_per_meshgroup": True,
+    "settable_globally": True,
+    "limit_to_extruder": "-1",
+    "resolve": None
+}
@@ -0,0 +1,318 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import configparser
+import json
+import os
+import re
+import struct
+import subprocess
+import tempfile
+import time
+import urllib.parse
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+from cura.BatchSettingStack import BatchDefinition, BatchSettingStack
+from cura.SliceSettings import GCodeSettingKeys, GcodeStartEndFormatter, addComputedSettings
+
+
+##  A slice to do in a batch: a set of meshes with the settings to slice them
+#   with.
+class BatchJob:
+    ##  \param name Name of the job, used for the output files.
+    #   \param definition_id The machine definition to slice with.
+    #   \param mesh_files The STL files to slice.
+    #   \param global_settings Dictionary of setting keys to values, for all
+    #   extruders.
+    #   \param extruder_settings Dictionary of extruder positions to
+    #   dictionaries of setting values for that extruder.
+    def __init__(self, name, definition_id, mesh_files, global_settings = None, extruder_settings = None):
+        self.name = name
+        self.definition_id = definition_id
+        self.mesh_files = mesh_files
+        self.global_settings = global_settings if global_settings is not None else {}
+        self.extruder_settings = extruder_settings if extruder_settings is not None else {}
+
+
+##  Slices a batch of jobs without the user interface, by running a number of
+#   CuraEngine processes in parallel.
+#
+#   The engine is run in its command line mode. That mode only knows the
+#   default values of the definitions and can't evaluate setting formulas, so
+#   the value of every setting is evaluated here and passed to the engine, like
+#   StartSliceJob does for a slice in Cura. A formula that can't be evaluated
+#   makes adding the job fail.
+#
+#   For every job, the g-code is written to <name>.gcode in the output
+#   directory and the print time and material estimates to <name>.json.
+class BatchSlicer:
+    ##  \param engine_path Path to the CuraEngine executable.
+    #   \param resources_path Path to Cura's resources directory.
+    #   \param output_directory Directory to write the results to.
+    #   \param process_count Number of engines to run at the same time.
+    def __init__(self, engine_path, resources_path, output_directory, process_count = None):
+        self._engine_path = engine_path
+        self._resources_path = resources_path
+        self._output_directory = output_directory
+        self._process_count = process_count or os.cpu_count() or 1
+        self._jobs = []
+        self._temporary_directory = tempfile.TemporaryDirectory(prefix = "cura_batch_")
+
+    def getJobs(self):
+        return self._jobs
+
+    ##  Add a job to slice a mesh file with a profile.
+    #
+    #   \param mesh_file Path to an STL file.
+    #   \param definition_id The machine definition to slice with.
+    #   \param profile_files Paths to profiles (.inst.cfg files) to take setting
+    #   values from. Later profiles override earlier ones.
+    #   \param settings Dictionary of setting values that override the profiles.
+    #   \return \type{BatchJob} The new job.
+    def addMesh(self, mesh_file, definition_id = "fdmprinter", profile_files = (), settings = None):
+        profile_values = {}
+        for profile_file in profile_files:
+            with open(profile_file, encoding = "utf-8") as f:
+                profile_values.update(_readInstanceContainer(f.read())[1])
+
+        definition = self._getDefinition(definition_id)
+        global_stack = BatchSettingStack(definition, [settings or {}, profile_values])
+        for position, extruder_definition_id in definition.metadata.get("machine_extruder_trains", {}).items():
+            BatchSettingStack(self._getDefinition(extruder_definition_id), [], global_stack, int(position))
+
+        job = BatchJob(os.path.splitext(os.path.basename(mesh_file))[0], definition_id, [mesh_file])
+        _evaluateSettings(job, global_stack)
+        self._jobs.append(job)
+        return job
+
+    ##  Add a job to slice a Cura project file.
+    #
+    #   The meshes of the project are extracted to STL files, and the setting
+    #   values are taken from the machine and extruder stacks in the project.
+    #
+    #   \param project_file Path to a 3MF project file.
+    #   \param settings Dictionary of setting values that override the project.
+    #   \return \type{BatchJob} The new job.
+    def addProject(self, project_file, settings = None):
+        name = os.path.splitext(os.path.basename(project_file))[0]
+        with zipfile.ZipFile(project_file, "r") as archive:
+            file_names = archive.namelist()
+            containers = {}
+            stacks = []
+            for file_name in file_names:
+                if not file_name.startswith("Cura/") or not file_name.endswith(".cfg") or file_name == "Cura/preferences.cfg":
+                    continue
+                container_id = urllib.parse.unquote(os.path.basename(file_name).split(".")[0])
+                parser = configparser.ConfigParser(interpolation = None, empty_lines_in_values = False)
+                parser.read_string(archive.open(file_name).read().decode("utf-8"))
+                if parser.has_option("metadata", "type") and parser.get("metadata", "type") in ("machine", "extruder_train"):
+                    stacks.append(parser)
+                elif parser.has_section("values"):
+                    containers[container_id] = dict(parser.items("values"))
+
+            global_stacks = [stack for stack in stacks if stack.get("metadata", "type") == "machine"]
+            if len(global_stacks) != 1:
+                raise ValueError("{0} does not contain exactly one machine.".format(project_file))
+            global_container_ids = _getStackContainerIds(global_stacks[0])
+
+            global_stack = BatchSettingStack(self._getDefinition(global_container_ids[-1]), [settings or {}, _getStackValues(global_container_ids, containers)])
+            for stack in stacks:
+                if stack.get("metadata", "type") == "extruder_train":
+                    container_ids = _getStackContainerIds(stack)
+                    position = int(stack.get("metadata", "position", fallback = "0"))
+                    BatchSettingStack(self._getDefinition(container_ids[-1]), [_getStackValues(container_ids, containers)], global_stack, position)
+
+            job = BatchJob(name, global_container_ids[-1], [])
+            _evaluateSettings(job, global_stack)
+            job.mesh_files = self._extractMeshes(archive.open("3D/3dmodel.model").read(), name)
+
+        self._jobs.append(job)
+        return job
+
+    ##  Slice all jobs.
+    #
+    #   \param progress_callback Optional function that is called with each
+    #   result when its job is done.
+    #   \return \type{list} A dictionary with the result of each job.
+    def run(self, progress_callback = None):
+        try:
+            os.makedirs(self._output_directory, exist_ok = True)
+            with ThreadPoolExecutor(max_workers = self._process_count) as executor:
+                futures = [executor.submit(self._sliceJob, job) for job in self._jobs]
+                results = []
+                for future in futures:
+                    result = future.result()
+                    if progress_callback:
+                        progress_callback(result)
+                    results.append(result)
+        finally:
+            self._temporary_directory.cleanup()
+        return results
+
+    ##  Get the command to slice a job with.
+    def getEngineCommand(self, job, output_file):
+        definition_file = os.path.join(self._resources_path, "definitions", job.definition_id + ".def.json")
+        command = [self._engine_path, "slice", "-v", "-j", definition_file]
+        for key, value in sorted(job.global_settings.items()):
+            command += ["-s", "{0}={1}".format(key, value)]
+        for mesh_file in job.mesh_files:
+            command += ["-l", mesh_file]
+        for position, settings in sorted(job.extruder_settings.items()):
+            command.append("-e{0}".format(position))
+            for key, value in sorted(settings.items()):
+                command += ["-s", "{0}={1}".format(key, value)]
+        command += ["-o", output_file]
+        return command
+
+    def _sliceJob(self, job):
+        output_file = os.path.join(self._output_directory, job.name + ".gcode")
+        result = {"name": job.name, "gcode": output_file}
+
+        environment = dict(os.environ)
+        # Let the engine find the definitions that the machine definition inherits from, and its extruders.
+        environment["CURA_ENGINE_SEARCH_PATH"] = os.pathsep.join([os.path.join(self._resources_path, "definitions"), os.path.join(self._resources_path, "extruders")])
+
+        start_time = time.time()
+        try:
+            process = subprocess.run(self.getEngineCommand(job, output_file), stdout = subprocess.PIPE, stderr = subprocess.STDOUT, env = environment)
+        except OSError as e:
+            result["return_code"] = None
+            result["error"] = str(e)
+            return result
+        result["slice_time"] = time.time() - start_time
+        result["return_code"] = process.returncode
+
+        log = process.stdout.decode("utf-8", "replace")
+        result.update(_readEstimates(log, output_file))
+        if process.returncode != 0:
+            result["error"] = "\n".join(log.splitlines()[-20:])
+
+        with open(os.path.join(self._output_directory, job.name + ".json"), "w", encoding = "utf-8") as f:
+            json.dump(result, f, indent = 4, sort_keys = True)
+        return result
+
+    def _getDefinition(self, definition_id):
+        return BatchDefinition(definition_id, [os.path.join(self._resources_path, "definitions"), os.path.join(self._resources_path, "extruders")])
+
+    ##  Write the meshes of a 3MF model to STL files, with their
+    #   transformations applied.
+    #
+    #   \param model_data The contents of the 3dmodel.model file.
+    #   \param name Name of the job, to name the files after.
+    #   \return \type{list} The paths of the STL files.
+    def _extractMeshes(self, model_data, name):
+        namespace = {"3mf": "http://schemas.microsoft.com/3dmanufacturing/core/2015/02"}
+        root = ET.fromstring(model_data)
+        objects = {element.get("id"): element for element in root.iterfind("./3mf:resources/3mf:object", namespace)}
+
+        def getTriangles(object_id, transformation):
+            element = objects[object_id]
+            triangles = []
+            mesh = element.find("./3mf:mesh", namespace)
+            if mesh is not None:
+                vertices = numpy.array([[float(vertex.get(axis)) for axis in "xyz"] for vertex in mesh.iterfind("./3mf:vertices/3mf:vertex", namespace)], dtype = numpy.float64).reshape((-1, 3))
+                indices = numpy.array([[int(triangle.get(corner)) for corner in ("v1", "v2", "v3")] for triangle in mesh.iterfind("./3mf:triangles/3mf:triangle", namespace)], dtype = numpy.int32).reshape((-1, 3))
+                vertices = numpy.hstack([vertices, numpy.ones((len(vertices), 1))]).dot(transformation)[:, 0:3]
+                triangles.append(vertices[indices])
+            for component in element.iterfind("./3mf:components/3mf:component", namespace):
+                triangles.extend(getTriangles(component.get("objectid"), _parseTransformation(component.get("transform", "")).dot(transformation)))
+            return triangles
+
+        mesh_files = []
+        for index, item in enumerate(root.iterfind("./3mf:build/3mf:item", namespace)):
+            triangles = getTriangles(item.get("objectid"), _parseTransformation(item.get("transform", "")))
+            if not triangles:
+                continue
+            mesh_file = os.path.join(self._temporary_directory.name, "{0}_{1}.stl".format(name, index))
+            _writeBinaryStl(mesh_file, numpy.concatenate(triangles))
+            mesh_files.append(mesh_file)
+        return mesh_files
+
+
+##  Put the values of all settings in a job, like StartSliceJob puts them in
+#   the slice message.
+#
+#   \param job \type{BatchJob} The job to put the settings in.
+#   \param global_stack \type{BatchSettingStack} The stack to take the values
+#   from, with its extruder stacks.
+def _evaluateSettings(job, global_stack):
+    settings = {key: global_stack.getProperty(key, "value") for key in global_stack.getAllKeys()}
+    addComputedSettings(settings)
+    for key in GCodeSettingKeys:
+        if key in settings:
+            settings[key] = GcodeStartEndFormatter().format(str(settings[key]), **settings)
+    job.global_settings = settings
+
+    # Like in Cura, machines with one extruder only use the global stack.
+    job.extruder_settings = {}
+    if global_stack.getProperty("machine_extruder_count", "value") > 1:
+        for position, extruder_stack in global_stack.getExtruders().items():
+            job.extruder_settings[int(position)] = {key: extruder_stack.getProperty(key, "value") for key in extruder_stack.getAllKeys() if extruder_stack.getProperty(key, "settable_per_extruder")}
+
+
+##  Read the metadata type and setting values of an instance container file.
+def _readInstanceContainer(serialized):
+    parser = configparser.ConfigParser(interpolation = None, empty_lines_in_values = False)
+    parser.read_string(serialized)
+    container_type = parser.get("metadata", "type", fallback = None)
+    values = dict(parser.items("values")) if parser.has_section("values") else {}
+    return container_type, values
+
+
+##  Get the IDs of the containers of a stack file, from top to bottom.
+def _getStackContainerIds(parser):
+    if parser.has_section("containers"):
+        return [container_id for index, container_id in sorted(parser.items("containers"), key = lambda item: int(item[0]))]
+    return [container_id for container_id in parser.get("general", "containers", fallback = "").split(",") if container_id]
+
+
+##  Get the setting values of a stack. Containers higher in the stack override
+#   lower containers.
+def _getStackValues(container_ids, containers):
+    values = {}
+    for container_id in reversed(container_ids):
+        values.update(containers.get(container_id, {}))
+    return values
+
+
+##  Parse a 3MF transformation into a 4x4 matrix for row vectors.
+def _parseTransformation(transformation):
+    matrix = numpy.identity(4)
+    if transformation:
+        matrix[:, 0:3] = numpy.array([float(number) for number in transformation.split()], dtype = numpy.float64).reshape((4, 3))
+    return matrix
+
+
+##  Write an Nx3x3 array of triangle corners to a binary STL file.
+def _writeBinaryStl(path, triangles):
+    data = numpy.zeros(len(triangles), dtype = [("normal", "<f4", (3, )), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")])
+    data["vertices"] = triangles
+    with open(path, "wb") as f:
+        f.write(b"\0" * 80)
+        f.write(struct.pack("<I", len(triangles)))
+        f.write(data.tobytes())
+
+
+##  Find the print time and material estimates in the output of the engine or
+#   in the header of the g-code it wrote.
+def _readEstimates(log, gcode_file):
+    estimates = {}
+    patterns = {
+        "print_time": r"^(?:Print time(?: \(s\))?:|;TIME:)\s*([0-9.]+)",
+        "filament_amount": r"^(?:Filament(?: \(mm\^3\))?:|;Filament used:)\s*([0-9.]+)"
+    }
+    header = ""
+    try:
+        with open(gcode_file, encoding = "utf-8", errors = "replace") as f:
+            header = "".join(line for _, line in zip(range(50), f))
+    except OSError:
+        pass
+    for key, pattern in patterns.items():
+        match = re.search(pattern, log + "\n" + header, re.MULTILINE)
+        if match:
+            estimates[key] = float(match.group(1))
+    return estimates
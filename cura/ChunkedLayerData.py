@@ -0,0 +1,220 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from .LayerData import LayerData
+from .LayerDataBuilder import LayerDataBuilder
+from .LayerPolygon import LayerPolygon
+from .LayerStatistics import LayerStatistics
+
+import math
+import numpy
+
+
+##  Layer data that is split up in chunks of consecutive layers, each with its
+#   own mesh.
+#
+#   Layers can be added and replaced after creation. Only the chunks that
+#   contain changed layers are rebuilt when calling update(), so the meshes of
+#   the other chunks (and their buffers on the GPU) can be reused.
+#   The chunks themselves are immutable LayerData objects. Changes are only
+#   visible to readers after update(), so the layer data can be extended from
+#   a job while it is being rendered.
+#   The statistics of the layers are updated as soon as a layer is set.
+class ChunkedLayerData(LayerData):
+    ##  Number of layers that are combined in a single chunk by default.
+    DefaultLayersPerChunk = 50
+
+    ##  Width in radians of the ranges of directions within which consecutive
+    #   lines are merged in the decimated chunks.
+    DecimationAngle = math.radians(2)
+
+    ##  For each line type, whether it is left out of the decimated chunks.
+    _is_travel_type = numpy.zeros(LayerPolygon.SupportInterfaceType + 1, dtype = bool)
+    _is_travel_type[[LayerPolygon.NoneType, LayerPolygon.MoveCombingType, LayerPolygon.MoveRetractionType]] = True
+
+    ##  Creates empty chunked layer data.
+    #
+    #   \param material_color_map: [r, g, b, a] for each extruder row.
+    #   \param line_type_brightness: compatibility layer view uses line type brightness of 0.5
+    #   \param layers_per_chunk: The number of consecutive layers that share a mesh.
+    #   \param storage: \type{LayerDataStorage} Optional storage that keeps the
+    #   arrays of the layers within a memory budget.
+    #   \param decimate: Whether to also build a decimated version of each
+    #   chunk, see getDecimatedChunks().
+    def __init__(self, material_color_map, line_type_brightness = 1.0, layers_per_chunk = DefaultLayersPerChunk, storage = None, decimate = False):
+        super().__init__(layers = {}, element_counts = {})
+        self._material_color_map = material_color_map
+        self._line_type_brightness = line_type_brightness
+        self._layers_per_chunk = layers_per_chunk
+        self._storage = storage
+        self._decimate = decimate
+
+        self._new_layers = {}  # All layers, including the ones that are not yet built.
+        self._dirty_chunks = set()  # Indices of chunks that contain changed layers.
+        self._chunks = {}  # Chunk index -> LayerData
+        self._sorted_chunks = []
+        self._decimated_chunks = {}  # Chunk index -> LayerData with fewer lines.
+        self._sorted_decimated_chunks = []
+        self._statistics = LayerStatistics()  # Updated as layers are set, so it is built while the layers are processed.
+
+    ##  Adds a layer or replaces the layer with the same number.
+    #
+    #   \param layer_number The number of the layer.
+    #   \param layer \type{Layer} The layer with its polygons.
+    def setLayer(self, layer_number, layer):
+        old_layer = self._new_layers.get(layer_number)
+        if old_layer is layer:
+            return
+        if old_layer is not None and self._storage:
+            self._storage.removeLayer(old_layer)
+        self._new_layers[layer_number] = layer
+        self._dirty_chunks.add(layer_number // self._layers_per_chunk)
+        self._statistics.setLayer(layer_number, layer)  # Before the storage can move the arrays of the layer out of memory.
+        if self._storage:
+            self._storage.addLayer(layer)
+
+    ##  Removes a layer, if it exists.
+    def removeLayer(self, layer_number):
+        if layer_number in self._new_layers:
+            layer = self._new_layers.pop(layer_number)
+            self._dirty_chunks.add(layer_number // self._layers_per_chunk)
+            self._statistics.removeLayer(layer_number)
+            if self._storage:
+                self._storage.removeLayer(layer)
+
+    ##  Removes all layers.
+    def clear(self):
+        for layer_number in list(self._new_layers.keys()):
+            self.removeLayer(layer_number)
+
+    ##  Whether there are changed layers that are not built yet.
+    def hasChanges(self):
+        return bool(self._dirty_chunks)
+
+    ##  Rebuilds the meshes of the chunks with changed layers.
+    def update(self):
+        if not self._dirty_chunks:
+            return
+
+        chunks = dict(self._chunks)
+        decimated_chunks = dict(self._decimated_chunks)
+        chunk_layers = {chunk_index: {} for chunk_index in self._dirty_chunks}
+        for layer_number, layer in self._new_layers.items():
+            chunk_index = layer_number // self._layers_per_chunk
+            if chunk_index in chunk_layers:
+                chunk_layers[chunk_index][layer_number] = layer
+        self._dirty_chunks = set()
+
+        for chunk_index, layers in chunk_layers.items():
+            if not layers:
+                chunks.pop(chunk_index, None)
+                decimated_chunks.pop(chunk_index, None)
+                continue
+            builder = LayerDataBuilder()
+            for layer_number, layer in layers.items():
+                builder.setLayer(layer_number, layer)
+            chunks[chunk_index] = builder.build(self._material_color_map, self._line_type_brightness)
+            if self._decimate:
+                decimated_chunks[chunk_index] = self._buildDecimatedChunk(chunks[chunk_index])
+
+        element_counts = {}
+        for chunk in chunks.values():
+            element_counts.update(chunk.getElementCounts())
+
+        # Replace instead of modify, so that readers in other threads always see a consistent state.
+        self._layers = dict(self._new_layers)
+        self._element_counts = element_counts
+        self._chunks = chunks
+        self._sorted_chunks = [chunks[chunk_index] for chunk_index in sorted(chunks)]
+        self._decimated_chunks = decimated_chunks
+        self._sorted_decimated_chunks = [decimated_chunks.get(chunk_index) for chunk_index in sorted(chunks)]
+
+        if self._storage:
+            self._storage.setMeshSize(self._getMeshSize(chunks, decimated_chunks))
+
+    ##  Get the number of bytes that the meshes of the chunks use.
+    def _getMeshSize(self, chunks, decimated_chunks):
+        mesh_size = 0
+        for chunk in chunks.values():
+            arrays = [chunk.getVertices(), chunk.getNormals(), chunk.getIndices(), chunk.getColors()]
+            arrays.extend(chunk.getAttribute(name)["value"] for name in chunk.attributeNames())
+            mesh_size += sum(array.nbytes for array in arrays if array is not None)
+        for decimated_chunk in decimated_chunks.values():
+            mesh_size += decimated_chunk.getIndices().nbytes  # The other arrays are shared with the chunk.
+        return mesh_size
+
+    ##  Get the lowest and highest layer number from the statistics, which are
+    #   kept up to date as layers are set.
+    def getLayerNumberRange(self):
+        return self._statistics.getLayerNumberRange()
+
+    def getChunks(self):
+        return self._sorted_chunks
+
+    ##  Get the decimated version of each chunk, in the same order as
+    #   getChunks().
+    #
+    #   A decimated chunk shares the vertices of its chunk, but it leaves out
+    #   the travel moves and draws runs of consecutive lines in nearly the
+    #   same direction as a single line. It is meant to draw layers far from
+    #   the current layer with less detail.
+    #
+    #   \return \type{list} A LayerData per chunk, or None for every chunk if
+    #   the layer data was created without decimation.
+    def getDecimatedChunks(self):
+        return self._sorted_decimated_chunks
+
+    ##  Build the decimated version of a chunk.
+    #
+    #   \param chunk \type{LayerData} The chunk to decimate.
+    #   \return \type{LayerData} A chunk with the same vertices and fewer lines.
+    def _buildDecimatedChunk(self, chunk):
+        vertices = chunk.getVertices()
+        line_types = chunk.getAttribute("line_types")["value"].astype(numpy.int32)
+        line_widths = chunk.getAttribute("line_dimensions")["value"][:, 0]
+        lines = chunk.getIndices().reshape((-1, 2))
+
+        layer_numbers = sorted(chunk.getElementCounts())
+        group_element_counts = chunk.getGroupElementCounts()
+        decimated_group_element_counts = numpy.zeros(group_element_counts.shape, dtype = numpy.int64)
+        decimated_lines = []
+        line_offset = 0
+        # The lines are sorted by group of line types and then by layer, see LayerData.
+        for group in range(group_element_counts.shape[0]):
+            for layer_position in range(len(layer_numbers)):
+                block_lines = lines[line_offset:line_offset + group_element_counts[group, layer_position] // 2]
+                line_offset += group_element_counts[group, layer_position] // 2
+
+                # Both ends of a line have the type of the line.
+                block_lines = block_lines[numpy.logical_not(self._is_travel_type[line_types[block_lines[:, 0]]])]
+                if len(block_lines) == 0:
+                    continue
+                starts = block_lines[:, 0]
+                ends = block_lines[:, 1]
+                directions = vertices[ends] - vertices[starts]
+                direction_bins = numpy.floor(numpy.arctan2(directions[:, 2], directions[:, 0]) / self.DecimationAngle)
+
+                # A line continues the previous line if it starts at its end vertex, which means it has the same type,
+                # and if it has the same width and about the same direction.
+                continues = (starts[1:] == ends[:-1]) & (direction_bins[1:] == direction_bins[:-1]) & (line_widths[starts[1:]] == line_widths[starts[:-1]])
+                run_starts = numpy.flatnonzero(numpy.concatenate(([True], numpy.logical_not(continues))))
+                run_ends = numpy.concatenate((run_starts[1:] - 1, [len(block_lines) - 1]))
+                decimated_lines.append(numpy.stack((starts[run_starts], ends[run_ends]), axis = 1))
+                decimated_group_element_counts[group, layer_position] = 2 * len(run_starts)
+
+        if decimated_lines:
+            indices = numpy.concatenate(decimated_lines).astype(numpy.int32).flatten()
+        else:
+            indices = numpy.empty(0, dtype = numpy.int32)
+        layer_element_counts = decimated_group_element_counts.sum(axis = 0)
+        element_counts = {layer_number: int(layer_element_counts[layer_position]) for layer_position, layer_number in enumerate(layer_numbers)}
+        attributes = {name: chunk.getAttribute(name) for name in chunk.attributeNames()}
+        return LayerData(vertices = vertices, normals = chunk.getNormals(), indices = indices, colors = chunk.getColors(),
+                         layers = chunk.getLayers(), element_counts = element_counts, attributes = attributes,
+                         group_element_counts = decimated_group_element_counts)
+
+    def loadLayers(self, layer_numbers):
+        if not self._storage:
+            return
+        layers = self._layers  # Could be replaced by update() in another thread.
+        self._storage.loadLayers([layers[layer_number] for layer_number in layer_numbers if layer_number in layers])
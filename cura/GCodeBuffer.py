@@ -0,0 +1,89 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import re
+
+
+##  The g-code of a slice, as a list of chunks as sent by the engine.
+#
+#   This can be used as the list of g-code strings of the scene. The chunks are
+#   kept as the UTF-8 encoded bytes that the engine sent, and are only decoded
+#   when they are read. Chunks that may contain placeholders such as
+#   {print_time} are recorded when they are added, so filling in the
+#   placeholders only needs to look at those chunks.
+class GCodeBuffer:
+    ##  \param chunks Optional g-code chunks to start with, as strings or
+    #   UTF-8 encoded bytes.
+    def __init__(self, chunks = ()):
+        self._chunks = []
+        self._may_have_tokens = []  # For each chunk, whether it contains a "{".
+        for chunk in chunks:
+            self.append(chunk)
+
+    ##  Add a chunk of g-code at the end.
+    #
+    #   \param chunk The g-code, as a string or UTF-8 encoded bytes.
+    def append(self, chunk):
+        chunk = self._encode(chunk)
+        self._chunks.append(chunk)
+        self._may_have_tokens.append(b"{" in chunk)
+
+    ##  Add a chunk of g-code before the chunk at an index. This is used to put
+    #   the g-code prefix in front.
+    def insert(self, index, chunk):
+        chunk = self._encode(chunk)
+        self._chunks.insert(index, chunk)
+        self._may_have_tokens.insert(index, b"{" in chunk)
+
+    ##  Get a copy of the buffer that can be changed without changing this one.
+    #   The chunks themselves are shared, since they are never changed in place.
+    def copy(self):
+        gcode_buffer = GCodeBuffer()
+        gcode_buffer._chunks = list(self._chunks)
+        gcode_buffer._may_have_tokens = list(self._may_have_tokens)
+        return gcode_buffer
+
+    ##  Get the indices of the chunks that may contain placeholders.
+    def getTokenChunkIndices(self):
+        return [index for index, may_have_tokens in enumerate(self._may_have_tokens) if may_have_tokens]
+
+    ##  Get the chunks as the UTF-8 encoded bytes they are stored as.
+    def getChunks(self):
+        return list(self._chunks)
+
+    ##  Replace placeholders in the g-code with their values.
+    #
+    #   All placeholders are replaced in a single pass over the chunks that
+    #   may contain them.
+    #
+    #   \param replacements Dictionary of placeholder names, without braces, to
+    #   the values to replace them with.
+    def replaceTokens(self, replacements):
+        if not replacements:
+            return
+        encoded_replacements = {key.encode("utf-8"): str(value).encode("utf-8") for key, value in replacements.items()}
+        pattern = re.compile(b"\\{(" + b"|".join(re.escape(key) for key in encoded_replacements) + b")\\}")
+        for index in self.getTokenChunkIndices():
+            self._chunks[index] = pattern.sub(lambda match: encoded_replacements[match.group(1)], self._chunks[index])
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield chunk.decode("utf-8", "replace")
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [chunk.decode("utf-8", "replace") for chunk in self._chunks[index]]
+        return self._chunks[index].decode("utf-8", "replace")
+
+    def __setitem__(self, index, chunk):
+        chunk = self._encode(chunk)
+        self._chunks[index] = chunk
+        self._may_have_tokens[index] = b"{" in chunk
+
+    def _encode(self, chunk):
+        if isinstance(chunk, str):
+            return chunk.encode("utf-8")
+        return bytes(chunk)
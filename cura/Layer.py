@@ -1,4 +1,7 @@
-from UM.Mesh.MeshBuilder import MeshBuilder
+from UM.Mesh.MeshData import MeshData
+
+from .LayerPolygon import LayerPolygon
+from .LayerPolygonBatch import LayerPolygonBatch
 
 import numpy
 
@@ -27,6 +30,78 @@ class Layer:
     def elementCount(self):
         return self._element_count
 
+    ##  Creates a layer from the path segments that the engine sent for it.
+    #
+    #   Instead of decoding every path segment separately, the buffers of all
+    #   path segments are joined and decoded at once. All path segments end up
+    #   in a single LayerPolygonBatch.
+    #
+    #   \param layer_id The number of the layer.
+    #   \param height The Z position of the layer, in micrometers.
+    #   \param thickness The thickness of the layer, in micrometers.
+    #   \param segments List of (extruder, point_type, points, line_type,
+    #   line_width) tuples, one for each path segment. The last three are the
+    #   raw bytes of the PathSegment message.
+    #   \return \type{Layer} The layer with the path segments as its polygons.
+    @classmethod
+    def fromPathSegments(cls, layer_id, height, thickness, segments):
+        layer = cls(layer_id)
+        layer.setHeight(height)
+        if not segments:
+            return layer
+
+        segment_count = len(segments)
+        extruders = numpy.fromiter((segment[0] for segment in segments), dtype = numpy.int32, count = segment_count)
+        dimensions = numpy.fromiter((2 if segment[1] == 0 else 3 for segment in segments), dtype = numpy.int32, count = segment_count)  # Point2D or Point3D
+        point_counts = numpy.fromiter((len(segment[2]) for segment in segments), dtype = numpy.int32, count = segment_count) // (4 * dimensions)
+        line_counts = numpy.maximum(point_counts - 1, 0)  # A path segment without points has no lines either.
+
+        # Convert the joined bytearrays to numpy arrays. Joining bytearrays gives a writable copy.
+        coordinates = numpy.frombuffer(bytearray().join(segment[2] for segment in segments), dtype = "f4")
+        line_types = numpy.frombuffer(bytearray().join(segment[3] for segment in segments), dtype = "u1")
+        line_widths = numpy.frombuffer(bytearray().join(segment[4] for segment in segments), dtype = "f4")
+
+        # The line types and widths may be given once for the whole path segment.
+        line_types = cls._expandPerLine(line_types, segments, 3, line_counts).reshape((-1, 1))
+        line_widths = cls._expandPerLine(line_widths, segments, 4, line_counts).reshape((-1, 1))
+
+        # In the future, line_thicknesses should be given by CuraEngine as well.
+        # Currently the infill layer thickness also translates to line width
+        line_thicknesses = numpy.empty(line_widths.shape, dtype = "f4")
+        line_thicknesses[:] = thickness / 1000  # from micrometer to millimeter
+
+        # Find where the coordinates of each point start and fill in the 3D points from there.
+        point_dimensions = numpy.repeat(dimensions, point_counts)
+        point_starts = numpy.cumsum(point_dimensions) - point_dimensions
+        points = numpy.empty((len(point_starts), 3), numpy.float32)
+        points[:, 0] = coordinates[point_starts]
+        points[:, 2] = -coordinates[point_starts + 1]
+        points[:, 1] = height / 1000  # layer height value is in backend representation
+        is_3d = point_dimensions == 3
+        points[is_3d, 1] = coordinates[point_starts[is_3d] + 2]
+
+        point_offsets = numpy.concatenate(([0], numpy.cumsum(point_counts)))
+        polygons = LayerPolygonBatch(extruders, line_types, points, line_widths, line_thicknesses, point_offsets)
+        polygons.buildCache()
+        layer.polygons.append(polygons)
+        return layer
+
+    ##  Repeats the values of path segments that have a single value for all
+    #   their lines, so that there is a value for every line.
+    #
+    #   \param values The joined values of all path segments.
+    #   \param segments The path segment tuples the values came from.
+    #   \param field The index of the values in the path segment tuples.
+    #   \param line_counts The number of lines in each path segment.
+    @staticmethod
+    def _expandPerLine(values, segments, field, line_counts):
+        if len(values) == numpy.sum(line_counts):
+            return values
+        item_size = values.itemsize
+        value_counts = numpy.fromiter((len(segment[field]) // item_size for segment in segments), dtype = numpy.int32, count = len(segments))
+        repeats = numpy.where(value_counts == 1, line_counts, 1)
+        return numpy.repeat(values, numpy.repeat(repeats, value_counts))
+
     def setHeight(self, height):
         self._height = height
 
@@ -47,12 +122,12 @@ class Layer:
 
         return result
 
-    def build(self, vertex_offset, index_offset, vertices, colors, line_dimensions, extruders, line_types, indices):
+    def build(self, vertex_offset, index_offset, vertices, line_dimensions, extruders, line_types, indices):
         result_vertex_offset = vertex_offset
         result_index_offset = index_offset
         self._element_count = 0
         for polygon in self._polygons:
-            polygon.build(result_vertex_offset, result_index_offset, vertices, colors, line_dimensions, extruders, line_types, indices)
+            polygon.build(result_vertex_offset, result_index_offset, vertices, line_dimensions, extruders, line_types, indices)
             result_vertex_offset += polygon.lineMeshVertexCount()
             result_index_offset += polygon.lineMeshElementCount()
             self._element_count += polygon.elementCount
@@ -68,49 +143,95 @@ class Layer:
     # Defines the two triplets of local point indices to use to draw the two faces for each line segment in createMeshOrJump
     __index_pattern = numpy.array([[0, 3, 2, 0, 1, 3]], dtype = numpy.int32 )
 
+    ##  Creates a mesh of the lines of this layer, or of its travel moves.
+    #
+    #   The lines of all polygons are gathered first, and the vertices,
+    #   indices and colours of the whole layer are then computed at once into
+    #   arrays of exactly the right size.
+    #
+    #   \param make_mesh True to draw the printed lines, or False to draw the
+    #   travel moves.
+    #   \return \type{MeshData} Two faces per line, with colours by line type.
     def createMeshOrJumps(self, make_mesh):
-        builder = MeshBuilder()
-        
-        line_count = 0
-        if make_mesh:
-            for polygon in self._polygons:
-                line_count += polygon.meshLineCount
-        else:
-            for polygon in self._polygons:
-                line_count += polygon.jumpCount
-
-        # Reserve the neccesary space for the data upfront
-        builder.reserveFaceAndVertexCount(2 * line_count, 4 * line_count)
-        
+        line_points = []
+        line_types = []
+        line_widths = []
         for polygon in self._polygons:
             # Filter out the types of lines we are not interesed in depending on whether we are drawing the mesh or the jumps.
-            index_mask = numpy.logical_not(polygon.jumpMask) if make_mesh else polygon.jumpMask
-
-            # Create an array with rows [p p+1] and only keep those we whant to draw based on make_mesh
-            points = numpy.concatenate((polygon.data[:-1], polygon.data[1:]), 1)[index_mask.ravel()]
-            # Line types of the points we want to draw
-            line_types = polygon.types[index_mask]
-            
-            # Shift the z-axis according to previous implementation.
+            index_mask = polygon.jumpMask.ravel()
             if make_mesh:
-                points[polygon.isInfillOrSkinType(line_types), 1::3] -= 0.01
-            else:
-                points[:, 1::3] += 0.01
-
-            # Create an array with normals and tile 2 copies to match size of points variable
-            normals = numpy.tile( polygon.getNormals()[index_mask.ravel()], (1, 2))
-
-            # Scale all normals by the line width of the current line so we can easily offset.
-            normals *= (polygon.lineWidths[index_mask.ravel()] / 2)
-
-            # Create 4 points to draw each line segment, points +- normals results in 2 points each.
-            # After this we reshape to one point per line.
-            f_points = numpy.concatenate((points-normals, points+normals), 1).reshape((-1, 3))
+                index_mask = numpy.logical_not(index_mask)
+            line_points.append(polygon.getLinePoints()[index_mask])  # Rows [x1 y1 z1 x2 y2 z2].
+            line_types.append(polygon.types.ravel()[index_mask])
+            line_widths.append(polygon.lineWidths.ravel()[index_mask])
+
+        if len(self._polygons) == 1:
+            points, line_types, line_widths = line_points[0], line_types[0], line_widths[0]
+        elif self._polygons:
+            points, line_types, line_widths = numpy.concatenate(line_points), numpy.concatenate(line_types), numpy.concatenate(line_widths)
+        else:
+            points, line_types, line_widths = numpy.empty((0, 6), numpy.float32), numpy.empty(0, numpy.uint8), numpy.empty(0, numpy.float32)
+        line_count = len(points)
 
-            # __index_pattern defines which points to use to draw the two faces for each lines egment, the following linesegment is offset by 4
-            f_indices = ( self.__index_pattern + numpy.arange(0, 4 * len(normals), 4, dtype=numpy.int32).reshape((-1, 1)) ).reshape((-1, 3))
-            f_colors = numpy.repeat(polygon.mapLineTypeToColor(line_types), 4, 0)
+        # Shift the z-axis according to previous implementation.
+        if make_mesh:
+            if line_count:
+                points[self._polygons[0].isInfillOrSkinType(line_types), 1::3] -= 0.01
+        else:
+            points[:, 1::3] += 0.01
+
+        # The 2D normal of each line, scaled by half the line width: the line direction rotated a quarter turn.
+        delta_x = points[:, 3] - points[:, 0]
+        delta_z = points[:, 5] - points[:, 2]
+        with numpy.errstate(divide = "ignore", invalid = "ignore"):
+            scale = (line_widths / 2) / numpy.sqrt(delta_x ** 2 + delta_z ** 2)
+        offsets = numpy.zeros((line_count, 3), dtype = numpy.float32)
+        offsets[:, 0] = -delta_z * scale
+        offsets[:, 2] = delta_x * scale
+
+        # Four points to draw each line segment: both ends minus the normal, then both ends plus the normal.
+        vertices = numpy.empty((line_count, 4, 3), dtype = numpy.float32)
+        numpy.subtract(points[:, 0:3], offsets, out = vertices[:, 0])
+        numpy.subtract(points[:, 3:6], offsets, out = vertices[:, 1])
+        numpy.add(points[:, 0:3], offsets, out = vertices[:, 2])
+        numpy.add(points[:, 3:6], offsets, out = vertices[:, 3])
+
+        # __index_pattern defines which points to use to draw the two faces for each line segment, the following line segment is offset by 4
+        indices = (self.__index_pattern + numpy.arange(0, 4 * line_count, 4, dtype = numpy.int32).reshape((-1, 1))).reshape((-1, 3))
+
+        colors = numpy.empty((line_count, 4, 4), dtype = numpy.float32)
+        colors[:] = LayerPolygon.getColorMap()[line_types][:, numpy.newaxis, :]
+
+        return MeshData(vertices = vertices.reshape((-1, 3)), indices = indices, colors = colors.reshape((-1, 4)))
+
+    ##  Joins the meshes of several layers into one mesh.
+    #
+    #   \param meshes The meshes to join, as made by createMesh().
+    #   \param color_factors Optional factor for the colours of each mesh, each
+    #   an array that can be multiplied with an array of RGBA rows.
+    #   \return \type{MeshData} The joined mesh.
+    @staticmethod
+    def joinMeshes(meshes, color_factors = None):
+        if not meshes:
+            return MeshData()
+        vertex_count = sum(len(mesh.getVertices()) for mesh in meshes)
+        index_count = sum(len(mesh.getIndices()) for mesh in meshes)
+        vertices = numpy.empty((vertex_count, 3), dtype = numpy.float32)
+        indices = numpy.empty((index_count, 3), dtype = numpy.int32)
+        colors = numpy.empty((vertex_count, 4), dtype = numpy.float32)
+
+        vertex_offset = 0
+        index_offset = 0
+        for mesh_number, mesh in enumerate(meshes):
+            vertex_end = vertex_offset + len(mesh.getVertices())
+            index_end = index_offset + len(mesh.getIndices())
+            vertices[vertex_offset:vertex_end] = mesh.getVertices()
+            numpy.add(mesh.getIndices(), vertex_offset, out = indices[index_offset:index_end], casting = "unsafe")
+            if color_factors is not None:
+                numpy.multiply(mesh.getColors(), color_factors[mesh_number], out = colors[vertex_offset:vertex_end], casting = "unsafe")
+            else:
+                colors[vertex_offset:vertex_end] = mesh.getColors()
+            vertex_offset = vertex_end
+            index_offset = index_end
 
-            builder.addFacesWithColor(f_points, f_indices, f_colors)
-        
-        return builder.build()
\ No newline at end of file
+        return MeshData(vertices = vertices, indices = indices, colors = colors)
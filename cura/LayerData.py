@@ -2,16 +2,50 @@
 # Cura is released under the terms of the AGPLv3 or higher.
 from UM.Mesh.MeshData import MeshData
 
+from .LayerPolygon import LayerPolygon
+from .LayerStatistics import LayerStatistics
+
+import numpy
+
 
 ##  Class to holds the layer mesh and information about the layers.
 # Immutable, use LayerDataBuilder to create one of these.
+#
+#   The lines can be sorted by group of line types first and by layer second,
+#   so the lines of any range of layers in any group are a single range of
+#   elements. The layer view can then draw only the groups that are shown.
 class LayerData(MeshData):
+    ##  The groups of line types that the layer view can show or hide.
+    AlwaysShownGroup = 0
+    SkinGroup = 1  # Walls and skin.
+    InfillGroup = 2
+    HelperGroup = 3  # Support, skirt and brim.
+    TravelGroup = 4
+    LineTypeGroupCount = 5
+
+    ##  The group of each line type.
+    LineTypeGroups = numpy.empty(LayerPolygon.SupportInterfaceType + 1, dtype = numpy.int32)
+    LineTypeGroups[[LayerPolygon.NoneType]] = AlwaysShownGroup
+    LineTypeGroups[[LayerPolygon.Inset0Type, LayerPolygon.InsetXType, LayerPolygon.SkinType]] = SkinGroup
+    LineTypeGroups[[LayerPolygon.InfillType]] = InfillGroup
+    LineTypeGroups[[LayerPolygon.SupportType, LayerPolygon.SkirtType, LayerPolygon.SupportInfillType, LayerPolygon.SupportInterfaceType]] = HelperGroup
+    LineTypeGroups[[LayerPolygon.MoveCombingType, LayerPolygon.MoveRetractionType]] = TravelGroup
+
+    ##  \param group_element_counts Optional array with a row per line type
+    #   group and a column per layer, in order of the layer numbers, holding
+    #   the number of elements of the lines of that group in that layer. Only
+    #   given if the lines are sorted by group and then by layer.
     def __init__(self, vertices = None, normals = None, indices = None, colors = None, uvs = None, file_name = None,
-                 center_position = None, layers=None, element_counts=None, attributes=None):
+                 center_position = None, layers=None, element_counts=None, attributes=None, group_element_counts = None):
         super().__init__(vertices=vertices, normals=normals, indices=indices, colors=colors, uvs=uvs,
                          file_name=file_name, center_position=center_position, attributes=attributes)
         self._layers = layers
         self._element_counts = element_counts
+        self._group_element_counts = group_element_counts
+        self._layer_numbers = None  # The sorted layer numbers, once the element offsets are needed.
+        self._group_element_offsets = None  # The first element of each group and layer, once needed.
+        self._statistics = None  # LayerStatistics of the layers, once needed.
+        self._layer_number_range = None  # (minimum, maximum) layer number, once needed.
 
     def getLayer(self, layer):
         if layer in self._layers:
@@ -24,3 +58,91 @@ class LayerData(MeshData):
 
     def getElementCounts(self):
         return self._element_counts
+
+    ##  Get the number of elements of each group of line types in each layer.
+    #
+    #   \return Array with a row per line type group and a column per layer,
+    #   in order of the layer numbers. If the lines are not sorted by group,
+    #   all of them are counted as AlwaysShownGroup.
+    def getGroupElementCounts(self):
+        if self._group_element_counts is None:
+            layer_numbers = sorted(self._element_counts)
+            group_element_counts = numpy.zeros((self.LineTypeGroupCount, len(layer_numbers)), dtype = numpy.int64)
+            group_element_counts[self.AlwaysShownGroup] = [self._element_counts[layer_number] for layer_number in layer_numbers]
+            self._group_element_counts = group_element_counts
+        return self._group_element_counts
+
+    ##  Get the ranges of elements to draw to show some layers.
+    #
+    #   \param minimum_layer The lowest layer number to show.
+    #   \param maximum_layer The highest layer number to show.
+    #   \param groups The line type groups to show.
+    #   \return \type{list} (start, end) tuples with the ranges of elements to
+    #   draw. Adjacent ranges are joined.
+    def getElementRanges(self, minimum_layer, maximum_layer, groups):
+        if self._group_element_offsets is None:
+            # Prefix sums over the groups and layers, so any range can be looked up without going through all layers.
+            group_element_counts = self.getGroupElementCounts()
+            self._layer_numbers = numpy.array(sorted(self._element_counts), dtype = numpy.int64)
+            self._group_element_offsets = numpy.concatenate(([0], numpy.cumsum(group_element_counts.ravel())))
+
+        layer_count = len(self._layer_numbers)
+        first = int(numpy.searchsorted(self._layer_numbers, minimum_layer, side = "left"))
+        last = int(numpy.searchsorted(self._layer_numbers, maximum_layer, side = "right"))
+        ranges = []
+        if first >= last:
+            return ranges
+        for group in sorted(groups):
+            start = int(self._group_element_offsets[group * layer_count + first])
+            end = int(self._group_element_offsets[group * layer_count + last])
+            if start >= end:
+                continue
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    ##  Get the lowest and highest layer number.
+    #
+    #   \return (minimum, maximum) tuple, or None if there are no layers.
+    def getLayerNumberRange(self):
+        if self._layer_number_range is None and self._layers:
+            self._layer_number_range = (min(self._layers), max(self._layers))
+        return self._layer_number_range
+
+    ##  Get the statistics of the layers, such as the extruded length and the
+    #   number of lines of each type per layer.
+    #
+    #   The layers of a plain LayerData are summarised on the first call, which
+    #   takes a while for large prints.
+    #
+    #   \return \type{LayerStatistics} The statistics, indexed by layer number.
+    def getStatistics(self):
+        if self._statistics is None:
+            statistics = LayerStatistics()
+            for layer_number, layer in self._layers.items():
+                statistics.setLayer(layer_number, layer)
+            self._statistics = statistics
+        return self._statistics
+
+    ##  Make sure the data of some layers is in memory, because they are about
+    #   to be used. All layers of a plain LayerData are always in memory.
+    #
+    #   \param layer_numbers The numbers of the layers that will be used.
+    def loadLayers(self, layer_numbers):
+        pass
+
+    ##  Get the meshes that together make up this layer data.
+    #
+    #   Each of them is a LayerData for a consecutive range of layers, sorted
+    #   from the lowest to the highest layers. A plain LayerData is a single
+    #   chunk containing all layers.
+    def getChunks(self):
+        return [self]
+
+    ##  Get a version of each chunk with less detail, in the same order as
+    #   getChunks(), or None for chunks that have no such version. A plain
+    #   LayerData has none.
+    def getDecimatedChunks(self):
+        return [None]
@@ -20,6 +20,12 @@ class LayerDataBuilder(MeshBuilder):
         if layer not in self._layers:
             self._layers[layer] = Layer(layer)
 
+    ##  Add a layer that is already filled with polygons.
+    #
+    #   This replaces any layer that was already known by this number.
+    def setLayer(self, layer, layer_object):
+        self._layers[layer] = layer_object
+
     def addPolygon(self, layer, polygon_type, data, line_width):
         if layer not in self._layers:
             self.addLayer(layer)
@@ -62,7 +68,6 @@ class LayerDataBuilder(MeshBuilder):
 
         vertices = numpy.empty((vertex_count, 3), numpy.float32)
         line_dimensions = numpy.empty((vertex_count, 2), numpy.float32)
-        colors = numpy.empty((vertex_count, 4), numpy.float32)
         indices = numpy.empty((index_count, 2), numpy.int32)
         extruders = numpy.empty((vertex_count), numpy.float32)
         line_types = numpy.empty((vertex_count), numpy.float32)
@@ -70,10 +75,14 @@ class LayerDataBuilder(MeshBuilder):
         vertex_offset = 0
         index_offset = 0
         for layer, data in sorted(self._layers.items()):
-            ( vertex_offset, index_offset ) = data.build( vertex_offset, index_offset, vertices, colors, line_dimensions, extruders, line_types, indices)
+            ( vertex_offset, index_offset ) = data.build( vertex_offset, index_offset, vertices, line_dimensions, extruders, line_types, indices)
             self._element_counts[layer] = data.elementCount
 
+        indices, group_element_counts = self._sortByLineTypeGroup(indices, line_types)
+
         self.addVertices(vertices)
+        # The colors only depend on the line types, so look them all up in one go.
+        colors = LayerPolygon.getColorMap().astype(numpy.float32)[line_types.astype(numpy.int32)]
         colors[:, 0:3] *= line_type_brightness
         self.addColors(colors)
         self.addIndices(indices.flatten())
@@ -113,4 +122,25 @@ class LayerDataBuilder(MeshBuilder):
         return LayerData(vertices=self.getVertices(), normals=self.getNormals(), indices=self.getIndices(),
                         colors=self.getColors(), uvs=self.getUVCoordinates(), file_name=self.getFileName(),
                         center_position=self.getCenterPosition(), layers=self._layers,
-                        element_counts=self._element_counts, attributes=attributes)
+                        element_counts=self._element_counts, attributes=attributes, group_element_counts=group_element_counts)
+
+    ##  Sort the lines by group of line types, and by layer within each group.
+    #
+    #   The lines keep their order within a layer of a group.
+    #
+    #   \param indices Array with the start and end vertex of each line, in
+    #   order of the layers.
+    #   \param line_types The line type of each vertex.
+    #   \return (indices, group_element_counts) tuple with the sorted indices
+    #   and the number of elements per group and layer, see LayerData.
+    def _sortByLineTypeGroup(self, indices, line_types):
+        layer_count = len(self._element_counts)
+        line_counts = [self._element_counts[layer] // 2 for layer in sorted(self._element_counts)]
+        line_layers = numpy.repeat(numpy.arange(layer_count), line_counts)
+        # The first vertex of a line has the type of the line.
+        line_groups = LayerData.LineTypeGroups[line_types[indices[:, 0]].astype(numpy.int32)]
+
+        keys = line_groups * layer_count + line_layers
+        indices = indices[numpy.argsort(keys, kind = "mergesort")]  # Merge sort is stable.
+        group_element_counts = 2 * numpy.bincount(keys, minlength = LayerData.LineTypeGroupCount * layer_count).reshape((LayerData.LineTypeGroupCount, layer_count))
+        return indices, group_element_counts
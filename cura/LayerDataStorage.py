@@ -0,0 +1,194 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from collections import OrderedDict
+import mmap
+import tempfile
+import threading
+import weakref
+
+import numpy
+
+from UM.Logger import Logger
+
+
+##  Keeps the arrays of the layers in layer data within a memory budget.
+#
+#   When the layers and the meshes built from them take more memory than the
+#   budget allows, the arrays of the layers that were used least recently are
+#   moved to a scratch file. They are replaced by arrays that are views on a
+#   mapping of that file, so they can still be read and changed, but the
+#   operating system pages them in only when they are used. Layers that are
+#   about to be used a lot, e.g. because they are shown in the layer view, can
+#   be loaded back into memory with loadLayers(), which gives them ordinary
+#   arrays again.
+#
+#   The meshes themselves can't be moved out of memory. They are counted
+#   towards the budget, so fewer layers stay in memory while the meshes are
+#   large.
+#
+#   The scratch file grows in segments, which are mapped once each. Every
+#   layer gets its own range in a segment the first time it is stored, and
+#   keeps it if it is stored again. The range becomes free for other layers
+#   once the layer is deleted.
+class LayerDataStorage:
+    ##  Size in bytes of the segments that the scratch file grows with.
+    SegmentSize = 64 * 1024 * 1024
+
+    ##  Alignment in bytes of the arrays in the scratch file.
+    Alignment = 16
+
+    ##  Creates storage for layers.
+    #
+    #   \param memory_budget The number of bytes that the arrays of the layers
+    #   and of the meshes built from them may use in memory.
+    def __init__(self, memory_budget):
+        self._memory_budget = memory_budget
+
+        self._lock = threading.Lock()
+        self._resident_layers = OrderedDict()  # Layer -> size in bytes, the least recently used layers first.
+        self._resident_size = 0
+        self._mesh_size = 0  # Bytes used by the meshes that are built from the layers.
+        self._stored_layers = weakref.WeakSet()  # Layers whose arrays are in the scratch file, also if they are not kept track of anymore.
+
+        self._scratch_file = None
+        self._scratch_size = 0
+        self._segments = []  # Mapping of each segment of the scratch file.
+        self._free_ranges = []  # Per segment, a sorted list of (offset, size) of the ranges that are not in use.
+        self._layer_ranges = weakref.WeakKeyDictionary()  # Layer -> (finalizer, (segment index, offset, size)) of its range in the scratch file.
+        self._released_ranges = []  # Ranges of deleted layers, to be added to the free ranges. Filled by the finalizers of the layers.
+
+    ##  Starts keeping track of the memory used by a layer.
+    #
+    #   This may move the arrays of other layers to the scratch file.
+    def addLayer(self, layer):
+        with self._lock:
+            if layer in self._resident_layers or layer in self._stored_layers:  # Could be stored before, when it was removed and added again.
+                return
+            self._addResidentLayer(layer)
+            self._enforceBudget()
+
+    ##  Stops keeping track of a layer, e.g. because it is replaced.
+    def removeLayer(self, layer):
+        with self._lock:
+            if layer in self._resident_layers:
+                self._resident_size -= self._resident_layers.pop(layer)
+
+    ##  Sets the number of bytes used by the meshes that are built from the
+    #   layers, which counts towards the budget.
+    #
+    #   This may move the arrays of layers to the scratch file.
+    def setMeshSize(self, mesh_size):
+        with self._lock:
+            self._mesh_size = mesh_size
+            self._enforceBudget()
+
+    ##  Makes sure the arrays of the specified layers are in memory.
+    #
+    #   Other layers may be moved to the scratch file to stay within the budget.
+    #   \param layers \type{list} The layers that are about to be used.
+    def loadLayers(self, layers):
+        with self._lock:
+            for layer in layers:
+                if layer in self._resident_layers:
+                    self._resident_layers.move_to_end(layer)
+                elif layer in self._stored_layers:
+                    self._stored_layers.remove(layer)
+                    for polygon in layer.polygons:
+                        polygon.setBuffers({name: numpy.array(buffer) for name, buffer in polygon.getBuffers().items()})
+                    self._addResidentLayer(layer)
+            self._enforceBudget()
+
+    ##  Whether the arrays of a layer are in memory.
+    def isLayerLoaded(self, layer):
+        return layer not in self._stored_layers
+
+    def _addResidentLayer(self, layer):
+        size = sum(buffer.nbytes for polygon in layer.polygons for buffer in polygon.getBuffers().values())
+        self._resident_layers[layer] = size
+        self._resident_size += size
+
+    ##  Moves the least recently used layers to the scratch file until the
+    #   layers and meshes in memory fit in the budget again.
+    def _enforceBudget(self):
+        while self._resident_size + self._mesh_size > self._memory_budget and len(self._resident_layers) > 1:
+            layer, size = self._resident_layers.popitem(last = False)
+            self._resident_size -= size
+            try:
+                self._storeLayer(layer)
+            except EnvironmentError:
+                Logger.logException("w", "Unable to move layer data to the scratch file.")
+                self._addResidentLayer(layer)
+                self._memory_budget = float("inf")  # Don't keep trying for every layer.
+                return
+            self._stored_layers.add(layer)
+
+    def _storeLayer(self, layer):
+        size = sum(self._getAlignedSize(buffer.nbytes) for polygon in layer.polygons for buffer in polygon.getBuffers().values())
+        if size == 0:  # Nothing to store.
+            return
+        if layer in self._layer_ranges and self._layer_ranges[layer][1][2] != size:
+            self._layer_ranges.pop(layer)[0]()  # The arrays were replaced by arrays of another size. Release the old range.
+        if layer not in self._layer_ranges:
+            layer_range = self._allocate(size)
+            self._layer_ranges[layer] = (weakref.finalize(layer, self._released_ranges.append, layer_range), layer_range)
+        segment_index, offset, _ = self._layer_ranges[layer][1]
+
+        segment = self._segments[segment_index]
+        for polygon in layer.polygons:
+            stored_buffers = {}
+            for name, buffer in polygon.getBuffers().items():
+                if buffer.size == 0:  # Nothing to store.
+                    stored_buffers[name] = buffer
+                    continue
+                stored_buffer = numpy.frombuffer(segment, dtype = buffer.dtype, count = buffer.size, offset = offset).reshape(buffer.shape)
+                stored_buffer[...] = buffer
+                stored_buffers[name] = stored_buffer
+                offset += self._getAlignedSize(buffer.nbytes)
+            polygon.setBuffers(stored_buffers)
+
+    ##  Finds a free range in the scratch file, adding a segment to the file
+    #   if there is none that is large enough.
+    #
+    #   \param size The size of the range in bytes.
+    #   \return \type{tuple} The index of the segment, the offset of the range
+    #   in the segment and its size.
+    def _allocate(self, size):
+        while self._released_ranges:
+            self._free(*self._released_ranges.pop())
+
+        for segment_index, free_ranges in enumerate(self._free_ranges):
+            for range_index, (offset, free_size) in enumerate(free_ranges):
+                if free_size >= size:
+                    if free_size == size:
+                        del free_ranges[range_index]
+                    else:
+                        free_ranges[range_index] = (offset + size, free_size - size)
+                    return segment_index, offset, size
+
+        if self._scratch_file is None:
+            self._scratch_file = tempfile.TemporaryFile(prefix = "cura_layers_")
+        segment_size = max(1, -(-size // self.SegmentSize)) * self.SegmentSize  # Layers larger than a segment get a larger segment of their own.
+        self._scratch_file.truncate(self._scratch_size + segment_size)
+        self._segments.append(mmap.mmap(self._scratch_file.fileno(), segment_size, access = mmap.ACCESS_WRITE, offset = self._scratch_size))
+        self._scratch_size += segment_size
+        self._free_ranges.append([(size, segment_size - size)] if size < segment_size else [])
+        return len(self._segments) - 1, 0, size
+
+    ##  Makes a range in the scratch file available again, merging it with
+    #   the free ranges next to it.
+    def _free(self, segment_index, offset, size):
+        free_ranges = self._free_ranges[segment_index]
+        range_index = 0
+        while range_index < len(free_ranges) and free_ranges[range_index][0] < offset:
+            range_index += 1
+        if range_index < len(free_ranges) and offset + size == free_ranges[range_index][0]:
+            size += free_ranges.pop(range_index)[1]
+        if range_index > 0 and free_ranges[range_index - 1][0] + free_ranges[range_index - 1][1] == offset:
+            range_index -= 1
+            offset, previous_size = free_ranges.pop(range_index)
+            size += previous_size
+        free_ranges.insert(range_index, (offset, size))
+
+    def _getAlignedSize(self, size):
+        return -(-size // self.Alignment) * self.Alignment
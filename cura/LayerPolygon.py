@@ -21,7 +21,20 @@ class LayerPolygon:
     __number_of_types = 11
 
     __jump_map = numpy.logical_or(numpy.logical_or(numpy.arange(__number_of_types) == NoneType, numpy.arange(__number_of_types) == MoveCombingType), numpy.arange(__number_of_types) == MoveRetractionType)
-    
+
+    # When type is used as index returns true if type == LayerPolygon.InfillType or type == LayerPolygon.SkinType or type == LayerPolygon.SupportInfillType
+    # Should be generated in better way, not hardcoded.
+    _isInfillOrSkinTypeMap = numpy.array([0, 0, 0, 1, 0, 0, 1, 1, 0, 0, 1], dtype=numpy.bool)
+
+    # The attributes that hold the arrays of a polygon, see getBuffers().
+    _buffer_names = ("_types", "_data", "_line_widths", "_line_thicknesses", "_jump_mask")
+
+    # There can be millions of polygons, so don't give each of them a __dict__.
+    __slots__ = ("_extruder", "_types", "_data", "_line_widths", "_line_thicknesses",
+                 "_vertex_begin", "_vertex_end", "_index_begin", "_index_end",
+                 "_jump_mask", "_jump_count", "_mesh_line_count", "_vertex_count",
+                 "_build_cache_line_mesh_mask", "_build_cache_needed_points")
+
     ##  LayerPolygon, used in ProcessSlicedLayersJob
     #   \param extruder
     #   \param line_types array with line_types
@@ -31,9 +44,7 @@ class LayerPolygon:
     def __init__(self, extruder, line_types, data, line_widths, line_thicknesses):
         self._extruder = extruder
         self._types = line_types
-        for i in range(len(self._types)):
-            if self._types[i] >= self.__number_of_types: #Got faulty line data from the engine.
-                self._types[i] = self.NoneType
+        self._types[self._types >= self.__number_of_types] = self.NoneType  # Got faulty line data from the engine.
         self._data = data
         self._line_widths = line_widths
         self._line_thicknesses = line_thicknesses
@@ -48,15 +59,9 @@ class LayerPolygon:
         self._mesh_line_count = len(self._types) - self._jump_count
         self._vertex_count = self._mesh_line_count + numpy.sum(self._types[1:] == self._types[:-1])
 
-        # Buffering the colors shouldn't be necessary as it is not 
-        # re-used and can save alot of memory usage.
-        self._color_map = LayerPolygon.getColorMap()
-        self._colors = self._color_map[self._types]
-        
-        # When type is used as index returns true if type == LayerPolygon.InfillType or type == LayerPolygon.SkinType or type == LayerPolygon.SupportInfillType
-        # Should be generated in better way, not hardcoded.
-        self._isInfillOrSkinTypeMap = numpy.array([0, 0, 0, 1, 0, 0, 1, 1, 0, 0, 1], dtype=numpy.bool)
-        
+        # The colors are not stored, they follow from the line types. The layer
+        # mesh gets its colors from the line types of all vertices at once.
+
         self._build_cache_line_mesh_mask = None
         self._build_cache_needed_points = None
         
@@ -82,12 +87,11 @@ class LayerPolygon:
     #   \param vertex_offset : determines where to start and end filling the arrays
     #   \param index_offset : determines where to start and end filling the arrays
     #   \param vertices : vertex numpy array to be filled
-    #   \param colors : vertex numpy array to be filled
     #   \param line_dimensions : vertex numpy array to be filled
     #   \param extruders : vertex numpy array to be filled
     #   \param line_types : vertex numpy array to be filled
     #   \param indices : index numpy array to be filled
-    def build(self, vertex_offset, index_offset, vertices, colors, line_dimensions, extruders, line_types, indices):
+    def build(self, vertex_offset, index_offset, vertices, line_dimensions, extruders, line_types, indices):
         if self._build_cache_line_mesh_mask is None or self._build_cache_needed_points is None:
             self.buildCache()
             
@@ -97,7 +101,7 @@ class LayerPolygon:
         # Index to the points we need to represent the line mesh. This is constructed by generating simple
         # start and end points for each line. For line segment n these are points n and n+1. Row n reads [n n+1] 
         # Then then the indices for the points we don't need are thrown away based on the pre-calculated list. 
-        index_list = ( numpy.arange(len(self._types)).reshape((-1, 1)) + numpy.array([[0, 1]]) ).reshape((-1, 1))[needed_points_list.reshape((-1, 1))]
+        index_list = ( self._getLineStartIndices().reshape((-1, 1)) + numpy.array([[0, 1]]) ).reshape((-1, 1))[needed_points_list.reshape((-1, 1))]
         
         # The relative values of begin and end indices have already been set in buildCache, so we only need to offset them to the parents offset.
         self._vertex_begin += vertex_offset
@@ -106,14 +110,11 @@ class LayerPolygon:
         # Points are picked based on the index list to get the vertices needed. 
         vertices[self._vertex_begin:self._vertex_end, :] = self._data[index_list, :]
 
-        # Create an array with colors for each vertex and remove the color data for the points that has been thrown away. 
-        colors[self._vertex_begin:self._vertex_end, :] = numpy.tile(self._colors, (1, 2)).reshape((-1, 4))[needed_points_list.ravel()]
-
         # Create an array with line widths for each vertex.
         line_dimensions[self._vertex_begin:self._vertex_end, 0] = numpy.tile(self._line_widths, (1, 2)).reshape((-1, 1))[needed_points_list.ravel()][:, 0]
         line_dimensions[self._vertex_begin:self._vertex_end, 1] = numpy.tile(self._line_thicknesses, (1, 2)).reshape((-1, 1))[needed_points_list.ravel()][:, 0]
 
-        extruders[self._vertex_begin:self._vertex_end] = self._extruder
+        extruders[self._vertex_begin:self._vertex_end] = self._getVertexExtruders(needed_points_list)
 
         # Convert type per vertex to type per line
         line_types[self._vertex_begin:self._vertex_end] = numpy.tile(self._types, (1, 2)).reshape((-1, 1))[needed_points_list.ravel()][:, 0]
@@ -132,11 +133,42 @@ class LayerPolygon:
         self._build_cache_line_mesh_mask = None
         self._build_cache_needed_points = None
 
+    ##  Get the index of the start point of each line segment in the data.
+    #   The end point of a line segment is the point after its start point.
+    def _getLineStartIndices(self):
+        return numpy.arange(len(self._types))
+
+    ##  Get the extruder of each vertex of the line mesh.
+    #
+    #   \param needed_points_list The points of each line segment that are in the line mesh.
+    def _getVertexExtruders(self, needed_points_list):
+        return self._extruder
+
+    ##  Get the arrays that hold the data of this polygon.
+    #
+    #   \return \type{dict} The arrays by the name of the attribute holding them.
+    def getBuffers(self):
+        return {name: getattr(self, name) for name in self._buffer_names}
+
+    ##  Replace the arrays that hold the data of this polygon, e.g. by arrays
+    #   that are stored on disk. The new arrays must hold the same data.
+    #
+    #   \param buffers \type{dict} The new arrays by the name of the attribute holding them.
+    def setBuffers(self, buffers):
+        for name, buffer in buffers.items():
+            setattr(self, name, buffer)
+
+    ##  Get the start and end points of each line segment.
+    #
+    #   \return Array with a row [x1 y1 z1 x2 y2 z2] for each line segment.
+    def getLinePoints(self):
+        return numpy.concatenate((self._data[:-1], self._data[1:]), 1)
+
     def getColors(self):
-        return self._colors
+        return self.mapLineTypeToColor(self._types)
 
     def mapLineTypeToColor(self, line_types):
-        return self._color_map[line_types]
+        return LayerPolygon.getColorMap()[line_types]
 
     def isInfillOrSkinType(self, line_types):
         return self._isInfillOrSkinTypeMap[line_types]
@@ -181,15 +213,12 @@ class LayerPolygon:
 
     # Calculate normals for the entire polygon using numpy.
     def getNormals(self):
-        normals = numpy.copy(self._data)
-        normals[:, 1] = 0.0 # We are only interested in 2D normals
-
-        # Calculate the edges between points.
-        # The call to numpy.roll shifts the entire array by one so that
-        # we end up subtracting each next point from the current, wrapping
-        # around. This gives us the edges from the next point to the current
+        # Calculate the edges between the start and end points of each line
+        # segment. This gives us the edges from the next point to the current
         # point.
-        normals = numpy.diff(normals, 1, 0)
+        line_points = self.getLinePoints()
+        normals = line_points[:, 3:6] - line_points[:, 0:3]
+        normals[:, 1] = 0.0 # We are only interested in 2D normals
 
         # Calculate the length of each edge using standard Pythagoras
         lengths = numpy.sqrt(normals[:, 0] ** 2 + normals[:, 2] ** 2)
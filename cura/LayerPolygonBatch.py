@@ -0,0 +1,63 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from .LayerPolygon import LayerPolygon
+
+import numpy
+
+
+##  All polygons of a layer, stored as one set of arrays.
+#
+#   Where a LayerPolygon holds a single path, this holds the paths of many
+#   polygons back to back, with an offset table telling where each polygon
+#   starts. It behaves like one big LayerPolygon to the Layer that holds it,
+#   but no lines are drawn between the end of one polygon and the start of
+#   the next. This saves a set of arrays and caches for every polygon, and
+#   builds the line mesh of the whole layer in one go.
+class LayerPolygonBatch(LayerPolygon):
+    __slots__ = ("_point_offsets", "_line_counts")
+
+    _buffer_names = LayerPolygon._buffer_names + ("_point_offsets", "_line_counts")
+
+    ##  Creates a batch of polygons.
+    #
+    #   \param extruders array with the extruder of each polygon
+    #   \param line_types array with line_types of all polygons
+    #   \param data the points of all polygons
+    #   \param line_widths array with line widths of all polygons
+    #   \param line_thicknesses array with line thicknesses of all polygons
+    #   \param point_offsets array with the index of the first point of each
+    #   polygon in data, followed by the total number of points.
+    def __init__(self, extruders, line_types, data, line_widths, line_thicknesses, point_offsets):
+        super().__init__(extruders, line_types, data, line_widths, line_thicknesses)
+        self._point_offsets = point_offsets
+        # Each polygon has one line less than it has points. A polygon without points has no lines either.
+        self._line_counts = numpy.maximum(numpy.diff(point_offsets) - 1, 0)
+
+    def buildCache(self):
+        super().buildCache()
+        # The first line of a polygon does not continue from the line before it, so it always needs its start point.
+        first_lines = self._getLineOffsets()[self._line_counts > 0]
+        self._build_cache_needed_points[first_lines, 0] = True
+        self._vertex_end = numpy.sum(self._build_cache_needed_points)
+
+    def _getLineStartIndices(self):
+        # The lines of a polygon start at consecutive points from the first point of the polygon.
+        return numpy.arange(len(self._types)) + numpy.repeat(self._point_offsets[:-1] - self._getLineOffsets(), self._line_counts)
+
+    ##  Get the index of the first line of each polygon.
+    def _getLineOffsets(self):
+        return numpy.cumsum(self._line_counts) - self._line_counts
+
+    def _getVertexExtruders(self, needed_points_list):
+        line_extruders = numpy.repeat(self._extruder, self._line_counts).reshape((-1, 1))
+        return numpy.tile(line_extruders, (1, 2)).reshape((-1, 1))[needed_points_list.ravel()][:, 0]
+
+    def getLinePoints(self):
+        start_indices = self._getLineStartIndices()
+        return numpy.concatenate((self._data[start_indices], self._data[start_indices + 1]), 1)
+
+    ##  The number of polygons in this batch.
+    @property
+    def polygonCount(self):
+        return len(self._line_counts)
@@ -0,0 +1,81 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from concurrent.futures import ProcessPoolExecutor
+import math
+import threading
+
+from UM.Logger import Logger
+
+from .Layer import Layer
+
+
+##  Converts the layers sent by the engine to Layer objects in a pool of
+#   worker processes.
+#
+#   The layers are described by plain tuples of numbers and bytes, which are
+#   sent to the workers in chunks of consecutive layers. The converted layers
+#   are sent back with their NumPy arrays.
+class LayerProcessingPool:
+    ##  The minimum number of layers to send to a worker at once. Smaller
+    #   chunks spend more time on communication than on conversion.
+    MinimumChunkSize = 8
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._process_count = 0
+
+    ##  Set the number of worker processes to use.
+    #
+    #   \param process_count The number of processes. 0 disables the pool.
+    def setProcessCount(self, process_count):
+        with self._lock:
+            if process_count == self._process_count:
+                return
+            self._shutdown()
+            self._process_count = process_count
+
+    ##  Whether the pool is enabled with at least one worker process.
+    def isEnabled(self):
+        return self._process_count > 0
+
+    ##  Starts converting layers in the worker processes.
+    #
+    #   \param layer_descriptions List of (layer_id, height, thickness,
+    #   segments) tuples, the arguments for Layer.fromPathSegments.
+    #   \return \type{list} Futures that each give a list of converted layers,
+    #   in the order of the layer descriptions.
+    def submit(self, layer_descriptions):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers = self._process_count)
+            executor = self._executor
+
+        # A few chunks per process, so a process that finishes early can pick up more work.
+        chunk_size = max(self.MinimumChunkSize, math.ceil(len(layer_descriptions) / (4 * self._process_count)))
+        return [executor.submit(_processLayers, layer_descriptions[start:start + chunk_size]) for start in range(0, len(layer_descriptions), chunk_size)]
+
+    ##  Stops the worker processes.
+    def close(self):
+        with self._lock:
+            self._shutdown()
+
+    def _shutdown(self):
+        if self._executor is not None:
+            Logger.log("d", "Stopping layer processing workers.")
+            self._executor.shutdown(wait = False)
+            self._executor = None
+
+    __instance = None
+
+    @classmethod
+    def getInstance(cls):
+        if cls.__instance is None:
+            cls.__instance = cls()
+        return cls.__instance
+
+
+##  Converts a chunk of layers. This runs in a worker process.
+def _processLayers(layer_descriptions):
+    return [Layer.fromPathSegments(*description) for description in layer_descriptions]
@@ -0,0 +1,218 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from .LayerPolygon import LayerPolygon
+
+import threading
+import numpy
+
+
+##  Summary of the lines of a single layer.
+class LayerSummary:
+    ##  For each line type, whether it is a travel move.
+    _is_travel_type = numpy.zeros(LayerPolygon.SupportInterfaceType + 1, dtype = bool)
+    _is_travel_type[[LayerPolygon.MoveCombingType, LayerPolygon.MoveRetractionType]] = True
+
+    ##  \param line_type_counts Array with the number of lines of each line type.
+    #   \param extruded_length The length of all lines that are not travel moves, in mm.
+    #   \param travel_distance The length of all travel moves, in mm.
+    #   \param retraction_count The number of travel moves with retraction.
+    #   \param bounding_box (minimum, maximum) tuple with the corners of the box
+    #   around all points, or None if the layer has no lines.
+    def __init__(self, line_type_counts, extruded_length, travel_distance, retraction_count, bounding_box):
+        self._line_type_counts = line_type_counts
+        self._extruded_length = extruded_length
+        self._travel_distance = travel_distance
+        self._retraction_count = retraction_count
+        self._bounding_box = bounding_box
+
+    ##  Summarise a layer.
+    #
+    #   \param layer \type{Layer} The layer with its polygons.
+    #   \return \type{LayerSummary} The summary of the layer.
+    @classmethod
+    def fromLayer(cls, layer):
+        line_type_counts = numpy.zeros(LayerPolygon.SupportInterfaceType + 1, dtype = numpy.int64)
+        extruded_length = 0.0
+        travel_distance = 0.0
+        retraction_count = 0
+        minimum = None
+        maximum = None
+        for polygon in layer.polygons:
+            line_types = numpy.asarray(polygon.types).ravel().astype(numpy.int32)
+            if len(line_types) == 0:
+                continue
+            line_points = polygon.getLinePoints()
+            lengths = numpy.linalg.norm(line_points[:, 3:6] - line_points[:, 0:3], axis = 1)
+            is_travel = cls._is_travel_type[line_types]
+
+            line_type_counts += numpy.bincount(line_types, minlength = len(line_type_counts))
+            extruded_length += float(numpy.sum(lengths[numpy.logical_not(is_travel)]))
+            travel_distance += float(numpy.sum(lengths[is_travel]))
+            # Consecutive retracted travel moves are a single retraction.
+            is_retraction = line_types == LayerPolygon.MoveRetractionType
+            retraction_count += int(numpy.sum(is_retraction[1:] & numpy.logical_not(is_retraction[:-1])) + is_retraction[0])
+
+            points = polygon.data
+            polygon_minimum = numpy.min(points, axis = 0)
+            polygon_maximum = numpy.max(points, axis = 0)
+            minimum = polygon_minimum if minimum is None else numpy.minimum(minimum, polygon_minimum)
+            maximum = polygon_maximum if maximum is None else numpy.maximum(maximum, polygon_maximum)
+
+        bounding_box = (minimum, maximum) if minimum is not None else None
+        return cls(line_type_counts, extruded_length, travel_distance, retraction_count, bounding_box)
+
+    def getSegmentCount(self):
+        return int(numpy.sum(self._line_type_counts))
+
+    ##  Get the number of lines of each line type, indexed by the line types
+    #   of LayerPolygon.
+    def getLineTypeCounts(self):
+        return self._line_type_counts
+
+    def getExtrudedLength(self):
+        return self._extruded_length
+
+    def getTravelDistance(self):
+        return self._travel_distance
+
+    def getRetractionCount(self):
+        return self._retraction_count
+
+    ##  Get the box around all points of the layer.
+    #
+    #   \return (minimum, maximum) tuple of [x, y, z] arrays, or None if the
+    #   layer has no lines.
+    def getBoundingBox(self):
+        return self._bounding_box
+
+    ##  Get a statistic by its name, one of LayerStatistics.Statistics.
+    def getStatistic(self, statistic):
+        if statistic == "segments":
+            return self.getSegmentCount()
+        if statistic == "extruded_length":
+            return self._extruded_length
+        if statistic == "travel_distance":
+            return self._travel_distance
+        if statistic == "retractions":
+            return self._retraction_count
+        raise KeyError("Unknown layer statistic {statistic}".format(statistic = statistic))
+
+
+##  Index of the statistics of all layers of a slice.
+#
+#   The layers are summarised when they are added, which happens while the
+#   layers are processed. The lowest and highest layer numbers and the layer
+#   with the highest value of each statistic are kept up to date as layers are
+#   added, so the layer view can look them up without going over all layers.
+#   Removing or replacing the layer with the highest value of a statistic
+#   makes the next query for that statistic go over all layers once.
+class LayerStatistics:
+    ##  The statistics that can be compared between layers.
+    Statistics = ("segments", "extruded_length", "travel_distance", "retractions")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._summaries = {}  # Layer number -> LayerSummary
+        self._min_layer_number = None
+        self._max_layer_number = None
+        self._layer_numbers_valid = True  # False if a layer was removed and the min and max need to be recalculated.
+        self._max_statistic_layers = {}  # Statistic -> layer number with the highest value. Missing if it needs to be recalculated.
+
+    ##  Add the summary of a layer, or replace the summary of the layer with
+    #   the same number.
+    #
+    #   \param layer_number The number of the layer.
+    #   \param layer \type{Layer} The layer with its polygons.
+    def setLayer(self, layer_number, layer):
+        self.setSummary(layer_number, LayerSummary.fromLayer(layer))
+
+    ##  Add an existing summary of a layer.
+    #
+    #   \param layer_number The number of the layer.
+    #   \param summary \type{LayerSummary} The summary of the layer.
+    def setSummary(self, layer_number, summary):
+        with self._lock:
+            old_summary = self._summaries.get(layer_number)
+            self._summaries[layer_number] = summary
+            if self._layer_numbers_valid:
+                if self._min_layer_number is None or layer_number < self._min_layer_number:
+                    self._min_layer_number = layer_number
+                if self._max_layer_number is None or layer_number > self._max_layer_number:
+                    self._max_layer_number = layer_number
+
+            for statistic in self.Statistics:
+                if len(self._summaries) == 1:
+                    self._max_statistic_layers[statistic] = layer_number
+                    continue
+                max_layer_number = self._max_statistic_layers.get(statistic)
+                if max_layer_number is None:
+                    continue  # Recalculated when it is asked for.
+                value = summary.getStatistic(statistic)
+                if max_layer_number == layer_number:
+                    if value < old_summary.getStatistic(statistic):
+                        # Another layer may have the highest value now.
+                        del self._max_statistic_layers[statistic]
+                elif value > self._summaries[max_layer_number].getStatistic(statistic):
+                    self._max_statistic_layers[statistic] = layer_number
+
+    ##  Removes the summary of a layer, if it exists.
+    def removeLayer(self, layer_number):
+        with self._lock:
+            if self._summaries.pop(layer_number, None) is None:
+                return
+            if layer_number in (self._min_layer_number, self._max_layer_number):
+                self._layer_numbers_valid = False
+            for statistic, max_layer_number in list(self._max_statistic_layers.items()):
+                if max_layer_number == layer_number:
+                    del self._max_statistic_layers[statistic]
+
+    def clear(self):
+        with self._lock:
+            self._summaries = {}
+            self._min_layer_number = None
+            self._max_layer_number = None
+            self._layer_numbers_valid = True
+            self._max_statistic_layers = {}
+
+    def getLayerCount(self):
+        with self._lock:
+            return len(self._summaries)
+
+    ##  Get the lowest and highest layer number.
+    #
+    #   \return (minimum, maximum) tuple, or None if there are no layers.
+    def getLayerNumberRange(self):
+        with self._lock:
+            self._updateLayerNumbers()
+            if self._min_layer_number is None:
+                return None
+            return self._min_layer_number, self._max_layer_number
+
+    ##  Get the summary of a layer.
+    #
+    #   \return \type{LayerSummary} The summary, or None if the layer is unknown.
+    def getSummary(self, layer_number):
+        with self._lock:
+            return self._summaries.get(layer_number)
+
+    ##  Get the layer with the highest value of a statistic.
+    #
+    #   \param statistic One of Statistics.
+    #   \return The layer number, or None if there are no layers.
+    def getLayerWithMost(self, statistic):
+        if statistic not in self.Statistics:
+            raise KeyError("Unknown layer statistic {statistic}".format(statistic = statistic))
+        with self._lock:
+            if statistic not in self._max_statistic_layers:
+                if not self._summaries:
+                    return None
+                self._max_statistic_layers[statistic] = max(self._summaries, key = lambda layer_number: self._summaries[layer_number].getStatistic(statistic))
+            return self._max_statistic_layers[statistic]
+
+    def _updateLayerNumbers(self):
+        if self._layer_numbers_valid:
+            return
+        self._min_layer_number = min(self._summaries) if self._summaries else None
+        self._max_layer_number = max(self._summaries) if self._summaries else None
+        self._layer_numbers_valid = True
@@ -23,6 +23,7 @@ import UM.FlameProfiler
 from cura.QualityManager import QualityManager
 from cura.PrinterOutputDevice import PrinterOutputDevice
 from cura.Settings.ExtruderManager import ExtruderManager
+from cura.Settings.ValidationStateIndex import ValidationStateIndex
 
 from .CuraStackBuilder import CuraStackBuilder
 
@@ -366,10 +367,11 @@ class MachineManager(QObject):
         if self._global_container_stack is None: #No active machine.
             return False
 
-        if self._global_container_stack.hasErrors():
+        validation_state_index = ValidationStateIndex.getInstance()
+        if validation_state_index.hasErrors(self._global_container_stack):
             return True
         for stack in ExtruderManager.getInstance().getMachineExtruders(self._global_container_stack.getId()):
-            if stack.hasErrors():
+            if validation_state_index.hasErrors(stack):
                 return True
 
         return False
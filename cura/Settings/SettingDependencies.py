@@ -0,0 +1,30 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Settings.SettingRelation import RelationType
+
+
+##  Get a set of keys with all settings that depend on any of the keys,
+#   including the keys themselves.
+#
+#   \param stack The container stack with the definitions of the settings.
+#   \param keys The keys of the settings to find the dependent settings of.
+#   \return \type{set} The keys and the keys of all settings that depend on
+#   them, directly or through other settings.
+def getDependentKeys(stack, keys):
+    result = set()
+    pending = list(keys)
+    while pending:
+        key = pending.pop()
+        if key in result:
+            continue
+        result.add(key)
+
+        definition = stack.getSettingDefinition(key)
+        if definition is None:
+            continue
+        for relation in definition.relations:
+            if relation.type == RelationType.RequiresTarget:
+                continue
+            pending.append(relation.target.key)
+    return result
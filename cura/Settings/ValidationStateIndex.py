@@ -0,0 +1,224 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import threading
+import weakref
+
+from UM.Logger import Logger
+from UM.Settings.Validator import ValidatorState
+
+from .SettingDependencies import getDependentKeys
+
+
+##  Keeps track of which settings of a container stack have a validation error,
+#   so asking whether a stack has errors does not need to check every setting.
+#
+#   A stack is checked completely the first time it is asked for, and after
+#   its containers change. After that, only the settings that emit a change of
+#   their value or validation state are checked again, together with the
+#   settings that depend on them.
+#
+#   Changes are only recorded when the stacks emit them. They are checked the
+#   next time the errors of a stack are asked for, so it doesn't matter whether
+#   the index hears of a change before or after whoever asks for the errors.
+#
+#   Stacks are not notified of changes in the stacks they inherit from or
+#   refer to, so a change in a global or extruder stack is also checked in all
+#   other stacks.
+#
+#   Per-object stacks only have a few settings of their own, and the rest of
+#   their settings are the settings of the stacks below them, which are checked
+#   separately. For these stacks, only the settings in the top container and
+#   the settings depending on those are checked. They are only checked again
+#   after a change in the stack itself or in the stacks below it, and nothing
+#   inherits from them, so their changes are not passed to other stacks.
+class ValidationStateIndex:
+    ##  The validation states that prevent slicing.
+    ErrorStates = (ValidatorState.Exception, ValidatorState.MaximumError, ValidatorState.MinimumError)
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._stacks = {}  # Per id() of a stack, the _StackValidationState of that stack.
+        self._pending_changes = set()  # Tuples of the state of the stack that changed and the key of the setting, or None if its containers changed.
+
+    ##  Check whether a stack has any setting with an error.
+    #
+    #   \param stack The container stack to check.
+    #   \param own_settings_only Only check the settings in the top container
+    #   of the stack and the settings depending on those, for per-object
+    #   stacks.
+    #   \return True if any setting has an error, or False otherwise.
+    def hasErrors(self, stack, own_settings_only = False):
+        return bool(self.getErrorKeys(stack, own_settings_only))
+
+    ##  Get the keys of the settings of a stack that have an error.
+    #
+    #   \param stack The container stack to check.
+    #   \param own_settings_only See hasErrors.
+    #   \return \type{set} The keys of the settings with an error.
+    def getErrorKeys(self, stack, own_settings_only = False):
+        if stack is None:
+            return set()
+
+        with self._lock:
+            self._applyPendingChanges()
+            state = self._stacks.get(id(stack))
+            if state is None or state.getStack() is not stack:
+                state = _StackValidationState(self, stack, own_settings_only)
+                self._stacks[id(stack)] = state
+            return set(state.getErrorKeys())
+
+    ##  Forget the validation state of a stack.
+    def removeStack(self, stack):
+        with self._lock:
+            state = self._stacks.pop(id(stack), None)
+            if state is not None:
+                state.disconnect()
+                self._removePendingChanges(state)
+
+    ##  Called by the state of a stack when a setting in it changed.
+    #
+    #   The change is only recorded here, and passed on to the states of the
+    #   stacks when their errors are asked for.
+    #
+    #   \param changed_state The state of the stack that changed.
+    #   \param key The key of the setting that changed, or None if the
+    #   containers of the stack changed.
+    def _onStackChanged(self, changed_state, key):
+        with self._lock:
+            self._pending_changes.add((changed_state, key))
+
+    def _applyPendingChanges(self):
+        if not self._pending_changes:
+            return
+        pending_changes = self._pending_changes
+        self._pending_changes = set()
+        for changed_state, key in pending_changes:
+            if changed_state.isOwnSettingsOnly():
+                # Nothing inherits from per-object stacks.
+                changed_state.settingChanged(changed_state, key)
+                continue
+            for state in self._stacks.values():
+                state.settingChanged(changed_state, key)
+
+    def _onStackDeleted(self, stack_id, state):
+        with self._lock:
+            if self._stacks.get(stack_id) is state:
+                del self._stacks[stack_id]
+            self._removePendingChanges(state)
+
+    def _removePendingChanges(self, state):
+        self._pending_changes = set(change for change in self._pending_changes if change[0] is not state)
+
+    __instance = None
+
+    @classmethod
+    def getInstance(cls):
+        if cls.__instance is None:
+            cls.__instance = cls()
+        return cls.__instance
+
+
+##  The settings with errors of a single stack.
+class _StackValidationState:
+    def __init__(self, index, stack, own_settings_only):
+        self._index = index
+        self._own_settings_only = own_settings_only
+        stack_id = id(stack)
+        self._stack_ref = weakref.ref(stack, lambda _: index._onStackDeleted(stack_id, self))
+
+        self._error_keys = set()
+        self._checked_keys = None  # For per-object stacks, the keys of the settings that are checked.
+        self._changed_keys = set()
+        self._needs_full_check = True
+
+        stack.propertyChanged.connect(self._onPropertyChanged)
+        stack.containersChanged.connect(self._onContainersChanged)
+
+    def getStack(self):
+        return self._stack_ref()
+
+    def isOwnSettingsOnly(self):
+        return self._own_settings_only
+
+    ##  Check a setting again the next time the errors are asked for.
+    #
+    #   \param changed_state The state of the stack in which the setting
+    #   changed.
+    #   \param key The key of the setting, or None to check all settings.
+    def settingChanged(self, changed_state, key):
+        if self._own_settings_only:
+            if changed_state is self:
+                if self._checked_keys is None or (key is not None and key not in self._checked_keys and self._isOwnSetting(key)):
+                    # A setting was added to the top container, which changes which settings are checked.
+                    self._needs_full_check = True
+                    return
+            elif not self._isParentStack(changed_state.getStack()):
+                return
+
+        if key is None:
+            self._needs_full_check = True
+        else:
+            self._changed_keys.add(key)
+
+    def disconnect(self):
+        stack = self._stack_ref()
+        if stack is not None:
+            stack.propertyChanged.disconnect(self._onPropertyChanged)
+            stack.containersChanged.disconnect(self._onContainersChanged)
+
+    def getErrorKeys(self):
+        stack = self._stack_ref()
+        if stack is None:
+            return set()
+
+        if self._needs_full_check:
+            self._needs_full_check = False
+            self._changed_keys.clear()
+            if self._own_settings_only:
+                keys = self._checked_keys = getDependentKeys(stack, stack.getTop().getAllKeys())
+            else:
+                keys = stack.getAllKeys()
+            self._error_keys = set(key for key in keys if self._hasError(stack, key))
+        elif self._changed_keys:
+            changed_keys = getDependentKeys(stack, self._changed_keys)
+            self._changed_keys = set()
+            if self._own_settings_only:
+                changed_keys &= self._checked_keys
+            for key in changed_keys:
+                if self._hasError(stack, key):
+                    self._error_keys.add(key)
+                else:
+                    self._error_keys.discard(key)
+        return self._error_keys
+
+    def _isOwnSetting(self, key):
+        stack = self._stack_ref()
+        return stack is not None and stack.getTop().getInstance(key) is not None
+
+    ##  Check whether a stack is one of the stacks below the stack of this
+    #   state, such as the extruder and global stack of a per-object stack.
+    def _isParentStack(self, parent_stack):
+        stack = self._stack_ref()
+        if stack is None or parent_stack is None:
+            return False
+        stack = stack.getNextStack()
+        while stack is not None:
+            if stack is parent_stack:
+                return True
+            stack = stack.getNextStack()
+        return False
+
+    def _hasError(self, stack, key):
+        validation_state = stack.getProperty(key, "validationState")
+        if validation_state in ValidationStateIndex.ErrorStates:
+            Logger.log("d", "Setting %s in stack %s is not valid, but %s.", key, stack.getId(), validation_state)
+            return True
+        return False
+
+    def _onPropertyChanged(self, key, property_name):
+        if property_name in ("value", "validationState"):
+            self._index._onStackChanged(self, key)
+
+    def _onContainersChanged(self, *args, **kwargs):
+        self._index._onStackChanged(self, None)
@@ -0,0 +1,67 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from string import Formatter
+import time
+
+##  Settings with start or end g-code, in which other settings can be used as
+#   {tokens}.
+GCodeSettingKeys = {"machine_start_gcode", "machine_end_gcode", "machine_extruder_start_code", "machine_extruder_end_code"}
+
+##  Computed settings with the current time, see getTimeSettings().
+TimeSettingKeys = {"time", "date", "day"}
+
+
+##  Formatter class that handles token expansion in start/end gcode.
+#
+#   Tokens that are not settings are left as they are, and remembered in
+#   unknown_keys.
+class GcodeStartEndFormatter(Formatter):
+    def __init__(self):
+        super().__init__()
+        self.unknown_keys = []
+
+    def get_value(self, key, args, kwargs):  # [CodeStyle: get_value is an overridden function from the Formatter class]
+        if isinstance(key, str):
+            try:
+                return kwargs[key]
+            except KeyError:
+                self.unknown_keys.append(key)
+                return "{" + key + "}"
+        else:
+            self.unknown_keys.append(key)
+            return "{" + str(key) + "}"
+
+
+##  Add the settings that the engine gets besides the settings of the global
+#   stack, and that can be used as tokens in start and end g-code.
+#
+#   \param settings Dictionary of the values of all settings of the global
+#   stack. The computed settings are added to it.
+#   \return \type{set} The keys of the settings that were added.
+def addComputedSettings(settings):
+    start_gcode = settings["machine_start_gcode"]
+    #Pre-compute material material_bed_temp_prepend and material_print_temp_prepend
+    bed_temperature_settings = {"material_bed_temperature", "material_bed_temperature_layer_0"}
+    settings["material_bed_temp_prepend"] = all(("{" + setting + "}" not in start_gcode for setting in bed_temperature_settings))
+    print_temperature_settings = {"material_print_temperature", "material_print_temperature_layer_0", "default_material_print_temperature", "material_initial_print_temperature", "material_final_print_temperature", "material_standby_temperature"}
+    settings["material_print_temp_prepend"] = all(("{" + setting + "}" not in start_gcode for setting in print_temperature_settings))
+
+    settings["print_bed_temperature"] = settings["material_bed_temperature"]
+    settings["print_temperature"] = settings["material_print_temperature"]
+
+    settings.update(getTimeSettings())
+
+    return {"material_bed_temp_prepend", "material_print_temp_prepend", "print_bed_temperature", "print_temperature"} | TimeSettingKeys
+
+
+##  Get the settings with the current time, which can be used as tokens in
+#   start and end g-code.
+#
+#   \return \type{dict} The time, date and day of the week.
+def getTimeSettings():
+    return {
+        "time": time.strftime('%H:%M:%S'),
+        "date": time.strftime('%d-%m-%Y'),
+        "day": ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'][int(time.strftime('%w'))]
+    }
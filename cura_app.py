@@ -6,6 +6,7 @@ import os
 import sys
 import platform
 import faulthandler
+import multiprocessing
 
 from UM.Platform import Platform
 
@@ -54,20 +55,25 @@ import Arcus #@UnusedImport
 import cura.CuraApplication
 import cura.Settings.CuraContainerRegistry
 
-if hasattr(sys, "frozen"):
-    dirpath = os.path.expanduser("~/AppData/Local/cura/")
-    os.makedirs(dirpath, exist_ok = True)
-    sys.stdout = open(os.path.join(dirpath, "stdout.log"), "w")
-    sys.stderr = open(os.path.join(dirpath, "stderr.log"), "w")
+# Layer processing can use worker processes, which start this script again.
+# Only start the application in the main process.
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
 
-faulthandler.enable()
+    if hasattr(sys, "frozen"):
+        dirpath = os.path.expanduser("~/AppData/Local/cura/")
+        os.makedirs(dirpath, exist_ok = True)
+        sys.stdout = open(os.path.join(dirpath, "stdout.log"), "w")
+        sys.stderr = open(os.path.join(dirpath, "stderr.log"), "w")
 
-# Force an instance of CuraContainerRegistry to be created and reused later.
-cura.Settings.CuraContainerRegistry.CuraContainerRegistry.getInstance()
+    faulthandler.enable()
 
-# This prestart up check is needed to determine if we should start the application at all.
-if not cura.CuraApplication.CuraApplication.preStartUp():
-    sys.exit(0)
+    # Force an instance of CuraContainerRegistry to be created and reused later.
+    cura.Settings.CuraContainerRegistry.CuraContainerRegistry.getInstance()
 
-app = cura.CuraApplication.CuraApplication.getInstance()
-app.run()
+    # This prestart up check is needed to determine if we should start the application at all.
+    if not cura.CuraApplication.CuraApplication.preStartUp():
+        sys.exit(0)
+
+    app = cura.CuraApplication.CuraApplication.getInstance()
+    app.run()
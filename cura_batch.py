@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+##  Slices project files or meshes without starting the user interface.
+#
+#   Example:
+#       cura_batch.py --output-dir out --processes 4 first.3mf second.3mf
+#       cura_batch.py --output-dir out --machine ultimaker2 --profile fine.inst.cfg part.stl
+
+import argparse
+import os
+import shutil
+import sys
+
+from cura.BatchSlicer import BatchSlicer
+
+
+def parseSetting(text):
+    key, separator, value = text.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError("Settings must be given as key=value, not '{0}'".format(text))
+    return key.strip(), value.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Slice Cura project files or meshes without the user interface.")
+    parser.add_argument("files", nargs = "+", help = "3MF project files, or STL files to slice with --machine and --profile.")
+    parser.add_argument("--output-dir", required = True, help = "Directory to write the g-code and estimates to.")
+    parser.add_argument("--engine", default = shutil.which("CuraEngine") or "CuraEngine", help = "Path to the CuraEngine executable.")
+    parser.add_argument("--resources", default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources"), help = "Path to Cura's resources directory.")
+    parser.add_argument("--processes", type = int, default = None, help = "Number of engines to run at the same time. Defaults to the number of CPUs.")
+    parser.add_argument("--machine", default = "fdmprinter", help = "Machine definition to slice STL files with.")
+    parser.add_argument("--profile", action = "append", default = [], help = "Profile (.inst.cfg) to slice STL files with. Can be given more than once.")
+    parser.add_argument("--setting", action = "append", type = parseSetting, default = [], help = "Setting to override, as key=value. Can be given more than once.")
+    arguments = parser.parse_args()
+
+    slicer = BatchSlicer(arguments.engine, arguments.resources, arguments.output_dir, arguments.processes)
+    settings = dict(arguments.setting)
+    for file_name in arguments.files:
+        try:
+            if file_name.lower().endswith(".3mf"):
+                job = slicer.addProject(file_name, settings)
+            else:
+                job = slicer.addMesh(file_name, arguments.machine, arguments.profile, settings)
+        except Exception as e:
+            print("Unable to read {0}: {1}".format(file_name, e), file = sys.stderr)
+            return 1
+
+    def printResult(result):
+        if result.get("return_code") == 0:
+            print("{0}: done in {1:.1f} s, print time {2} s, filament {3}".format(result["name"], result["slice_time"], result.get("print_time", "unknown"), result.get("filament_amount", "unknown")))
+        else:
+            print("{0}: failed\n{1}".format(result["name"], result.get("error", "")), file = sys.stderr)
+
+    results = slicer.run(printResult)
+    return 0 if all(result.get("return_code") == 0 for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -17,11 +17,22 @@ from UM.Qt.Duration import DurationFormat
 from PyQt5.QtCore import QObject, pyqtSlot
 
 from cura.Settings.ExtruderManager import ExtruderManager
+from cura.LayerProcessingPool import LayerProcessingPool
+from cura.GCodeBuffer import GCodeBuffer
+from cura.SliceSettings import getTimeSettings
 from . import ProcessSlicedLayersJob
+from . import ReplaceGCodeTokensJob
 from . import StartSliceJob
+from . import SettingsSnapshot
+from . import SliceResultCache
+from . import SliceTimings
 
+import hashlib
+import json
 import os
 import sys
+import threading
+import weakref
 from time import time
 
 from PyQt5.QtCore import QTimer
@@ -95,11 +106,14 @@ class CuraEngineBackend(QObject, Backend):
         self._message_handlers["cura.proto.SlicingFinished"] = self._onSlicingFinishedMessage
 
         self._start_slice_job = None
+        self._mesh_payload_cache = StartSliceJob.MeshPayloadCache()  # Mesh data sent in previous slices, for meshes that didn't change.
+        self._settings_snapshot = SettingsSnapshot.SettingsSnapshot()  # Settings sent in previous slices, for settings that didn't change.
         self._slicing = False  # Are we currently slicing?
         self._restart = False  # Back-end is currently restarting?
         self._tool_active = False  # If a tool is active, some tasks do not have to do anything
         self._always_restart = True  # Always restart the engine when starting a new slice. Don't keep the process running. TODO: Fix engine statelessness.
         self._process_layers_job = None  # The currently active job to process layers, or None if it is not processing layers.
+        self._partial_layers_job = None  # Background job that processed only some layers, to add the other layers to.
         self._need_slicing = False
         self._engine_is_fresh = True  # Is the newly started engine used before or not?
 
@@ -108,7 +122,9 @@ class CuraEngineBackend(QObject, Backend):
         self._last_num_objects = 0  # Count number of objects to see if there is something changed
         self._postponed_scene_change_sources = []  # scene change is postponed (by a tool)
 
+        self._watched_processes = set()  # Engine processes that quit and are being waited for.
         self.backendQuit.connect(self._onBackendQuit)
+        self.engineProcessEnded.connect(self._onEngineProcessEnded)
         self.backendConnected.connect(self._onBackendConnected)
 
         # When a tool operation is in progress, don't slice. So we need to listen for tool operations.
@@ -116,19 +132,72 @@ class CuraEngineBackend(QObject, Backend):
         Application.getInstance().getController().toolOperationStopped.connect(self._onToolOperationStopped)
 
         self._slice_start_time = None
+        self._slice_timings = SliceTimings.SliceTimings()  # How long the stages of the current or last slice took.
+        self._engine_start_time = None  # When the slice message was sent to the engine.
 
         Preferences.getInstance().addPreference("general/auto_slice", True)
+        # Process the layers for the layer view while the engine is still slicing.
+        Preferences.getInstance().addPreference("backend/process_layers_while_slicing", True)
+        # Process the layers for the layer view after slicing when another view is active, so the layer view is ready when it is opened.
+        Preferences.getInstance().addPreference("backend/process_layers_in_background", True)
+        # Number of layers at the bottom and at the top to process in the background. The rest is processed when the layer view is opened. 0 processes all layers.
+        Preferences.getInstance().addPreference("backend/background_layer_count", 0)
+        # Maximum amount of memory in MB for the processed layers and the layer view meshes built from them. Processed layers beyond that are moved to disk, the meshes always stay in memory. 0 means no limit.
+        Preferences.getInstance().addPreference("backend/layer_data_memory_budget", 0)
+        # Number of worker processes to convert layers with. 0 converts them in a thread of Cura itself.
+        Preferences.getInstance().addPreference("backend/layer_processing_processes", 0)
+        # Number of slice results to keep on disk, to reuse when the same scene is sliced again. 0 disables this.
+        Preferences.getInstance().addPreference("backend/slice_cache_size", 5)
+        # Maximum amount of disk space in MB for the stored slice results. 0 disables storing them.
+        Preferences.getInstance().addPreference("backend/slice_cache_disk_space", 200)
+        # File to append the timings of each slice to, as a line of JSON. Empty to only log them.
+        Preferences.getInstance().addPreference("backend/slice_timings_file", "")
+
+        self._slice_result_cache = SliceResultCache.SliceResultCache(os.path.join(Resources.getDataStoragePath(), "slice_cache"), int(Preferences.getInstance().getValue("backend/slice_cache_size")),
+                                                                     int(Preferences.getInstance().getValue("backend/slice_cache_disk_space")) * 1024 * 1024)
+        self._slice_fingerprint = None  # Fingerprint of the scene and settings that are being sliced.
+        self._slice_result_writer = None  # Stores the output of the engine for the current slice in the slice result cache.
+        self._load_slice_result_job = None  # The job that is loading the result of the current slice from the cache.
+        self._pending_slice_message = None  # The slice message to send if loading the result from the cache fails.
 
         self._use_timer = False
         # When you update a setting and other settings get changed through inheritance, many propertyChanged signals are fired.
         # This timer will group them up, and only slice for the last setting changed signal.
+        # The interval adapts to how long slicing takes and to how often slices get interrupted by new changes, see _startChangeTimer.
         # TODO: Properly group propertyChanged signals by whether they are triggered by the same user interaction.
         self._change_timer = QTimer()
         self._change_timer.setSingleShot(True)
-        self._change_timer.setInterval(500)
+        self._change_timer.setInterval(self.MinimumChangeInterval)
+        self._average_slice_time = None  # Moving average of how long the engine takes to slice the scene, in seconds.
+        self._interrupted_slice_count = 0  # Number of slices in a row that were stopped by a change before they finished.
+        self._sliced_node_states = weakref.WeakKeyDictionary()  # Per node in the current or last slice, its StartSliceJob.SlicedNodeState.
+
+        # After a slice, the used engine is replaced by a fresh one, so the next slice doesn't need to wait for it.
+        # This is delayed a bit, so the last messages of the engine are received first.
+        self._engine_restart_timer = QTimer()
+        self._engine_restart_timer.setSingleShot(True)
+        self._engine_restart_timer.setInterval(1000)
+        self._engine_restart_timer.timeout.connect(self._restartUsedEngine)
+
         self.determineAutoSlicing()
         Preferences.getInstance().preferenceChanged.connect(self._onPreferencesChanged)
 
+    ##  The shortest time to wait after a change before slicing, in
+    #   milliseconds.
+    MinimumChangeInterval = 500
+
+    ##  The longest time to wait after a change before slicing, in
+    #   milliseconds.
+    MaximumChangeInterval = 5000
+
+    ##  Part of the average slice time that is added to the time to wait
+    #   after a change. Restarting a slow slice costs more, so it is worth
+    #   waiting longer for more changes.
+    SliceTimeChangeIntervalFactor = 0.25
+
+    ##  Weight of the last slice in the moving average of the slice time.
+    SliceTimeAverageWeight = 0.3
+
     ##  Terminate the engine process.
     #
     #   This function should terminate the engine process.
@@ -136,6 +205,8 @@ class CuraEngineBackend(QObject, Backend):
     def close(self):
         # Terminate CuraEngine if it is still running at this point
         self._terminate()
+        LayerProcessingPool.getInstance().close()
+        self._writeSliceTimings()
 
     ##  Get the command that is used to call the engine.
     #   This is useful for debugging and used to actually start the engine.
@@ -150,6 +221,26 @@ class CuraEngineBackend(QObject, Backend):
     #   \param material_amount The amount of material the print will use.
     printDurationMessage = Signal()
 
+    ##  Get how long the stages of the current or last slice took.
+    #
+    #   Stages that happen after slicing, such as building and drawing the
+    #   layer view, are added to the last slice when they are performed.
+    #
+    #   \return \type{dict} The time in seconds per stage that was performed.
+    #   See SliceTimings.Stages for the stages.
+    def getSliceTimings(self):
+        return self._slice_timings.getStageTimes()
+
+    ##  Add time spent on a stage of the current or last slice.
+    #
+    #   This is used by the layer view to report the time it took to draw the
+    #   layers for the first time.
+    #
+    #   \param stage The name of the stage, see SliceTimings.Stages.
+    #   \param seconds The time spent on the stage.
+    def addSliceStageTime(self, stage, seconds):
+        self._slice_timings.addStageTime(stage, seconds)
+
     ##  Emitted when the slicing process starts.
     slicingStarted = Signal()
 
@@ -160,6 +251,7 @@ class CuraEngineBackend(QObject, Backend):
     def stopSlicing(self):
         self.backendStateChange.emit(BackendState.NotStarted)
         if self._slicing:  # We were already slicing. Stop the old job.
+            self._interrupted_slice_count += 1
             self._terminate()
             self._createSocket()
 
@@ -174,7 +266,7 @@ class CuraEngineBackend(QObject, Backend):
     @pyqtSlot()
     def forceSlice(self):
         if self._use_timer:
-            self._change_timer.start()
+            self._startChangeTimer()
         else:
             self.slice()
 
@@ -187,6 +279,10 @@ class CuraEngineBackend(QObject, Backend):
             Logger.log("w", "Slice unnecessary, nothing has changed that needs reslicing.")
             return
 
+        self._writeSliceTimings()
+        self._slice_timings = SliceTimings.SliceTimings()
+        self._engine_start_time = None
+
         self.printDurationMessage.emit({
             "none": 0,
             "inset_0": 0,
@@ -203,21 +299,26 @@ class CuraEngineBackend(QObject, Backend):
 
         self._stored_layer_data = []
         self._stored_optimized_layer_data = []
+        self._partial_layers_job = None
 
         if self._process is None:
             self._createSocket()
         self.stopSlicing()
-        self._engine_is_fresh = False  # Yes we're going to use the engine
 
         self.processingProgress.emit(0.0)
         self.backendStateChange.emit(BackendState.NotStarted)
 
-        self._scene.gcode_list = []
+        self._scene.gcode_list = GCodeBuffer()
         self._slicing = True
+        self._engine_restart_timer.stop()
+        self._slice_fingerprint = None
+        self._abortSliceResultWriter()
+        self._load_slice_result_job = None
+        self._sliced_node_states = weakref.WeakKeyDictionary()
         self.slicingStarted.emit()
 
         slice_message = self._socket.createMessage("cura.proto.Slice")
-        self._start_slice_job = StartSliceJob.StartSliceJob(slice_message)
+        self._start_slice_job = StartSliceJob.StartSliceJob(slice_message, self._mesh_payload_cache, self._settings_snapshot)
         self._start_slice_job.start()
         self._start_slice_job.finished.connect(self._onStartSliceCompleted)
 
@@ -227,6 +328,14 @@ class CuraEngineBackend(QObject, Backend):
         self._slicing = False
         self._stored_layer_data = []
         self._stored_optimized_layer_data = []
+        self._partial_layers_job = None
+        self._abortSliceResultWriter()
+        self._load_slice_result_job = None
+        self._pending_slice_message = None
+        if self._process_layers_job is not None and self._process_layers_job.isWaitingForLayers():
+            # The engine won't send the rest of the layers anymore.
+            self._process_layers_job.abort()
+            self._process_layers_job = None
         if self._start_slice_job is not None:
             self._start_slice_job.cancel()
 
@@ -239,13 +348,35 @@ class CuraEngineBackend(QObject, Backend):
 
         if self._process is not None:
             Logger.log("d", "Killing engine process")
-            try:
-                self._process.terminate()
-                Logger.log("d", "Engine process is killed. Received return code %s", self._process.wait())
-                self._process = None
+            self._killProcess(self._process)
+            self._process = None
 
-            except Exception as e:  # terminating a process that is already terminating causes an exception, silently ignore this.
-                Logger.log("d", "Exception occurred while trying to kill the engine %s", str(e))
+    ##  Kill an engine process without waiting for it to end.
+    #
+    #   The process is waited for in a separate thread, so it doesn't linger as
+    #   a zombie process.
+    #
+    #   \param process The engine process to kill.
+    def _killProcess(self, process):
+        try:
+            process.terminate()
+        except Exception as e:  # terminating a process that is already terminating causes an exception, silently ignore this.
+            Logger.log("d", "Exception occurred while trying to kill the engine %s", str(e))
+            return
+        threading.Thread(target = lambda: Logger.log("d", "Engine process is killed. Received return code %s", process.wait()), daemon = True).start()
+
+    ##  Replace an engine that was used for slicing by a fresh one, so the next
+    #   slice can start right away.
+    def _restartUsedEngine(self):
+        if not self._always_restart or self._slicing or self._engine_is_fresh or self._process is None:
+            return
+        if Application.getInstance().getCommandLineOption("external-backend", False):
+            return
+
+        Logger.log("d", "Starting a fresh engine for the next slice.")
+        self._killProcess(self._process)
+        self._process = None
+        self._createSocket()
 
     ##  Event handler to call when the job to initiate the slicing process is
     #   completed.
@@ -266,6 +397,10 @@ class CuraEngineBackend(QObject, Backend):
         if job.isCancelled() or job.getError() or job.getResult() == StartSliceJob.StartJobResult.Error:
             return
 
+        for stage, seconds in job.getStageTimes().items():
+            self._slice_timings.addStageTime(stage, seconds)
+        self._sliced_node_states = job.getSlicedNodeStates()
+
         if job.getResult() == StartSliceJob.StartJobResult.MaterialIncompatible:
             if Application.getInstance().platformActivity:
                 self._error_message = Message(catalog.i18nc("@info:status",
@@ -319,14 +454,80 @@ class CuraEngineBackend(QObject, Backend):
             else:
                 self.backendStateChange.emit(BackendState.NotStarted)
             return
+
+        # If this scene was sliced with these settings before, use that result instead of slicing again.
+        self._slice_fingerprint = self._getSliceFingerprint(job)
+        if self._slice_result_cache.contains(self._slice_fingerprint):
+            self._pending_slice_message = job.getSliceMessage()
+            self._load_slice_result_job = SliceResultCache.LoadSliceResultJob(self._slice_result_cache, self._slice_fingerprint)
+            self._load_slice_result_job.finished.connect(self._onSliceResultLoaded)
+            self._load_slice_result_job.start()
+            self.backendStateChange.emit(BackendState.Processing)
+            return
+
+        self._sendSliceMessage(job.getSliceMessage())
+
+    ##  Stop storing the output of the engine for the current slice, if it was
+    #   being stored.
+    def _abortSliceResultWriter(self):
+        if self._slice_result_writer is not None:
+            self._slice_result_writer.abort()
+            self._slice_result_writer = None
+
+    ##  Send a prepared slice message to the engine.
+    def _sendSliceMessage(self, slice_message):
+        if self._slice_result_cache.isEnabled():
+            self._slice_result_writer = SliceResultCache.SliceResultWriter(self._slice_result_cache, self._slice_fingerprint)
+
         # Preparation completed, send it to the backend.
-        self._socket.sendMessage(job.getSliceMessage())
+        self._engine_is_fresh = False  # Yes we're going to use the engine
+        send_start_time = time()
+        self._socket.sendMessage(slice_message)
+        self._engine_start_time = time()
+        self._slice_timings.addStageTime("socket_send", self._engine_start_time - send_start_time)
 
         # Notify the user that it's now up to the backend to do it's job
         self.backendStateChange.emit(BackendState.Processing)
 
         Logger.log("d", "Sending slice message took %s seconds", time() - self._slice_start_time )
 
+    ##  Get the fingerprint under which the result of a slice is stored.
+    #
+    #   \param job The StartSliceJob that built the slice message.
+    #   \return \type{str} A hash of the slice message and the engine.
+    def _getSliceFingerprint(self, job):
+        engine_path = Preferences.getInstance().getValue("backend/location")
+        try:
+            engine_stat = os.stat(engine_path)
+            engine_identity = "{0}:{1}:{2}".format(engine_path, engine_stat.st_size, engine_stat.st_mtime)
+        except (OSError, TypeError):
+            engine_identity = str(engine_path)
+        return hashlib.sha1((job.getFingerprint() + engine_identity).encode("utf-8")).hexdigest()
+
+    ##  Called when the result of a slice was loaded from the slice result
+    #   cache. The result is handled as if the engine sent it.
+    #
+    #   \param job The LoadSliceResultJob.
+    def _onSliceResultLoaded(self, job):
+        if job is not self._load_slice_result_job:
+            return  # Another slice was started in the meantime.
+        self._load_slice_result_job = None
+        slice_message = self._pending_slice_message
+        self._pending_slice_message = None
+
+        result = job.getResult()
+        if result is None:
+            self._sendSliceMessage(slice_message)
+            return
+
+        Logger.log("d", "Using the stored result of an earlier slice.")
+        self._slice_timings.setFromCache(True)
+        self._scene.gcode_list = GCodeBuffer(result.gcode_list)
+        self._stored_optimized_layer_data = result.getLayerMessages()
+        if result.feature_times is not None:
+            self.printDurationMessage.emit(result.feature_times, result.material_amounts)
+        self._onSlicingFinishedMessage(None)
+
     ##  Determine enable or disable auto slicing. Return True for enable timer and False otherwise.
     #   It disables when
     #   - preference auto slice is off
@@ -381,6 +582,9 @@ class CuraEngineBackend(QObject, Backend):
                 return
             if source.getMeshData().getVertices() is None:
                 return
+            if self._isSlicedNodeUnchanged(source):
+                # Nothing changed that ends up in the slice, so let the current slice finish.
+                return
 
         if self._tool_active:
             # do it later, each source only has to be done once
@@ -392,6 +596,18 @@ class CuraEngineBackend(QObject, Backend):
         self.stopSlicing()
         self._onChanged()
 
+    ##  Check whether a node is sliced with the same mesh data,
+    #   transformation, parent and per-object settings as it has now.
+    #
+    #   \param node \type{SceneNode} The node that changed.
+    #   \return True if the node is in the current or last slice and would
+    #   give the same result if it were sliced again.
+    def _isSlicedNodeUnchanged(self, node):
+        if self._start_slice_job is not None or not self._sliced_node_states:
+            return False  # The slice is still being prepared, it may contain the node as it was before or after the change.
+        state = self._sliced_node_states.get(node)
+        return state is not None and state.isUnchanged(node)
+
     ##  Called when an error occurs in the socket connection towards the engine.
     #
     #   \param error The exception that occurred.
@@ -411,6 +627,7 @@ class CuraEngineBackend(QObject, Backend):
 
     ##  Remove old layer data (if any)
     def _clearLayerData(self):
+        self._partial_layers_job = None
         for node in DepthFirstIterator(self._scene.getRoot()):
             if node.callDecoration("getLayerData"):
                 node.getParent().removeChild(node)
@@ -431,9 +648,15 @@ class CuraEngineBackend(QObject, Backend):
     #   \param property The property of the setting instance that has changed.
     def _onSettingChanged(self, instance, property):
         if property == "value": # Only reslice if the value has changed.
+            self._settings_snapshot.settingChanged(instance)
             self.needsSlicing()
             self._onChanged()
 
+    ##  The containers of the global stack or an extruder stack changed, so any
+    #   setting may have a different value now.
+    def _onStackContainersChanged(self, *args, **kwargs):
+        self._settings_snapshot.invalidate()
+
     ##  Called when a sliced layer data message is received from the engine.
     #
     #   \param message The protobuf message containing sliced layer data.
@@ -444,7 +667,17 @@ class CuraEngineBackend(QObject, Backend):
     #
     #   \param message The protobuf message containing sliced layer data.
     def _onOptimizedLayerMessage(self, message):
-        self._stored_optimized_layer_data.append(message)
+        if self._engine_start_time is not None and not self._slice_timings.hasStage("engine_first_layer"):
+            self._slice_timings.addStageTime("engine_first_layer", time() - self._engine_start_time)
+        if self._slice_result_writer is not None:
+            self._slice_result_writer.addLayer(message)
+        if self._process_layers_job is not None and self._process_layers_job.isWaitingForLayers():
+            self._process_layers_job.addLayer(message)
+        elif self._layer_view_active and Preferences.getInstance().getValue("backend/process_layers_while_slicing"):
+            self._stored_optimized_layer_data.append(message)
+            self._startProcessSlicedLayersJob(streaming = True)
+        else:
+            self._stored_optimized_layer_data.append(message)
 
     ##  Called when a progress message is received from the engine.
     #
@@ -457,39 +690,72 @@ class CuraEngineBackend(QObject, Backend):
     #
     #   \param message The protobuf message signalling that slicing is finished.
     def _onSlicingFinishedMessage(self, message):
-        self.backendStateChange.emit(BackendState.Done)
-        self.processingProgress.emit(1.0)
-
-        for line in self._scene.gcode_list:
-            replaced = line.replace("{print_time}", str(Application.getInstance().getPrintInformation().currentPrintTime.getDisplayString(DurationFormat.Format.ISO8601)))
-            replaced = replaced.replace("{filament_amount}", str(Application.getInstance().getPrintInformation().materialLengths))
-            replaced = replaced.replace("{filament_weight}", str(Application.getInstance().getPrintInformation().materialWeights))
-            replaced = replaced.replace("{filament_cost}", str(Application.getInstance().getPrintInformation().materialCosts))
-            replaced = replaced.replace("{jobname}", str(Application.getInstance().getPrintInformation().jobName))
-
-            self._scene.gcode_list[self._scene.gcode_list.index(line)] = replaced
+        if self._engine_start_time is not None and message is not None:
+            self._slice_timings.addStageTime("engine_total", time() - self._engine_start_time)
+            self._engine_start_time = None
+
+        if self._slice_result_writer is not None:
+            # Store the g-code before the print information is filled in, it may be different next time.
+            self._slice_result_writer.finish(self._scene.gcode_list.getChunks())
+            self._slice_result_writer = None
+
+        # Fill in the print information in the g-code in the background. The slice is done when that is finished.
+        print_information = Application.getInstance().getPrintInformation()
+        replacements = {
+            "print_time": print_information.currentPrintTime.getDisplayString(DurationFormat.Format.ISO8601),
+            "filament_amount": print_information.materialLengths,
+            "filament_weight": print_information.materialWeights,
+            "filament_cost": print_information.materialCosts,
+            "jobname": print_information.jobName
+        }
+        replacements.update(getTimeSettings())  # Left in the start and end g-code by StartSliceJob.
+        replace_tokens_job = ReplaceGCodeTokensJob.ReplaceGCodeTokensJob(self._scene.gcode_list, replacements)
+        replace_tokens_job.finished.connect(self._onReplaceGCodeTokensFinished)
+        replace_tokens_job.start()
 
         self._slicing = False
         self._need_slicing = False
-        Logger.log("d", "Slicing took %s seconds", time() - self._slice_start_time )
-        if self._layer_view_active and (self._process_layers_job is None or not self._process_layers_job.isRunning()):
-            self._process_layers_job = ProcessSlicedLayersJob.ProcessSlicedLayersJob(self._stored_optimized_layer_data)
-            self._process_layers_job.finished.connect(self._onProcessLayersFinished)
-            self._process_layers_job.start()
-            self._stored_optimized_layer_data = []
+        self._engine_restart_timer.start()
+        slice_time = time() - self._slice_start_time
+        Logger.log("d", "Slicing took %s seconds", slice_time)
+        if message is not None:  # Results from the slice result cache say nothing about how long slicing takes.
+            if self._average_slice_time is None:
+                self._average_slice_time = slice_time
+            else:
+                self._average_slice_time += self.SliceTimeAverageWeight * (slice_time - self._average_slice_time)
+        self._interrupted_slice_count = 0
+        if self._process_layers_job is not None and self._process_layers_job.isWaitingForLayers():
+            self._process_layers_job.setSlicingFinished()
+        elif self._layer_view_active and (self._process_layers_job is None or not self._process_layers_job.isRunning()):
+            self._startProcessSlicedLayersJob()
+        elif self._process_layers_job is None and Preferences.getInstance().getValue("backend/process_layers_in_background"):
+            self._startProcessSlicedLayersJob(background = True)
+
+    ##  Called when the print information is filled in in the g-code of a slice.
+    #   The g-code in the scene is replaced by the filled in copy.
+    #
+    #   \param job The ReplaceGCodeTokensJob that finished.
+    def _onReplaceGCodeTokensFinished(self, job):
+        if self._slicing or job.getGCodeBuffer() is not self._scene.gcode_list:
+            return  # A new slice was started in the meantime.
+        if self._need_slicing:
+            return  # The scene or settings changed in the meantime, so the result is no longer up to date.
+        self._scene.gcode_list = job.getResult()
+        self.backendStateChange.emit(BackendState.Done)
+        self.processingProgress.emit(1.0)
 
     ##  Called when a g-code message is received from the engine.
     #
     #   \param message The protobuf message containing g-code, encoded as UTF-8.
     def _onGCodeLayerMessage(self, message):
-        self._scene.gcode_list.append(message.data.decode("utf-8", "replace"))
+        self._scene.gcode_list.append(message.data)
 
     ##  Called when a g-code prefix message is received from the engine.
     #
     #   \param message The protobuf message containing the g-code prefix,
     #   encoded as UTF-8.
     def _onGCodePrefixMessage(self, message):
-        self._scene.gcode_list.insert(0, message.data.decode("utf-8", "replace"))
+        self._scene.gcode_list.insert(0, message.data)
 
     ##  Called when a print time message is received from the engine.
     #
@@ -512,6 +778,8 @@ class CuraEngineBackend(QObject, Backend):
             "retract": message.time_retract,
             "support_interface": message.time_support_interface
         }
+        if self._slice_result_writer is not None:
+            self._slice_result_writer.setPrintEstimates(feature_times, material_amounts)
         self.printDurationMessage.emit(feature_times, material_amounts)
 
     ##  Creates a new socket connection.
@@ -525,7 +793,25 @@ class CuraEngineBackend(QObject, Backend):
     def _onChanged(self, *args, **kwargs):
         self.needsSlicing()
         if self._use_timer:
-            self._change_timer.start()
+            self._startChangeTimer()
+
+    ##  (Re)start the timer to slice after a change.
+    #
+    #   The time to wait grows with the average time it takes to slice the
+    #   scene, and doubles for every slice in a row that was interrupted by a
+    #   new change. This way a series of changes, like dragging a slider,
+    #   results in a single slice instead of starting and killing the engine
+    #   for every step.
+    def _startChangeTimer(self):
+        interval = self.MinimumChangeInterval
+        if self._average_slice_time is not None:
+            interval += self.SliceTimeChangeIntervalFactor * self._average_slice_time * 1000
+        interval *= 2 ** min(self._interrupted_slice_count, 4)
+        interval = int(min(interval, self.MaximumChangeInterval))
+        if interval != self._change_timer.interval():
+            Logger.log("d", "Waiting %s ms after changes before slicing.", interval)
+            self._change_timer.setInterval(interval)
+        self._change_timer.start()
 
     ##  Called when the back-end connects to the front-end.
     def _onBackendConnected(self):
@@ -543,7 +829,7 @@ class CuraEngineBackend(QObject, Backend):
         self._tool_active = True  # Do not react on scene change
         self.disableTimer()
         # Restart engine as soon as possible, we know we want to slice afterwards
-        if not self._engine_is_fresh:
+        if not self._engine_is_fresh or self._slicing:
             self._terminate()
             self._createSocket()
 
@@ -567,12 +853,12 @@ class CuraEngineBackend(QObject, Backend):
             if view.getPluginId() == "LayerView":  # If switching to layer view, we should process the layers if that hasn't been done yet.
                 self._layer_view_active = True
                 # There is data and we're not slicing at the moment
-                # if we are slicing, there is no need to re-calculate the data as it will be invalid in a moment.
-                if self._stored_optimized_layer_data and not self._slicing:
-                    self._process_layers_job = ProcessSlicedLayersJob.ProcessSlicedLayersJob(self._stored_optimized_layer_data)
-                    self._process_layers_job.finished.connect(self._onProcessLayersFinished)
-                    self._process_layers_job.start()
-                    self._stored_optimized_layer_data = []
+                # if we are slicing, only start processing if the layers are processed while slicing.
+                if self._stored_optimized_layer_data and self._process_layers_job is None:
+                    if not self._slicing:
+                        self._startProcessSlicedLayersJob()
+                    elif Preferences.getInstance().getValue("backend/process_layers_while_slicing"):
+                        self._startProcessSlicedLayersJob(streaming = True)
             else:
                 self._layer_view_active = False
 
@@ -580,30 +866,57 @@ class CuraEngineBackend(QObject, Backend):
     #
     #   We should reset our state and start listening for new connections.
     def _onBackendQuit(self):
-        if not self._restart:
-            if self._process:
-                Logger.log("d", "Backend quit with return code %s. Resetting process and socket.", self._process.wait())
-                self._process = None
+        if not self._restart and self._process is not None:
+            # The engine that quit may be one that was killed before, and the engine that quit may not be reaped yet.
+            # So wait for the current engine in the background, and only reset if that is the one that ended.
+            process = self._process
+            if process not in self._watched_processes:
+                self._watched_processes.add(process)
+                threading.Thread(target = self._waitForEngineProcess, args = (process,), daemon = True).start()
+
+    ##  Wait for an engine process to end, in a separate thread.
+    def _waitForEngineProcess(self, process):
+        process.wait()
+        self.engineProcessEnded.emit(process)
+
+    ##  Emitted in a separate thread when an engine process ended that had
+    #   quit while it was the current engine.
+    #
+    #   \param process The engine process that ended.
+    engineProcessEnded = Signal()
+
+    ##  Called on the main thread when an engine process ended that quit while
+    #   it was the current engine.
+    def _onEngineProcessEnded(self, process):
+        self._watched_processes.discard(process)
+        if not self._restart and process is self._process:
+            Logger.log("d", "Backend quit with return code %s. Resetting process and socket.", process.returncode)
+            self._process = None
 
     ##  Called when the global container stack changes
     def _onGlobalStackChanged(self):
         if self._global_container_stack:
             self._global_container_stack.propertyChanged.disconnect(self._onSettingChanged)
             self._global_container_stack.containersChanged.disconnect(self._onChanged)
+            self._global_container_stack.containersChanged.disconnect(self._onStackContainersChanged)
             extruders = list(ExtruderManager.getInstance().getMachineExtruders(self._global_container_stack.getId()))
             if extruders:
                 for extruder in extruders:
                     extruder.propertyChanged.disconnect(self._onSettingChanged)
+                    extruder.containersChanged.disconnect(self._onStackContainersChanged)
 
         self._global_container_stack = Application.getInstance().getGlobalContainerStack()
+        self._settings_snapshot.invalidate()
 
         if self._global_container_stack:
             self._global_container_stack.propertyChanged.connect(self._onSettingChanged)  # Note: Only starts slicing when the value changed.
             self._global_container_stack.containersChanged.connect(self._onChanged)
+            self._global_container_stack.containersChanged.connect(self._onStackContainersChanged)
             extruders = list(ExtruderManager.getInstance().getMachineExtruders(self._global_container_stack.getId()))
             if extruders:
                 for extruder in extruders:
                     extruder.propertyChanged.connect(self._onSettingChanged)
+                    extruder.containersChanged.connect(self._onStackContainersChanged)
             self._onActiveExtruderChanged()
             self._onChanged()
 
@@ -615,6 +928,7 @@ class CuraEngineBackend(QObject, Backend):
             if extruders:
                 for extruder in extruders:
                     extruder.propertyChanged.connect(self._onSettingChanged)
+                    extruder.containersChanged.connect(self._onStackContainersChanged)
         if self._active_extruder_stack:
             self._active_extruder_stack.containersChanged.disconnect(self._onChanged)
 
@@ -622,8 +936,59 @@ class CuraEngineBackend(QObject, Backend):
         if self._active_extruder_stack:
             self._active_extruder_stack.containersChanged.connect(self._onChanged)
 
+    ##  Start processing the stored layers for the layer view.
+    #
+    #   \param streaming Whether the engine is still slicing. The layers that
+    #   arrive later are handed to the job as they come in.
+    #   \param background Whether the layer view is not active. Only the
+    #   bottom and top layers are processed if the
+    #   backend/background_layer_count preference is set, the others stay
+    #   stored until the layer view is opened.
+    def _startProcessSlicedLayersJob(self, streaming = False, background = False):
+        layers = self._stored_optimized_layer_data
+        self._stored_optimized_layer_data = []
+        previous_job = self._partial_layers_job
+        self._partial_layers_job = None
+        if background:
+            layer_count = int(Preferences.getInstance().getValue("backend/background_layer_count"))
+            if 0 < layer_count and 2 * layer_count < len(layers):
+                layers = sorted(layers, key = lambda layer: layer.id)
+                self._stored_optimized_layer_data = layers[layer_count:-layer_count]
+                layers = layers[:layer_count] + layers[-layer_count:]
+
+        self._process_layers_job = ProcessSlicedLayersJob.ProcessSlicedLayersJob(layers, streaming = streaming, background = background, previous_job = previous_job)
+        self._process_layers_job.finished.connect(self._onProcessLayersFinished)
+        self._process_layers_job.start()
+        if self._stored_optimized_layer_data:
+            self._partial_layers_job = self._process_layers_job
+
     def _onProcessLayersFinished(self, job):
-        self._process_layers_job = None
+        if self._process_layers_job is job:
+            self._process_layers_job = None
+            if not job.isAborted():
+                self._slice_timings.addStageTime("layer_processing", job.getLayerProcessingTime())
+                self._slice_timings.addStageTime("mesh_build", job.getMeshBuildTime())
+                if job is self._partial_layers_job and self._layer_view_active:
+                    # The layer view was opened while the bottom and top layers were processed in the background.
+                    self._startProcessSlicedLayersJob()
+
+    ##  Log the timings of the last slice as JSON, and append them to the slice
+    #   timings file if one is set in the preferences.
+    def _writeSliceTimings(self):
+        timings = self._slice_timings.toDict()
+        if not timings["stages"]:
+            return  # Nothing was sliced.
+        timings_json = json.dumps(timings, sort_keys = True)
+        Logger.log("d", "Slice timings: %s", timings_json)
+
+        file_name = Preferences.getInstance().getValue("backend/slice_timings_file")
+        if not file_name:
+            return
+        try:
+            with open(file_name, "a") as f:
+                f.write(timings_json + "\n")
+        except OSError:
+            Logger.logException("w", "Unable to write the slice timings to %s.", file_name)
 
     ##  Connect slice function to timer.
     def enableTimer(self):
@@ -639,13 +1004,17 @@ class CuraEngineBackend(QObject, Backend):
             self._change_timer.timeout.disconnect(self.slice)
 
     def _onPreferencesChanged(self, preference):
+        if preference == "backend/slice_cache_size":
+            self._slice_result_cache.setMaxEntries(int(Preferences.getInstance().getValue("backend/slice_cache_size")))
+        if preference == "backend/slice_cache_disk_space":
+            self._slice_result_cache.setMaxSize(int(Preferences.getInstance().getValue("backend/slice_cache_disk_space")) * 1024 * 1024)
         if preference != "general/auto_slice":
             return
         auto_slice = self.determineAutoSlicing()
         if auto_slice:
-            self._change_timer.start()
+            self._startChangeTimer()
 
     ##   Tickle the backend so in case of auto slicing, it starts the timer.
     def tickle(self):
         if self._use_timer:
-            self._change_timer.start()
+            self._startChangeTimer()
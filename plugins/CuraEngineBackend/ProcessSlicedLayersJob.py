@@ -2,6 +2,9 @@
 #Cura is released under the terms of the AGPLv3 or higher.
 
 import gc
+import threading
+from collections import deque
+from concurrent.futures import TimeoutError
 
 from UM.Job import Job
 from UM.Scene.Iterator.DepthFirstIterator import DepthFirstIterator
@@ -18,15 +21,30 @@ from UM.Logger import Logger
 from UM.Math.Vector import Vector
 
 from cura.Settings.ExtruderManager import ExtruderManager
-from cura import LayerDataBuilder
+from cura import ChunkedLayerData
+from cura import Layer
+from cura import LayerDataStorage
+from cura import LayerProcessingPool
 from cura import LayerDataDecorator
-from cura import LayerPolygon
 
 import numpy
-from time import time
+from time import sleep, time
 catalog = i18nCatalog("cura")
 
 
+##  Get the data of a LayerOptimized message as plain Python objects, so it
+#   can be sent to another process or stored.
+#
+#   \param layer The LayerOptimized message.
+#   \return The arguments for Layer.fromPathSegments.
+def getLayerDescription(layer):
+    segments = []
+    for p in range(layer.repeatedMessageCount("path_segment")):
+        polygon = layer.getRepeatedMessage("path_segment", p)
+        segments.append((polygon.extruder, polygon.point_type, polygon.points, polygon.line_type, polygon.line_width))
+    return layer.id, layer.height, layer.thickness, segments
+
+
 ##  Return a 4-tuple with floats 0-1 representing the html color code
 #
 #   \param color_code html color code, i.e. "#FF0000" -> red
@@ -42,13 +60,58 @@ def colorCodeToRGBA(color_code):
 
 
 class ProcessSlicedLayersJob(Job):
-    def __init__(self, layers):
+    ##  Minimum time in seconds between two updates of the layer data in the
+    #   scene while the engine is still sending layers.
+    _streaming_update_interval = 1.0
+
+    ##  Longest pause in seconds after converting a layer in the background.
+    _background_max_pause = 0.05
+
+    ##  Creates a job that processes the layers sent by the engine.
+    #
+    #   \param layers The LayerOptimized messages received so far.
+    #   \param streaming Whether the engine is still slicing. If True, more
+    #   layers can be added with addLayer() until setSlicingFinished() is
+    #   called, and the layers that are processed so far are regularly shown
+    #   in the layer view.
+    #   \param background Whether the layers are processed while the layer
+    #   view is not active. The job then pauses after every layer, so it uses
+    #   at most about half of a processor core, until the layer view is
+    #   activated.
+    #   \param previous_job \type{ProcessSlicedLayersJob} A finished job that
+    #   processed other layers of the same slice. The layers are added to its
+    #   layer data instead of replacing it.
+    def __init__(self, layers, streaming = False, background = False, previous_job = None):
         super().__init__()
-        self._layers = layers
+        self._pending_layers = deque(layers)
+        self._new_layers_event = threading.Event()
+        self._streaming = streaming
+        self._slicing_finished = not streaming
         self._scene = Application.getInstance().getController().getScene()
         self._progress = None
         self._abort_requested = False
 
+        self._processed_layers = {}  # Converted layers by the layer number of the engine.
+        self._changed_layers = set()  # Layer numbers of the engine that are not yet in the layer data.
+        self._min_layer_number = 0
+        self._layer_data = None
+        self._layer_data_min_layer_number = 0  # The minimum layer number that the layer data was built with.
+        self._layer_data_node = None
+        self._material_color_map = None
+        self._line_type_brightness = 1.0
+        self._pool = None
+        self._layer_processing_time = 0.0  # Time spent converting layers, in seconds.
+        self._background = background
+        self._background_pause_time = 0.0  # Time spent pausing in the background, in seconds.
+
+        if previous_job is not None:
+            # The layers of the previous job are in its layer data already. Its lowest layer is processed first, so the layer numbers don't shift.
+            self._min_layer_number = previous_job._min_layer_number
+            self._layer_data = previous_job._layer_data
+            self._layer_data_min_layer_number = previous_job._layer_data_min_layer_number
+            self._layer_data_node = previous_job._layer_data_node
+        self._mesh_build_time = 0.0  # Time spent building the layer mesh, in seconds.
+
     ##  Aborts the processing of layers.
     #
     #   This abort is made on a best-effort basis, meaning that the actual
@@ -57,10 +120,41 @@ class ProcessSlicedLayersJob(Job):
     #   that the abort will stop the job any time soon or even at all.
     def abort(self):
         self._abort_requested = True
+        self._new_layers_event.set()
+
+    ##  Adds a layer that was received from the engine while this job is
+    #   already running.
+    #
+    #   \param layer The LayerOptimized message received from the engine.
+    def addLayer(self, layer):
+        self._pending_layers.append(layer)
+        self._new_layers_event.set()
+
+    ##  Indicates that the engine is done slicing, so no more layers will be
+    #   added and the job can finish once all pending layers are processed.
+    def setSlicingFinished(self):
+        self._slicing_finished = True
+        self._new_layers_event.set()
+
+    ##  Whether this job is still accepting new layers from the engine.
+    def isWaitingForLayers(self):
+        return not self._slicing_finished and not self._abort_requested
+
+    def isAborted(self):
+        return self._abort_requested
+
+    ##  Get how long converting the layers took, in seconds. Time spent
+    #   waiting for the engine to send more layers is not included.
+    def getLayerProcessingTime(self):
+        return self._layer_processing_time - self._background_pause_time
+
+    ##  Get how long building the layer mesh took, in seconds.
+    def getMeshBuildTime(self):
+        return self._mesh_build_time
 
     def run(self):
         start_time = time()
-        if Application.getInstance().getController().getActiveView().getPluginId() == "LayerView":
+        if Application.getInstance().getController().getActiveView().getPluginId() == "LayerView" and self._slicing_finished:
             self._progress = Message(catalog.i18nc("@info:status", "Processing Layers"), 0, False, -1)
             self._progress.show()
             Job.yieldThread()
@@ -71,102 +165,217 @@ class ProcessSlicedLayersJob(Job):
 
         Application.getInstance().getController().activeViewChanged.connect(self._onActiveViewChanged)
 
-        new_node = SceneNode()
+        if self._layer_data_node is None:
+            ## Remove old layer data (if any)
+            for node in DepthFirstIterator(self._scene.getRoot()):
+                if node.callDecoration("getLayerData"):
+                    node.getParent().removeChild(node)
+                    break
+                if self._abort_requested:
+                    if self._progress:
+                        self._progress.hide()
+                    return
+
+            # Force garbage collection.
+            # For some reason, Python has a tendency to keep the layer data
+            # in memory longer than needed. Forcing the GC to run here makes
+            # sure any old layer data is really cleaned up before adding new.
+            gc.collect()
+
+        self._material_color_map = self._getMaterialColorMap()
 
-        ## Remove old layer data (if any)
-        for node in DepthFirstIterator(self._scene.getRoot()):
-            if node.callDecoration("getLayerData"):
-                node.getParent().removeChild(node)
+        # We have to scale the colors for compatibility mode
+        if OpenGLContext.isLegacyOpenGL() or bool(Preferences.getInstance().getValue("view/force_layer_view_compatibility_mode")):
+            self._line_type_brightness = 0.5  # for compatibility mode
+        else:
+            self._line_type_brightness = 1.0
+
+        self._pool = LayerProcessingPool.LayerProcessingPool.getInstance()
+        self._pool.setProcessCount(int(Preferences.getInstance().getValue("backend/layer_processing_processes")))
+
+        last_update_time = time()
+        update_interval = self._streaming_update_interval
+        while True:
+            self._new_layers_event.clear()
+            slicing_finished = self._slicing_finished  # Read before emptying the queue, so no layer can be missed.
+
+            processing_start_time = time()
+            while self._pending_layers:
+                if not self._background and self._pool.isEnabled() and len(self._pending_layers) >= 2 * self._pool.MinimumChunkSize:
+                    self._processPendingLayersInPool()
+                else:
+                    layer_start_time = time()
+                    layer = self._pending_layers.popleft()
+                    self._addProcessedLayer(layer.id, self._processLayer(layer))
+                    if self._background:
+                        pause = min(time() - layer_start_time, self._background_max_pause)
+                        sleep(pause)
+                        self._background_pause_time += pause
+                    else:
+                        Job.yieldThread()
+
+                if self._abort_requested:
+                    if self._progress:
+                        self._progress.hide()
+                    return
+                self._updateProgress()
+            self._layer_processing_time += time() - processing_start_time
+
+            if slicing_finished:
                 break
+
+            # Show what we have so far, but don't spend more time rebuilding the mesh than on processing the layers.
+            if self._processed_layers and time() - last_update_time > update_interval:
+                update_start_time = time()
+                self._updateLayerData()
+                last_update_time = time()
+                update_interval = max(self._streaming_update_interval, 4 * (last_update_time - update_start_time))
+
+            self._new_layers_event.wait(update_interval)
             if self._abort_requested:
                 if self._progress:
                     self._progress.hide()
                 return
 
-        # Force garbage collection.
-        # For some reason, Python has a tendency to keep the layer data
-        # in memory longer than needed. Forcing the GC to run here makes
-        # sure any old layer data is really cleaned up before adding new.
-        gc.collect()
-
-        mesh = MeshData()
-        layer_data = LayerDataBuilder.LayerDataBuilder()
-        layer_count = len(self._layers)
-
-        # Find the minimum layer number
-        # When using a raft, the raft layers are sent as layers < 0. Instead of allowing layers < 0, we
-        # instead simply offset all other layers so the lowest layer is always 0.
-        min_layer_number = 0
-        for layer in self._layers:
-            if layer.id < min_layer_number:
-                min_layer_number = layer.id
+        # We are done processing all the layers we got from the engine, now create a mesh out of the data
+        self._updateLayerData()
 
-        current_layer = 0
+        if self._abort_requested:
+            if self._progress:
+                self._progress.hide()
+            return
 
-        for layer in self._layers:
-            abs_layer_number = layer.id + abs(min_layer_number)
+        if self._progress:
+            self._progress.setProgress(100)
 
-            layer_data.addLayer(abs_layer_number)
-            this_layer = layer_data.getLayer(abs_layer_number)
-            layer_data.setLayerHeight(abs_layer_number, layer.height)
+        view = Application.getInstance().getController().getActiveView()
+        if view.getPluginId() == "LayerView":
+            view.resetLayerData()
 
-            for p in range(layer.repeatedMessageCount("path_segment")):
-                polygon = layer.getRepeatedMessage("path_segment", p)
+        if self._progress:
+            self._progress.hide()
 
-                extruder = polygon.extruder
+        # Clear the unparsed layers. This saves us a bunch of memory if the Job does not get destroyed.
+        self._pending_layers.clear()
+        self._processed_layers = {}
 
-                line_types = numpy.fromstring(polygon.line_type, dtype="u1")  # Convert bytearray to numpy array
-                line_types = line_types.reshape((-1,1))
+        Logger.log("d", "Processing layers took %s seconds", time() - start_time)
 
-                points = numpy.fromstring(polygon.points, dtype="f4")  # Convert bytearray to numpy array
-                if polygon.point_type == 0: # Point2D
-                    points = points.reshape((-1,2))  # We get a linear list of pairs that make up the points, so make numpy interpret them correctly.
-                else:  # Point3D
-                    points = points.reshape((-1,3))
+    ##  Converts a LayerOptimized message from the engine to a layer.
+    #
+    #   \param layer The LayerOptimized message.
+    #   \return \type{Layer} The layer with its polygons.
+    def _processLayer(self, layer):
+        return Layer.Layer.fromPathSegments(*getLayerDescription(layer))
 
-                line_widths = numpy.fromstring(polygon.line_width, dtype="f4")  # Convert bytearray to numpy array
-                line_widths = line_widths.reshape((-1,1))  # We get a linear list of pairs that make up the points, so make numpy interpret them correctly.
+    ##  Converts all pending layers in the worker processes of the layer
+    #   processing pool.
+    #
+    #   If that fails, the layers that are not converted yet are put back so
+    #   they are processed in this thread, and the pool is not used anymore.
+    def _processPendingLayersInPool(self):
+        layers = []
+        while self._pending_layers:
+            layers.append(self._pending_layers.popleft())
+        descriptions = [getLayerDescription(layer) for layer in layers]
+
+        layer_index = 0
+        futures = []
+        try:
+            futures = self._pool.submit(descriptions)
+            for future in futures:
+                while True:
+                    try:
+                        processed_layers = future.result(timeout = 0.1)
+                        break
+                    except TimeoutError:
+                        if self._abort_requested:
+                            for remaining_future in futures:
+                                remaining_future.cancel()
+                            return
+                for processed_layer in processed_layers:
+                    self._addProcessedLayer(layers[layer_index].id, processed_layer)
+                    layer_index += 1
+                self._updateProgress()
+        except Exception:
+            Logger.logException("w", "Unable to process layers in worker processes, processing them in Cura instead.")
+            for remaining_future in futures:
+                remaining_future.cancel()
+            self._pool.setProcessCount(0)
+            self._pending_layers.extendleft(reversed(layers[layer_index:]))
+
+    ##  Stores a converted layer, so it is added to the layer data.
+    #
+    #   \param layer_number The number of the layer as sent by the engine.
+    #   \param layer \type{Layer} The converted layer.
+    def _addProcessedLayer(self, layer_number, layer):
+        self._processed_layers[layer_number] = layer
+        self._changed_layers.add(layer_number)
+        # When using a raft, the raft layers are sent as layers < 0. Instead of allowing layers < 0, we
+        # instead simply offset all other layers so the lowest layer is always 0.
+        self._min_layer_number = min(self._min_layer_number, layer_number)
 
-                # In the future, line_thicknesses should be given by CuraEngine as well.
-                # Currently the infill layer thickness also translates to line width
-                line_thicknesses = numpy.zeros(line_widths.shape, dtype="f4")
-                line_thicknesses[:] = layer.thickness / 1000  # from micrometer to millimeter
+    def _updateProgress(self):
+        if self._progress:
+            layer_count = len(self._processed_layers) + len(self._pending_layers)
+            self._progress.setProgress(len(self._processed_layers) / layer_count * 99)
 
-                # Create a new 3D-array, copy the 2D points over and insert the right height.
-                # This uses manual array creation + copy rather than numpy.insert since this is
-                # faster.
-                new_points = numpy.empty((len(points), 3), numpy.float32)
-                if polygon.point_type == 0:  # Point2D
-                    new_points[:, 0] = points[:, 0]
-                    new_points[:, 1] = layer.height / 1000  # layer height value is in backend representation
-                    new_points[:, 2] = -points[:, 1]
-                else: # Point3D
-                    new_points[:, 0] = points[:, 0]
-                    new_points[:, 1] = points[:, 2]
-                    new_points[:, 2] = -points[:, 1]
+    ##  Adds the layers that were processed since the last call to the layer
+    #   mesh and shows it in the scene.
+    #
+    #   The first time this is called a new scene node is created for the
+    #   layer data. Only the chunks of the layer data that received new layers
+    #   are rebuilt by later calls.
+    def _updateLayerData(self):
+        if self._layer_data is None:
+            storage = None
+            memory_budget = int(Preferences.getInstance().getValue("backend/layer_data_memory_budget"))
+            if memory_budget > 0:
+                storage = LayerDataStorage.LayerDataStorage(memory_budget * 1024 * 1024)
+            decimate = bool(Preferences.getInstance().getValue("view/layer_view_level_of_detail"))
+            self._layer_data = ChunkedLayerData.ChunkedLayerData(self._material_color_map, self._line_type_brightness, storage = storage, decimate = decimate)
+
+        if self._min_layer_number != self._layer_data_min_layer_number:
+            # Raft layers came in after the other layers, so all layers shift up.
+            self._layer_data.clear()
+            self._changed_layers = set(self._processed_layers.keys())
+            self._layer_data_min_layer_number = self._min_layer_number
+        for layer_number in self._changed_layers:
+            self._layer_data.setLayer(layer_number - self._min_layer_number, self._processed_layers[layer_number])
+        self._changed_layers = set()
+        build_start_time = time()
+        self._layer_data.update()
+        self._mesh_build_time += time() - build_start_time
 
-                this_poly = LayerPolygon.LayerPolygon(extruder, line_types, new_points, line_widths, line_thicknesses)
-                this_poly.buildCache()
+        if self._abort_requested:
+            return
 
-                this_layer.polygons.append(this_poly)
+        if self._layer_data_node is None:
+            new_node = SceneNode()
 
-                Job.yieldThread()
-            Job.yieldThread()
-            current_layer += 1
-            progress = (current_layer / layer_count) * 99
-            # TODO: Rebuild the layer data mesh once the layer has been processed.
-            # This needs some work in LayerData so we can add the new layers instead of recreating the entire mesh.
+            # Add LayerDataDecorator to scene node to indicate that the node has layer data
+            decorator = LayerDataDecorator.LayerDataDecorator()
+            decorator.setLayerData(self._layer_data)
+            new_node.addDecorator(decorator)
 
-            if self._abort_requested:
-                if self._progress:
-                    self._progress.hide()
-                return
-            if self._progress:
-                self._progress.setProgress(progress)
+            new_node.setMeshData(MeshData())
+            # Set build volume as parent, the build volume can move as a result of raft settings.
+            # It makes sense to set the build volume as parent: the print is actually printed on it.
+            new_node_parent = Application.getInstance().getBuildVolume()
+            new_node.setParent(new_node_parent)  # Note: After this we can no longer abort!
 
-        # We are done processing all the layers we got from the engine, now create a mesh out of the data
+            settings = Application.getInstance().getGlobalContainerStack()
+            if not settings.getProperty("machine_center_is_zero", "value"):
+                new_node.setPosition(Vector(-settings.getProperty("machine_width", "value") / 2, 0.0, settings.getProperty("machine_depth", "value") / 2))
+            self._layer_data_node = new_node
+        else:
+            # Let the layer view know that there are new layers to show.
+            self._layer_data_node.childrenChanged.emit(self._layer_data_node)
 
-        # Find out colors per extruder
+    ##  Find out the colors per extruder.
+    #
+    #   \return \type{numpy.ndarray} [r, g, b, a] for each extruder row.
+    def _getMaterialColorMap(self):
         global_container_stack = Application.getInstance().getGlobalContainerStack()
         manager = ExtruderManager.getInstance()
         extruders = list(manager.getMachineExtruders(global_container_stack.getId()))
@@ -183,51 +392,12 @@ class ProcessSlicedLayersJob(Job):
             color_code = global_container_stack.material.getMetaDataEntry("color_code", default="#e0e000")
             color = colorCodeToRGBA(color_code)
             material_color_map[0, :] = color
-
-        # We have to scale the colors for compatibility mode
-        if OpenGLContext.isLegacyOpenGL() or bool(Preferences.getInstance().getValue("view/force_layer_view_compatibility_mode")):
-            line_type_brightness = 0.5  # for compatibility mode
-        else:
-            line_type_brightness = 1.0
-        layer_mesh = layer_data.build(material_color_map, line_type_brightness)
-
-        if self._abort_requested:
-            if self._progress:
-                self._progress.hide()
-            return
-
-        # Add LayerDataDecorator to scene node to indicate that the node has layer data
-        decorator = LayerDataDecorator.LayerDataDecorator()
-        decorator.setLayerData(layer_mesh)
-        new_node.addDecorator(decorator)
-
-        new_node.setMeshData(mesh)
-        # Set build volume as parent, the build volume can move as a result of raft settings.
-        # It makes sense to set the build volume as parent: the print is actually printed on it.
-        new_node_parent = Application.getInstance().getBuildVolume()
-        new_node.setParent(new_node_parent)  # Note: After this we can no longer abort!
-
-        settings = Application.getInstance().getGlobalContainerStack()
-        if not settings.getProperty("machine_center_is_zero", "value"):
-            new_node.setPosition(Vector(-settings.getProperty("machine_width", "value") / 2, 0.0, settings.getProperty("machine_depth", "value") / 2))
-
-        if self._progress:
-            self._progress.setProgress(100)
-
-        view = Application.getInstance().getController().getActiveView()
-        if view.getPluginId() == "LayerView":
-            view.resetLayerData()
-
-        if self._progress:
-            self._progress.hide()
-
-        # Clear the unparsed layers. This saves us a bunch of memory if the Job does not get destroyed.
-        self._layers = None
-
-        Logger.log("d", "Processing layers took %s seconds", time() - start_time)
+        return material_color_map
 
     def _onActiveViewChanged(self):
-        if self.isRunning():
+        if Application.getInstance().getController().getActiveView().getPluginId() == "LayerView":
+            self._background = False  # The user is waiting for the layers now.
+        if self.isRunning() and self._slicing_finished:
             if Application.getInstance().getController().getActiveView().getPluginId() == "LayerView":
                 if not self._progress:
                     self._progress = Message(catalog.i18nc("@info:status", "Processing Layers"), 0, False, 0)
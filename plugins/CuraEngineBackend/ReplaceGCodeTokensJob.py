@@ -0,0 +1,29 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Job import Job
+
+
+##  Job that fills in the placeholders in the g-code of a slice, such as
+#   {print_time}, so this doesn't block the interface for large prints.
+#
+#   The placeholders are filled in in a copy of the g-code, which is the result
+#   of the job. The g-code in the scene can be read by the main thread at any
+#   time, so it must only be replaced by the copy on the main thread.
+class ReplaceGCodeTokensJob(Job):
+    ##  \param gcode_buffer \type{GCodeBuffer} The g-code to fill in the
+    #   placeholders of. It is not changed.
+    #   \param replacements Dictionary of placeholder names to their values.
+    #   These must be computed beforehand, on the main thread.
+    def __init__(self, gcode_buffer, replacements):
+        super().__init__()
+        self._gcode_buffer = gcode_buffer
+        self._replacements = replacements
+
+    def getGCodeBuffer(self):
+        return self._gcode_buffer
+
+    def run(self):
+        gcode_buffer = self._gcode_buffer.copy()
+        gcode_buffer.replaceTokens(self._replacements)
+        self.setResult(gcode_buffer)
@@ -0,0 +1,116 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import threading
+
+from cura.Settings.SettingDependencies import getDependentKeys
+
+
+##  Keeps the setting properties that were sent to the engine in the previous
+#   slice, so only the settings that changed since then have to be evaluated
+#   again.
+#
+#   The engine needs all settings for every slice, so the complete message is
+#   still built. Evaluating a setting and converting its value to a string is
+#   what takes time, and that is what this snapshot saves.
+#
+#   Settings that change are reported with settingChanged(). They are removed
+#   from the snapshot, together with every setting that depends on them, when
+#   the next slice starts. If the containers of a stack change, any setting may
+#   have changed and the whole snapshot must be invalidated.
+class SettingsSnapshot:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changed_keys = set()
+        self._stacks = {}  # Per stack ID, a dict of (key, property) tuples to property values.
+        self._all_keys = {}  # Per stack ID, the result of getAllKeys().
+        self._generation = 0  # Increased on every invalidation, so values evaluated before it are not stored.
+
+        self._evaluated_count = 0
+        self._reused_count = 0
+
+    ##  Mark a setting as changed. It is evaluated again in the next slice.
+    #
+    #   \param key The key of the setting that changed.
+    def settingChanged(self, key):
+        with self._lock:
+            self._changed_keys.add(key)
+
+    ##  Forget all stored properties.
+    def invalidate(self):
+        with self._lock:
+            self._changed_keys.clear()
+            self._stacks.clear()
+            self._all_keys.clear()
+            self._generation += 1
+
+    ##  Remove the settings that changed, and all settings depending on them,
+    #   from the snapshot. This should be called when a slice starts.
+    #
+    #   \param stack A stack to find the setting definitions in.
+    def update(self, stack):
+        with self._lock:
+            changed_keys = self._changed_keys
+            self._changed_keys = set()
+            self._evaluated_count = 0
+            self._reused_count = 0
+
+        changed_keys = getDependentKeys(stack, changed_keys)
+
+        with self._lock:
+            for properties in self._stacks.values():
+                for key, property_name in list(properties.keys()):
+                    if key in changed_keys:
+                        del properties[(key, property_name)]
+
+    ##  Get the keys of all settings in a stack.
+    def getAllKeys(self, stack):
+        stack_id = stack.getId()
+        with self._lock:
+            keys = self._all_keys.get(stack_id)
+        if keys is None:
+            keys = stack.getAllKeys()
+            with self._lock:
+                self._all_keys[stack_id] = keys
+        return keys
+
+    ##  Get a property of a setting in a stack.
+    #
+    #   \param stack The stack to get the property from.
+    #   \param key The key of the setting.
+    #   \param property_name The name of the property.
+    #   \return The property as it was evaluated in the previous slice if the
+    #   setting did not change, or the current property otherwise.
+    def getProperty(self, stack, key, property_name):
+        return self._getOrEvaluate(stack, key, property_name, lambda: stack.getProperty(key, property_name))
+
+    ##  Get the value of a setting as it is sent to the engine.
+    #
+    #   \return \type{bytes} The value, converted to a string and encoded.
+    def getEncodedValue(self, stack, key):
+        return self._getOrEvaluate(stack, key, "encoded_value", lambda: str(self.getProperty(stack, key, "value")).encode("utf-8"))
+
+    ##  Get how many properties were evaluated and how many were reused since
+    #   the last update.
+    #
+    #   \return (evaluated, reused) tuple.
+    def getStatistics(self):
+        with self._lock:
+            return self._evaluated_count, self._reused_count
+
+    def _getOrEvaluate(self, stack, key, property_name, evaluate):
+        stack_id = stack.getId()
+        with self._lock:
+            properties = self._stacks.setdefault(stack_id, {})
+            if (key, property_name) in properties:
+                self._reused_count += 1
+                return properties[(key, property_name)]
+            generation = self._generation
+
+        value = evaluate()
+
+        with self._lock:
+            self._evaluated_count += 1
+            if generation == self._generation:
+                properties[(key, property_name)] = value
+        return value
@@ -0,0 +1,278 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import os
+import pickle
+import queue
+import tempfile
+import threading
+
+from UM.Job import Job
+from UM.Logger import Logger
+
+from . import ProcessSlicedLayersJob
+
+
+##  The output of the engine for a single slice, as stored in the slice result
+#   cache.
+class SliceResult:
+    def __init__(self):
+        self.gcode_list = []  # The g-code chunks, before the print information is filled in.
+        self.layers = []  # The LayerOptimized messages, or their descriptions once loaded or stored.
+        self.feature_times = None  # The print time per feature.
+        self.material_amounts = None  # The material amount per extruder.
+
+    ##  Get the layers in a form that ProcessSlicedLayersJob can process.
+    def getLayerMessages(self):
+        return [layer if not isinstance(layer, tuple) else _StoredLayerMessage(layer) for layer in self.layers]
+
+
+##  Stores the results of slices on disk, so a scene that was sliced before
+#   does not need to be sliced again.
+#
+#   Results are stored under a fingerprint of everything that the result
+#   depends on: the meshes, their transformations, all settings and the
+#   engine. Only the most recently used results are kept, up to a number of
+#   results and a total size.
+#
+#   The time and date in the start and end g-code are not part of a result.
+#   They are placeholders in the stored g-code, which are filled in like the
+#   other print information when the result is used.
+#
+#   A stored result is a series of pickles: a header with the version, one
+#   pickle per layer and finally the g-code and print estimates. This way a
+#   result can be written one layer at a time while the engine sends it, see
+#   SliceResultWriter, without keeping all layers in memory for the cache.
+class SliceResultCache:
+    ##  Version of the stored files. Files of a different version are ignored.
+    Version = 2
+
+    ##  \param directory The directory to store the results in.
+    #   \param max_entries The number of results to keep. 0 disables the cache.
+    #   \param max_size The number of bytes that the results may take on disk
+    #   together. 0 disables the cache.
+    def __init__(self, directory, max_entries, max_size):
+        self._directory = directory
+        self._max_entries = max_entries
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    def setMaxEntries(self, max_entries):
+        self._max_entries = max_entries
+        self._prune()
+
+    def setMaxSize(self, max_size):
+        self._max_size = max_size
+        self._prune()
+
+    def isEnabled(self):
+        return self._max_entries > 0 and self._max_size > 0
+
+    ##  Whether a result is stored for a fingerprint.
+    def contains(self, fingerprint):
+        return self.isEnabled() and os.path.exists(self._getPath(fingerprint))
+
+    ##  Load the result of a slice.
+    #
+    #   \param fingerprint The fingerprint of the slice.
+    #   \return \type{SliceResult} The result, or None if it could not be
+    #   loaded.
+    def load(self, fingerprint):
+        path = self._getPath(fingerprint)
+        result = SliceResult()
+        try:
+            with open(path, "rb") as f:
+                header = pickle.load(f)
+                if header.get("version") != self.Version:
+                    return None
+                while True:
+                    kind, value = pickle.load(f)
+                    if kind == "layer":
+                        result.layers.append(value)
+                    elif kind == "end":
+                        break
+            os.utime(path)  # Mark it as recently used.
+        except FileNotFoundError:
+            return None
+        except Exception:
+            Logger.logException("w", "Unable to load cached slice result %s, removing it.", path)
+            self._remove(path)
+            return None
+
+        result.gcode_list = value["gcode_list"]
+        result.feature_times = value["feature_times"]
+        result.material_amounts = value["material_amounts"]
+        return result
+
+    ##  Store the result of a slice.
+    #
+    #   \param fingerprint The fingerprint of the slice.
+    #   \param result \type{SliceResult} The result to store.
+    def store(self, fingerprint, result):
+        items = [("layer", layer) for layer in result.layers]
+        items.append(("end", {
+            "gcode_list": list(result.gcode_list),
+            "feature_times": result.feature_times,
+            "material_amounts": result.material_amounts
+        }))
+        self._write(fingerprint, iter(items))
+
+    ##  Write a result to a file.
+    #
+    #   \param fingerprint The fingerprint of the slice.
+    #   \param items Iterator over ("layer", layer) tuples with the
+    #   LayerOptimized messages or their descriptions, followed by an
+    #   ("end", dictionary) tuple with the rest of the result. If the iterator
+    #   stops or gives ("abort", None) before the end, nothing is stored.
+    def _write(self, fingerprint, items):
+        if not self.isEnabled():
+            for _ in items:  # Don't block the writer that fills the items.
+                pass
+            return
+
+        path = self._getPath(fingerprint)
+        temporary_path = None
+        try:
+            os.makedirs(self._directory, exist_ok = True)
+            with tempfile.NamedTemporaryFile(dir = self._directory, suffix = ".tmp", delete = False) as f:
+                temporary_path = f.name
+                pickle.dump({"version": self.Version}, f, protocol = pickle.HIGHEST_PROTOCOL)
+                complete = False
+                for kind, value in items:
+                    if kind == "layer":
+                        # A separate pickle per layer, so the pickler doesn't keep a reference to all layers.
+                        pickle.dump(("layer", value if isinstance(value, tuple) else ProcessSlicedLayersJob.getLayerDescription(value)), f, protocol = pickle.HIGHEST_PROTOCOL)
+                    elif kind == "end":
+                        pickle.dump(("end", value), f, protocol = pickle.HIGHEST_PROTOCOL)
+                        complete = True
+                        break
+                    else:
+                        break
+            if not complete:
+                self._remove(temporary_path)
+                return
+            os.replace(temporary_path, path)
+        except Exception:
+            Logger.logException("w", "Unable to store slice result in %s.", path)
+            if temporary_path is not None:
+                self._remove(temporary_path)
+            return
+        self._prune()
+
+    def _getPath(self, fingerprint):
+        return os.path.join(self._directory, fingerprint + ".slice")
+
+    ##  Remove the least recently used results until at most max_entries are
+    #   left, which take at most max_size bytes.
+    def _prune(self):
+        with self._lock:
+            try:
+                file_names = [file_name for file_name in os.listdir(self._directory) if file_name.endswith(".slice")]
+            except OSError:
+                return
+            entries = []  # (modification time, size, path) of each result.
+            for file_name in file_names:
+                path = os.path.join(self._directory, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:  # Removed in the meantime, e.g. by another instance of Cura.
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            entries.sort(reverse = True)
+
+            total_size = 0
+            for index, (_, size, path) in enumerate(entries):
+                total_size += size
+                if index >= self._max_entries or total_size > self._max_size:
+                    self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+##  Job that loads a slice result from the cache in the background.
+class LoadSliceResultJob(Job):
+    def __init__(self, cache, fingerprint):
+        super().__init__()
+        self._cache = cache
+        self._fingerprint = fingerprint
+
+    def getFingerprint(self):
+        return self._fingerprint
+
+    def run(self):
+        self.setResult(self._cache.load(self._fingerprint))
+
+
+##  Writes the result of a slice to the cache in the background while the
+#   engine sends it.
+#
+#   Layers are written as soon as they are added, so the cache doesn't hold on
+#   to the layers of the slice. The result is only stored once finish() is
+#   called; abort() drops what was written.
+class SliceResultWriter:
+    ##  \param cache \type{SliceResultCache} The cache to store the result in.
+    #   \param fingerprint The fingerprint of the slice.
+    def __init__(self, cache, fingerprint):
+        self._queue = queue.Queue()
+        self._feature_times = None
+        self._material_amounts = None
+        self._thread = threading.Thread(target = cache._write, args = (fingerprint, iter(self._queue.get, None)), daemon = True)
+        self._thread.start()
+
+    ##  Add a layer of the result.
+    #
+    #   \param layer The LayerOptimized message received from the engine.
+    def addLayer(self, layer):
+        self._queue.put(("layer", layer))
+
+    ##  Set the print time per feature and the material amount per extruder.
+    def setPrintEstimates(self, feature_times, material_amounts):
+        self._feature_times = feature_times
+        self._material_amounts = material_amounts
+
+    ##  Store the result, now that all layers are added.
+    #
+    #   \param gcode_list The g-code chunks, before the print information is
+    #   filled in.
+    def finish(self, gcode_list):
+        self._queue.put(("end", {
+            "gcode_list": list(gcode_list),
+            "feature_times": self._feature_times,
+            "material_amounts": self._material_amounts
+        }))
+        self._queue.put(None)
+
+    ##  Drop the result, e.g. because the slice was cancelled.
+    def abort(self):
+        self._queue.put(("abort", None))
+        self._queue.put(None)
+
+    ##  Wait until the result is stored or dropped.
+    def join(self, timeout = None):
+        self._thread.join(timeout)
+
+
+##  A stored layer that can be processed like a LayerOptimized message.
+class _StoredLayerMessage:
+    def __init__(self, description):
+        self.id, self.height, self.thickness, segments = description
+        self._segments = [_StoredPathSegment(*segment) for segment in segments]
+
+    def repeatedMessageCount(self, field_name):
+        return len(self._segments)
+
+    def getRepeatedMessage(self, field_name, index):
+        return self._segments[index]
+
+
+class _StoredPathSegment:
+    def __init__(self, extruder, point_type, points, line_type, line_width):
+        self.extruder = extruder
+        self.point_type = point_type
+        self.points = points
+        self.line_type = line_type
+        self.line_width = line_width
@@ -0,0 +1,66 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import threading
+import time
+
+
+##  How long the stages of a single slice took, from preparing the slice
+#   message to showing the layers.
+#
+#   Stages that are performed more than once for a slice, such as building the
+#   layer mesh while the layers come in, are added up. Stages that were not
+#   performed, for instance because the layer view was not active, are left
+#   out.
+class SliceTimings:
+    ##  The stages, in the order they are performed.
+    #
+    #   - stack_validation: Checking the settings for errors.
+    #   - settings_serialization: Adding the settings to the slice message.
+    #   - mesh_serialization: Adding the meshes to the slice message.
+    #   - socket_send: Sending the slice message to the engine.
+    #   - engine_first_layer: From sending the slice message until the engine
+    #     sent the first layer.
+    #   - engine_total: From sending the slice message until the engine
+    #     finished slicing.
+    #   - layer_processing: Converting the layers of the engine for the layer
+    #     view.
+    #   - mesh_build: Building the layer view mesh from the converted layers.
+    #   - gpu_upload: Drawing the layer view mesh for the first time, which
+    #     uploads it to the graphics card.
+    Stages = ("stack_validation", "settings_serialization", "mesh_serialization", "socket_send", "engine_first_layer", "engine_total", "layer_processing", "mesh_build", "gpu_upload")
+
+    def __init__(self):
+        self._start_time = time.time()
+        self._stage_times = {}
+        self._from_cache = False
+        self._lock = threading.Lock()
+
+    ##  Add time spent on a stage.
+    #
+    #   \param stage The name of the stage, one of Stages.
+    #   \param seconds The time spent on the stage.
+    def addStageTime(self, stage, seconds):
+        with self._lock:
+            self._stage_times[stage] = self._stage_times.get(stage, 0.0) + seconds
+
+    def hasStage(self, stage):
+        return stage in self._stage_times
+
+    ##  Get the time spent on each stage that was performed, in seconds.
+    def getStageTimes(self):
+        with self._lock:
+            return {stage: self._stage_times[stage] for stage in self.Stages if stage in self._stage_times}
+
+    ##  Mark that the result of the slice was loaded from the slice result
+    #   cache instead of being sliced by the engine.
+    def setFromCache(self, from_cache):
+        self._from_cache = from_cache
+
+    ##  Get the timings as a dictionary that can be serialised to JSON.
+    def toDict(self):
+        return {
+            "start_time": self._start_time,
+            "from_cache": self._from_cache,
+            "stages": self.getStageTimes()
+        }
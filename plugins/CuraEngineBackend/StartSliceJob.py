@@ -2,9 +2,11 @@
 # Cura is released under the terms of the AGPLv3 or higher.
 
 import numpy
-from string import Formatter
 from enum import IntEnum
+import hashlib
+import threading
 import time
+import weakref
 
 from UM.Job import Job
 from UM.Application import Application
@@ -13,11 +15,14 @@ from UM.Logger import Logger
 from UM.Scene.SceneNode import SceneNode
 from UM.Scene.Iterator.DepthFirstIterator import DepthFirstIterator
 
-from UM.Settings.Validator import ValidatorState
 from UM.Settings.SettingRelation import RelationType
 
 from cura.OneAtATimeIterator import OneAtATimeIterator
+from cura.SliceSettings import GCodeSettingKeys, GcodeStartEndFormatter, TimeSettingKeys, addComputedSettings
 from cura.Settings.ExtruderManager import ExtruderManager
+from cura.Settings.ValidationStateIndex import ValidationStateIndex
+
+from .SettingsSnapshot import SettingsSnapshot
 
 class StartJobResult(IntEnum):
     Finished = 1
@@ -28,18 +33,78 @@ class StartJobResult(IntEnum):
     BuildPlateError = 6
 
 
-##  Formatter class that handles token expansion in start/end gcod
-class GcodeStartEndFormatter(Formatter):
-    def get_value(self, key, args, kwargs):  # [CodeStyle: get_value is an overridden function from the Formatter class]
-        if isinstance(key, str):
-            try:
-                return kwargs[key]
-            except KeyError:
-                Logger.log("w", "Unable to replace '%s' placeholder in start/end gcode", key)
-                return "{" + key + "}"
-        else:
-            Logger.log("w", "Incorrectly formatted placeholder '%s' in start/end gcode", key)
-            return "{" + str(key) + "}"
+##  Keeps the mesh data that was sent to the engine for each mesh, so it does
+#   not need to be computed again if neither the mesh nor its transformation
+#   changed since the previous slice.
+#
+#   Mesh data is never modified in place, so the mesh data object itself
+#   identifies the mesh. Entries are removed when the mesh data is deleted.
+class MeshPayloadCache:
+    def __init__(self):
+        self._entries = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    ##  Get the payload that was stored for a mesh.
+    #
+    #   \param mesh_data \type{MeshData} The mesh.
+    #   \param transformation \type{numpy.ndarray} The world transformation
+    #   matrix the payload must have been computed with.
+    #   \return (vertices, digest) tuple, or None if no matching payload is
+    #   stored.
+    def get(self, mesh_data, transformation):
+        with self._lock:
+            entry = self._entries.get(mesh_data)
+        if entry is None or entry[0] != transformation.tobytes():
+            return None
+        return entry[1]
+
+    ##  Store the payload for a mesh, replacing the payload of any previous
+    #   transformation.
+    def put(self, mesh_data, transformation, payload):
+        for array in payload:
+            if isinstance(array, numpy.ndarray):
+                array.flags.writeable = False
+        with self._lock:
+            self._entries[mesh_data] = (transformation.tobytes(), payload)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+##  The parts of a scene node that end up in the slice message: its mesh, its
+#   place in the scene and its per-object settings.
+#
+#   Changes of the values of the settings below the per-object settings are
+#   handled by the back-end itself, so they are not part of the state.
+class SlicedNodeState:
+    ##  Records the current state of a node.
+    #
+    #   \param node \type{SceneNode} The node.
+    def __init__(self, node):
+        self._mesh_data = node.getMeshData()
+        self._transformation = node.getWorldTransformation().getData().tobytes()
+        self._parent = node.getParent()
+        self._stack = node.callDecoration("getStack")
+        self._next_stack = None  # The extruder stack that the object is printed with.
+        self._settings = None  # The per-object settings, as (key, value) pairs.
+        if self._stack is not None:
+            self._next_stack = self._stack.getNextStack()
+            top = self._stack.getTop()
+            self._settings = sorted((key, str(top.getProperty(key, "value"))) for key in top.getAllKeys())
+
+    ##  Whether a node would be sliced the same as when this state was
+    #   recorded.
+    #
+    #   \param node \type{SceneNode} The node that this is the state of.
+    def isUnchanged(self, node):
+        if node.getMeshData() is not self._mesh_data or node.getParent() is not self._parent or node.callDecoration("getStack") is not self._stack:
+            return False
+        if node.getWorldTransformation().getData().tobytes() != self._transformation:
+            return False
+        if self._stack is None:
+            return True
+        return self._stack.getNextStack() is self._next_stack and SlicedNodeState(node)._settings == self._settings
 
 
 ##  Job class that builds up the message of scene data to send to CuraEngine.
@@ -52,28 +117,72 @@ class StartSliceJob(Job):
     #   g-code in the volume of the mesh.
     _not_printed_mesh_settings = {"anti_overhang_mesh", "infill_mesh", "cutting_mesh"}
 
-    def __init__(self, slice_message):
+    ##  Converts from Y up axes to Z up axes. Equals a 90 degree rotation.
+    _y_up_to_z_up = numpy.array([[1, 0, 0], [0, 0, 1], [0, -1, 0]], dtype = numpy.float64)
+
+    ##  \param slice_message The Slice message to fill.
+    #   \param mesh_payload_cache \type{MeshPayloadCache} Optional cache of the
+    #   mesh data of previous slices.
+    #   \param settings_snapshot \type{SettingsSnapshot} Optional snapshot of
+    #   the settings of previous slices.
+    def __init__(self, slice_message, mesh_payload_cache = None, settings_snapshot = None):
         super().__init__()
 
         self._scene = Application.getInstance().getController().getScene()
         self._slice_message = slice_message
+        self._mesh_payload_cache = mesh_payload_cache
+        self._settings_snapshot = settings_snapshot if settings_snapshot is not None else SettingsSnapshot()
+        self._stage_times = {}  # Per stage of preparing the slice, how long it took in seconds.
+        self._fingerprint_parts = []
+        self._sliced_node_states = weakref.WeakKeyDictionary()  # Per node in the slice message, its SlicedNodeState.
         self._is_cancelled = False
 
     def getSliceMessage(self):
         return self._slice_message
 
+    ##  Get how long the stages of preparing the slice took.
+    #
+    #   \return \type{dict} The time in seconds of each stage that was
+    #   performed: "stack_validation", "settings_serialization" and
+    #   "mesh_serialization".
+    def getStageTimes(self):
+        return dict(self._stage_times)
+
+    ##  Get a fingerprint of everything that was put in the slice message: the
+    #   meshes, their settings and the global and extruder settings.
+    #
+    #   The current time and date are left out, so the same scene and settings
+    #   give the same fingerprint later on.
+    #
+    #   \return \type{str} A hexadecimal hash.
+    def getFingerprint(self):
+        fingerprint = hashlib.sha1()
+        # The order of the settings differs between runs, so sort them. Meshes are numbered to keep their order.
+        for part in sorted(self._fingerprint_parts):
+            fingerprint.update(str(len(part)).encode("utf-8"))
+            fingerprint.update(part)
+        return fingerprint.hexdigest()
+
+    ##  Get the state of the nodes that were put in the slice message.
+    #
+    #   \return \type{WeakKeyDictionary} Per node, its SlicedNodeState.
+    def getSlicedNodeStates(self):
+        return self._sliced_node_states
+
+    def _addToFingerprint(self, *parts):
+        self._fingerprint_parts.append(b"\0".join(part if isinstance(part, bytes) else str(part).encode("utf-8") for part in parts))
+
     ##  Check if a stack has any errors.
     ##  returns true if it has errors, false otherwise.
     def _checkStackForErrors(self, stack):
         if stack is None:
             return False
 
-        for key in stack.getAllKeys():
-            validation_state = stack.getProperty(key, "validationState")
-            if validation_state in (ValidatorState.Exception, ValidatorState.MaximumError, ValidatorState.MinimumError):
-                Logger.log("w", "Setting %s is not valid, but %s. Aborting slicing.", key, validation_state)
-                return True
-            Job.yieldThread()
+        # Per-object stacks are only checked for their own settings. The stacks below them were checked already.
+        error_keys = ValidationStateIndex.getInstance().getErrorKeys(stack, own_settings_only = True)
+        if error_keys:
+            Logger.log("w", "Settings %s are not valid. Aborting slicing.", ", ".join(sorted(error_keys)))
+            return True
         return False
 
     ##  Runs the job that initiates the slicing.
@@ -83,6 +192,7 @@ class StartSliceJob(Job):
             self.setResult(StartJobResult.Error)
             return
 
+        validation_start_time = time.time()
         # Don't slice if there is a setting with an error value.
         if Application.getInstance().getMachineManager().stacksHaveErrors:
             self.setResult(StartJobResult.SettingError)
@@ -107,6 +217,7 @@ class StartSliceJob(Job):
             if self._checkStackForErrors(node.callDecoration("getStack")):
                 self.setResult(StartJobResult.SettingError)
                 return
+        self._stage_times["stack_validation"] = time.time() - validation_start_time
 
         with self._scene.getSceneLock():
             # Remove old layer data.
@@ -155,6 +266,9 @@ class StartSliceJob(Job):
                 self.setResult(StartJobResult.NothingToSlice)
                 return
 
+            settings_start_time = time.time()
+            self._settings_snapshot.update(stack)
+
             self._buildGlobalSettingsMessage(stack)
             self._buildGlobalInheritsStackMessage(stack)
 
@@ -166,38 +280,28 @@ class StartSliceJob(Job):
             else:
                 self._buildExtruderMessageFromGlobalStack(stack)
 
-            for group in object_groups:
+            self._stage_times["settings_serialization"] = time.time() - settings_start_time
+            evaluated_count, reused_count = self._settings_snapshot.getStatistics()
+            Logger.log("d", "Building the settings took %.3f seconds. %s setting properties were evaluated, %s were reused from the previous slice.", self._stage_times["settings_serialization"], evaluated_count, reused_count)
+
+            mesh_start_time = time.time()
+            for group_index, group in enumerate(object_groups):
                 group_message = self._slice_message.addRepeatedMessage("object_lists")
                 if group[0].getParent().callDecoration("isGroup"):
-                    self._handlePerObjectSettings(group[0].getParent(), group_message)
-                for object in group:
-                    mesh_data = object.getMeshData()
-                    rot_scale = object.getWorldTransformation().getTransposed().getData()[0:3, 0:3]
-                    translate = object.getWorldTransformation().getData()[:3, 3]
-
-                    # This effectively performs a limited form of MeshData.getTransformed that ignores normals.
-                    verts = mesh_data.getVertices()
-                    verts = verts.dot(rot_scale)
-                    verts += translate
-
-                    # Convert from Y up axes to Z up axes. Equals a 90 degree rotation.
-                    verts[:, [1, 2]] = verts[:, [2, 1]]
-                    verts[:, 1] *= -1
-
+                    self._handlePerObjectSettings(group[0].getParent(), group_message, ("group", group_index))
+                for object_index, object in enumerate(group):
                     obj = group_message.addRepeatedMessage("objects")
                     obj.id = id(object)
 
-                    indices = mesh_data.getIndices()
-                    if indices is not None:
-                        flat_verts = numpy.take(verts, indices.flatten(), axis=0)
-                    else:
-                        flat_verts = numpy.array(verts)
+                    vertices, digest = self._getMeshPayload(object)
+                    obj.vertices = vertices
+                    self._addToFingerprint("object", group_index, object_index, digest)
+                    self._sliced_node_states[object] = SlicedNodeState(object)
 
-                    obj.vertices = flat_verts
-
-                    self._handlePerObjectSettings(object, obj)
+                    self._handlePerObjectSettings(object, obj, ("object", group_index, object_index))
 
                     Job.yieldThread()
+            self._stage_times["mesh_serialization"] = time.time() - mesh_start_time
 
         self.setResult(StartJobResult.Finished)
 
@@ -205,14 +309,64 @@ class StartSliceJob(Job):
         super().cancel()
         self._is_cancelled = True
 
+    ##  Get the mesh data to send to the engine for a node, from the mesh
+    #   payload cache if possible.
+    #
+    #   The engine reads the vertices of an object as a list of triangles and
+    #   ignores the indices field of the message, so indexed meshes are
+    #   converted to a list of triangles. Only the unique vertices are
+    #   transformed though.
+    #
+    #   \param node \type{SceneNode} The node to get the mesh data of.
+    #   \return (vertices, digest) tuple. The digest is a hash of the vertices.
+    def _getMeshPayload(self, node):
+        mesh_data = node.getMeshData()
+        transformation = node.getWorldTransformation().getData()
+        if self._mesh_payload_cache is not None:
+            payload = self._mesh_payload_cache.get(mesh_data, transformation)
+            if payload is not None:
+                return payload
+
+        verts = self._getEngineVertices(node)
+        indices = mesh_data.getIndices()
+        if indices is not None:
+            verts = numpy.take(verts, indices.ravel(), axis = 0)
+        payload = (verts, hashlib.sha1(verts).digest())
+
+        if self._mesh_payload_cache is not None:
+            self._mesh_payload_cache.put(mesh_data, transformation, payload)
+        return payload
+
+    ##  Get the vertices of a node in the coordinate frame of the engine.
+    #
+    #   This effectively performs a limited form of MeshData.getTransformed
+    #   that ignores normals. The world transformation and the conversion to
+    #   Z up axes are combined, so the vertices are only transformed once.
+    #
+    #   \param node \type{SceneNode} The node to get the vertices of.
+    #   \return \type{numpy.ndarray} Nx3 array of 32-bit floats.
+    def _getEngineVertices(self, node):
+        transformation = node.getWorldTransformation().getData()
+        rot_scale = transformation[0:3, 0:3].T.dot(self._y_up_to_z_up)
+        translate = transformation[0:3, 3].dot(self._y_up_to_z_up)
+
+        verts = node.getMeshData().getVertices().dot(rot_scale.astype(numpy.float32))
+        verts += translate.astype(numpy.float32)
+        return verts.astype(numpy.float32, copy = False)
+
     def isCancelled(self):
         return self._is_cancelled
 
     def _expandGcodeTokens(self, key, value, settings):
         try:
             # any setting can be used as a token
+            # The time is filled in when slicing is finished, so it is also right for results from the slice result cache.
             fmt = GcodeStartEndFormatter()
-            return str(fmt.format(value, **settings)).encode("utf-8")
+            result = str(fmt.format(value, **{setting_key: setting_value for setting_key, setting_value in settings.items() if setting_key not in TimeSettingKeys})).encode("utf-8")
+            for unknown_key in fmt.unknown_keys:
+                if unknown_key not in TimeSettingKeys:
+                    Logger.log("w", "Unable to replace '%s' placeholder in start/end gcode", unknown_key)
+            return result
         except:
             Logger.logException("w", "Unable to do token replacement on start/end gcode")
             return str(value).encode("utf-8")
@@ -224,30 +378,34 @@ class StartSliceJob(Job):
 
         material_instance_container = stack.findContainer({"type": "material"})
 
-        for key in stack.getAllKeys():
+        for key in self._settings_snapshot.getAllKeys(stack):
             # Do not send settings that are not settable_per_extruder.
-            if not stack.getProperty(key, "settable_per_extruder"):
+            if not self._settings_snapshot.getProperty(stack, key, "settable_per_extruder"):
                 continue
             setting = message.getMessage("settings").addRepeatedMessage("settings")
             setting.name = key
             if key == "material_guid" and material_instance_container:
                 # Also send the material GUID. This is a setting in fdmprinter, but we have no interface for it.
-                setting.value = str(material_instance_container.getMetaDataEntry("GUID", "")).encode("utf-8")
+                value = str(material_instance_container.getMetaDataEntry("GUID", "")).encode("utf-8")
             else:
-                setting.value = str(stack.getProperty(key, "value")).encode("utf-8")
+                value = self._settings_snapshot.getEncodedValue(stack, key)
+            setting.value = value
+            self._addToFingerprint("extruder", stack.getMetaDataEntry("position"), key, value)
             Job.yieldThread()
 
     ##  Create extruder message from global stack
     def _buildExtruderMessageFromGlobalStack(self, stack):
         message = self._slice_message.addRepeatedMessage("extruders")
 
-        for key in stack.getAllKeys():
+        for key in self._settings_snapshot.getAllKeys(stack):
             # Do not send settings that are not settable_per_extruder.
-            if not stack.getProperty(key, "settable_per_extruder"):
+            if not self._settings_snapshot.getProperty(stack, key, "settable_per_extruder"):
                 continue
             setting = message.getMessage("settings").addRepeatedMessage("settings")
             setting.name = key
-            setting.value = str(stack.getProperty(key, "value")).encode("utf-8")
+            value = self._settings_snapshot.getEncodedValue(stack, key)
+            setting.value = value
+            self._addToFingerprint("extruder", key, value)
             Job.yieldThread()
 
     ##  Sends all global settings to the engine.
@@ -255,33 +413,25 @@ class StartSliceJob(Job):
     #   The settings are taken from the global stack. This does not include any
     #   per-extruder settings or per-object settings.
     def _buildGlobalSettingsMessage(self, stack):
-        keys = stack.getAllKeys()
+        keys = self._settings_snapshot.getAllKeys(stack)
         settings = {}
         for key in keys:
-            settings[key] = stack.getProperty(key, "value")
+            settings[key] = self._settings_snapshot.getProperty(stack, key, "value")
             Job.yieldThread()
 
-        start_gcode = settings["machine_start_gcode"]
-        #Pre-compute material material_bed_temp_prepend and material_print_temp_prepend
-        bed_temperature_settings = {"material_bed_temperature", "material_bed_temperature_layer_0"}
-        settings["material_bed_temp_prepend"] = all(("{" + setting + "}" not in start_gcode for setting in bed_temperature_settings))
-        print_temperature_settings = {"material_print_temperature", "material_print_temperature_layer_0", "default_material_print_temperature", "material_initial_print_temperature", "material_final_print_temperature", "material_standby_temperature"}
-        settings["material_print_temp_prepend"] = all(("{" + setting + "}" not in start_gcode for setting in print_temperature_settings))
-
-        settings["print_bed_temperature"] = settings["material_bed_temperature"]
-        settings["print_temperature"] = settings["material_print_temperature"]
-
-        settings["time"] = time.strftime('%H:%M:%S')
-        settings["date"] = time.strftime('%d-%m-%Y')
-        settings["day"] = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'][int(time.strftime('%w'))]
-
+        computed_keys = addComputedSettings(settings)
         for key, value in settings.items(): #Add all submessages for each individual setting.
             setting_message = self._slice_message.getMessage("global_settings").addRepeatedMessage("settings")
             setting_message.name = key
-            if key == "machine_start_gcode" or key == "machine_end_gcode" or key == "machine_extruder_start_code" or key == "machine_extruder_end_code": #If it's a g-code message, use special formatting.
+            if key in GCodeSettingKeys: #If it's a g-code message, use special formatting.
                 setting_message.value = self._expandGcodeTokens(key, value, settings)
-            else:
+                self._addToFingerprint("global", key, value)  # Without the time and date filled in.
+            elif key in computed_keys:
                 setting_message.value = str(value).encode("utf-8")
+            else:
+                encoded_value = self._settings_snapshot.getEncodedValue(stack, key)
+                setting_message.value = encoded_value
+                self._addToFingerprint("global", key, encoded_value)
             Job.yieldThread()
 
     ##  Sends for some settings which extruder they should fallback to if not
@@ -293,18 +443,20 @@ class StartSliceJob(Job):
     #   \param stack The global stack with all settings, from which to read the
     #   limit_to_extruder property.
     def _buildGlobalInheritsStackMessage(self, stack):
-        for key in stack.getAllKeys():
-            extruder = int(round(float(stack.getProperty(key, "limit_to_extruder"))))
+        for key in self._settings_snapshot.getAllKeys(stack):
+            extruder = int(round(float(self._settings_snapshot.getProperty(stack, key, "limit_to_extruder"))))
             if extruder >= 0: #Set to a specific extruder.
                 setting_extruder = self._slice_message.addRepeatedMessage("limit_to_extruder")
                 setting_extruder.name = key
                 setting_extruder.extruder = extruder
+                self._addToFingerprint("limit_to_extruder", key, extruder)
             Job.yieldThread()
 
     ##  Check if a node has per object settings and ensure that they are set correctly in the message
     #   \param node \type{SceneNode} Node to check.
     #   \param message object_lists message to put the per object settings in
-    def _handlePerObjectSettings(self, node, message):
+    #   \param fingerprint_prefix Tuple identifying the node in the fingerprint.
+    def _handlePerObjectSettings(self, node, message, fingerprint_prefix = ()):
         stack = node.callDecoration("getStack")
         # Check if the node has a stack attached to it and the stack has any settings in the top container.
         if stack:
@@ -323,7 +475,9 @@ class StartSliceJob(Job):
             for key in changed_setting_keys:
                 setting = message.addRepeatedMessage("settings")
                 setting.name = key
-                setting.value = str(stack.getProperty(key, "value")).encode("utf-8")
+                value = str(stack.getProperty(key, "value")).encode("utf-8")
+                setting.value = value
+                self._addToFingerprint(*(fingerprint_prefix + (key, value)))
                 Job.yieldThread()
 
     ##  Recursive function to put all settings that require eachother for value changes in a list
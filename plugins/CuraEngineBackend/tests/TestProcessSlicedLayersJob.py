@@ -0,0 +1,127 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+import pytest #This module contains unit tests.
+import unittest.mock #To mock the application, preferences and back-end.
+
+from cura.LayerPolygon import LayerPolygon
+from plugins.CuraEngineBackend.CuraEngineBackend import CuraEngineBackend
+from plugins.CuraEngineBackend.ProcessSlicedLayersJob import ProcessSlicedLayersJob #The class we're testing.
+
+preferences = {
+    "backend/background_layer_count": 2,
+    "backend/layer_processing_processes": 0,
+    "backend/layer_data_memory_budget": 0,
+    "view/layer_view_level_of_detail": False,
+    "view/force_layer_view_compatibility_mode": False
+}
+
+
+##  A path segment of a LayerOptimized message.
+class FakePathSegment:
+    def __init__(self, extruder, point_type, points, line_type, line_width):
+        self.extruder = extruder
+        self.point_type = point_type
+        self.points = points
+        self.line_type = line_type
+        self.line_width = line_width
+
+
+##  A LayerOptimized message with two walls and an infill line. The height of
+#   the layer tells which layer it is.
+class FakeLayerMessage:
+    def __init__(self, layer_id):
+        self.id = layer_id
+        self.height = (layer_id + 10) * 100
+        self.thickness = 100
+        points = numpy.array([[0, 0], [1, 0], [1, 1], [2, 2]], dtype = "f4").tobytes()
+        line_types = bytes([LayerPolygon.Inset0Type, LayerPolygon.Inset0Type, LayerPolygon.InfillType])
+        line_widths = numpy.full(3, 0.4, dtype = "f4").tobytes()
+        self._segments = [FakePathSegment(0, 0, points, line_types, line_widths)]
+
+    def repeatedMessageCount(self, name):
+        return len(self._segments)
+
+    def getRepeatedMessage(self, name, index):
+        return self._segments[index]
+
+
+##  Runs the jobs in the current thread with a mocked application, in which
+#   the solid view is active, and a mocked scene.
+@pytest.fixture
+def application():
+    with unittest.mock.patch("UM.Application.Application.getInstance") as get_application, \
+            unittest.mock.patch("UM.Preferences.Preferences.getInstance") as get_preferences, \
+            unittest.mock.patch("UM.View.GL.OpenGLContext.OpenGLContext.isLegacyOpenGL", return_value = False), \
+            unittest.mock.patch("cura.LayerProcessingPool.LayerProcessingPool.getInstance") as get_pool, \
+            unittest.mock.patch("plugins.CuraEngineBackend.ProcessSlicedLayersJob.SceneNode"), \
+            unittest.mock.patch("plugins.CuraEngineBackend.ProcessSlicedLayersJob.LayerDataDecorator"), \
+            unittest.mock.patch.object(ProcessSlicedLayersJob, "_getMaterialColorMap", return_value = numpy.ones((1, 4), dtype = numpy.float32)), \
+            unittest.mock.patch.object(ProcessSlicedLayersJob, "_background_max_pause", 0), \
+            unittest.mock.patch.object(ProcessSlicedLayersJob, "start", ProcessSlicedLayersJob.run):
+        get_application.return_value.getController.return_value.getActiveView.return_value.getPluginId.return_value = "SolidView"
+        get_application.return_value.getTheme.return_value.getColor.return_value.getRgbF.return_value = (0.5, 0.5, 0.5, 1.0)
+        get_preferences.return_value.getValue.side_effect = lambda key: preferences[key]
+        get_pool.return_value.isEnabled.return_value = False
+        yield get_application.return_value
+
+
+##  Get the layer numbers in some layer data, with the height of the layer
+#   that got each number.
+def getLayerHeights(layer_data):
+    return {layer_number: layer.height for layer_number, layer in layer_data.getLayers().items()}
+
+
+##  Processes the layers in a single job.
+def processAllLayers(layer_ids):
+    job = ProcessSlicedLayersJob([FakeLayerMessage(layer_id) for layer_id in layer_ids])
+    job.run()
+    return job._layer_data
+
+
+##  In the background, the bottom and top layers are processed first. The
+#   other layers are added to the same layer data once the layer view is
+#   opened, which then is the same as if all layers were processed at once.
+@pytest.mark.parametrize("layer_ids", [range(10), range(-3, 10)])  # With and without raft layers.
+def test_backgroundLayersAreCompleted(application, layer_ids):
+    backend = unittest.mock.MagicMock()
+    backend._stored_optimized_layer_data = [FakeLayerMessage(layer_id) for layer_id in reversed(layer_ids)]
+    backend._partial_layers_job = None
+
+    CuraEngineBackend._startProcessSlicedLayersJob(backend, background = True)
+    partial_job = backend._process_layers_job
+    assert backend._partial_layers_job is partial_job
+    assert sorted(layer.id for layer in backend._stored_optimized_layer_data) == list(layer_ids)[2:-2]
+    layer_data = partial_job._layer_data
+    assert sorted(getLayerHeights(layer_data)) == [0, 1, len(layer_ids) - 2, len(layer_ids) - 1]
+
+    CuraEngineBackend._startProcessSlicedLayersJob(backend)
+    assert backend._process_layers_job is not partial_job
+    assert backend._partial_layers_job is None
+    assert backend._stored_optimized_layer_data == []
+    assert backend._process_layers_job._layer_data is layer_data
+
+    expected_layer_data = processAllLayers(layer_ids)
+    assert getLayerHeights(layer_data) == getLayerHeights(expected_layer_data)
+    assert layer_data.getElementCounts() == expected_layer_data.getElementCounts()
+    assert layer_data.getLayerNumberRange() == (0, len(layer_ids) - 1)
+
+
+##  Raft layers that come in after the other layers were shown move all
+#   layers up, as if they had been processed together.
+def test_lateRaftLayers(application):
+    job = ProcessSlicedLayersJob([FakeLayerMessage(layer_id) for layer_id in range(5)], streaming = True)
+    job._material_color_map = numpy.ones((1, 4), dtype = numpy.float32)
+    for layer_id in range(5):
+        job._addProcessedLayer(layer_id, job._processLayer(FakeLayerMessage(layer_id)))
+    job._updateLayerData()
+    assert sorted(getLayerHeights(job._layer_data)) == list(range(5))
+
+    for layer_id in (-2, -1):
+        job._addProcessedLayer(layer_id, job._processLayer(FakeLayerMessage(layer_id)))
+    job._updateLayerData()
+
+    expected_layer_data = processAllLayers(range(-2, 5))
+    assert getLayerHeights(job._layer_data) == getLayerHeights(expected_layer_data)
+    assert job._layer_data.getElementCounts() == expected_layer_data.getElementCounts()
@@ -0,0 +1,85 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import unittest.mock #To mock the back-end that the job reports to.
+
+from UM.Backend.Backend import BackendState
+
+from cura.GCodeBuffer import GCodeBuffer
+from plugins.CuraEngineBackend.CuraEngineBackend import CuraEngineBackend #The handler we're testing.
+from plugins.CuraEngineBackend.ReplaceGCodeTokensJob import ReplaceGCodeTokensJob #The job we're testing.
+
+gcode_chunks = [b";FLAVOR:Marlin\n;PRINT.TIME:{print_time}\n;Filament used: {filament_amount}m\n", b"G1 X10 Y10\n", b"M117 {jobname}\n"]
+replacements = {"print_time": 1234, "filament_amount": [1.5], "jobname": "UM3_box"}
+
+
+##  Creates a mock back-end with the given g-code in its scene.
+def createBackend(gcode_list):
+    backend = unittest.mock.MagicMock()
+    backend._slicing = False
+    backend._need_slicing = False
+    backend._scene.gcode_list = gcode_list
+    return backend
+
+
+##  Writes g-code to a file in the same way as the g-code writer.
+def writeGCode(gcode_list, path):
+    with open(path, "w", encoding = "utf-8") as stream:
+        for gcode in gcode_list:
+            stream.write(gcode)
+    with open(path, encoding = "utf-8") as stream:
+        return stream.read()
+
+
+##  The g-code in the scene is left alone while the job runs, and replaced by
+#   the filled in g-code once the job is finished. Writing it then gives a file
+#   with the print information in it.
+def test_outputContainsReplacedTokens(tmpdir):
+    gcode_list = GCodeBuffer(gcode_chunks)
+    backend = createBackend(gcode_list)
+
+    job = ReplaceGCodeTokensJob(gcode_list, replacements)
+    job.run()
+    assert backend._scene.gcode_list is gcode_list
+    assert list(gcode_list) == [chunk.decode("utf-8") for chunk in gcode_chunks]  # The job didn't change the g-code in the scene.
+
+    CuraEngineBackend._onReplaceGCodeTokensFinished(backend, job)
+
+    output = writeGCode(backend._scene.gcode_list, str(tmpdir.join("output.gcode")))
+    assert ";PRINT.TIME:1234\n" in output
+    assert ";Filament used: [1.5]m\n" in output
+    assert "M117 UM3_box\n" in output
+    assert "{" not in output
+    backend.backendStateChange.emit.assert_called_once_with(BackendState.Done)
+
+
+##  The result of the job is dropped if a new slice was started while it ran.
+def test_newSliceStarted():
+    gcode_list = GCodeBuffer(gcode_chunks)
+    new_gcode_list = GCodeBuffer()
+    backend = createBackend(new_gcode_list)
+
+    job = ReplaceGCodeTokensJob(gcode_list, replacements)
+    job.run()
+    CuraEngineBackend._onReplaceGCodeTokensFinished(backend, job)
+
+    assert backend._scene.gcode_list is new_gcode_list
+    backend.backendStateChange.emit.assert_not_called()
+
+
+##  The result of the job is not shown as done if the scene or settings
+#   changed after slicing finished, but before the job finished.
+def test_changedWhileReplacing():
+    gcode_list = GCodeBuffer(gcode_chunks)
+    backend = createBackend(gcode_list)
+
+    job = ReplaceGCodeTokensJob(gcode_list, replacements)
+    job.run()
+    CuraEngineBackend.needsSlicing(backend)
+    backend.backendStateChange.emit.reset_mock()
+    backend.processingProgress.emit.reset_mock()
+    CuraEngineBackend._onReplaceGCodeTokensFinished(backend, job)
+
+    assert backend._need_slicing
+    backend.backendStateChange.emit.assert_not_called()
+    backend.processingProgress.emit.assert_not_called()
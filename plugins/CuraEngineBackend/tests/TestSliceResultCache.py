@@ -0,0 +1,151 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import os #To find and change the stored files.
+import pickle #To write files of another version.
+import pytest #This module contains unit tests.
+import unittest.mock #To mock the application and preferences.
+
+from plugins.CuraEngineBackend.CuraEngineBackend import CuraEngineBackend
+from plugins.CuraEngineBackend.SliceResultCache import SliceResult, SliceResultCache, SliceResultWriter #The classes we're testing.
+from plugins.CuraEngineBackend.StartSliceJob import StartSliceJob
+
+##  A layer as stored in the cache: id, height, thickness and path segments.
+layer_description = (3, 600, 200, [(0, 0, b"\x00" * 24, b"\x01\x01", b"\x00" * 8)])
+
+
+##  Creates a slice result with a single layer.
+def createResult(gcode = ";G-code\n"):
+    result = SliceResult()
+    result.gcode_list = [gcode.encode("utf-8")]
+    result.layers = [layer_description]
+    result.feature_times = {"infill": 10}
+    result.material_amounts = [1.5]
+    return result
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return SliceResultCache(str(tmpdir), 2, 1024 * 1024)
+
+
+##  A stored result is loaded as it was stored.
+def test_storeAndLoad(cache):
+    cache.store("abc", createResult())
+
+    assert cache.contains("abc")
+    result = cache.load("abc")
+    assert result.gcode_list == [b";G-code\n"]
+    assert result.layers == [layer_description]
+    assert result.feature_times == {"infill": 10}
+    assert result.material_amounts == [1.5]
+    assert [layer.id for layer in result.getLayerMessages()] == [3]
+
+
+##  The writer stores the layers as they are added, and only keeps the result
+#   if it is finished.
+def test_writer(cache):
+    writer = SliceResultWriter(cache, "finished")
+    writer.addLayer(layer_description)
+    writer.setPrintEstimates({"infill": 10}, [1.5])
+    writer.finish([b";G-code\n"])
+    writer.join()
+
+    writer = SliceResultWriter(cache, "aborted")
+    writer.addLayer(layer_description)
+    writer.abort()
+    writer.join()
+
+    assert cache.load("finished").layers == [layer_description]
+    assert not cache.contains("aborted")
+    assert [file_name for file_name in os.listdir(cache._directory) if file_name.endswith(".tmp")] == []
+
+
+##  The least recently used results are removed when there are too many.
+def test_leastRecentlyUsedResultsAreRemoved(cache):
+    cache.store("first", createResult())
+    cache.store("second", createResult())
+    os.utime(cache._getPath("first"), (1000, 1000))
+    os.utime(cache._getPath("second"), (2000, 2000))
+
+    assert cache.load("first") is not None  # Now the first result is used more recently than the second.
+    cache.store("third", createResult())
+
+    assert cache.contains("first")
+    assert not cache.contains("second")
+    assert cache.contains("third")
+
+
+##  The least recently used results are removed when the results take too
+#   much space together.
+def test_maxSize(cache):
+    cache.store("first", createResult())
+    os.utime(cache._getPath("first"), (1000, 1000))
+    cache.setMaxSize(os.path.getsize(cache._getPath("first")) * 3 // 2)
+
+    cache.store("second", createResult())
+    assert not cache.contains("first")
+    assert cache.contains("second")
+
+    cache.setMaxSize(0)
+    assert not cache.isEnabled()
+
+
+##  Files that disappear while the cache is pruned are skipped.
+def test_pruneVanishedFile(cache):
+    cache.store("first", createResult())
+    os.symlink(os.path.join(cache._directory, "missing"), cache._getPath("vanished"))
+
+    cache.store("second", createResult())
+    assert cache.contains("first")
+    assert cache.contains("second")
+
+
+##  The time and date are left in the start g-code that is sent to the
+#   engine, so they are filled in when the slice is finished, also when the
+#   result comes from the cache.
+def test_timeIsNotStored():
+    with unittest.mock.patch("UM.Application.Application.getInstance"):
+        job = StartSliceJob(unittest.mock.MagicMock())
+    settings = {"layer_height": 0.1, "time": "12:00:00", "date": "01-01-2017", "day": "Sun"}
+    assert job._expandGcodeTokens("machine_start_gcode", ";{day} {date} {time}\n;{layer_height}", settings) == b";{day} {date} {time}\n;0.1"
+
+
+##  Files that can't be read are removed, files of other versions ignored.
+@pytest.mark.parametrize("data, removed", [
+    (b"Not a pickle", True),
+    (pickle.dumps({"version": SliceResultCache.Version}) + pickle.dumps(("layer", layer_description)), True),  # Cut off before the end.
+    (pickle.dumps({"version": SliceResultCache.Version - 1}), False)
+])
+def test_unreadableFiles(cache, data, removed):
+    os.makedirs(cache._directory, exist_ok = True)
+    with open(cache._getPath("abc"), "wb") as f:
+        f.write(data)
+
+    assert cache.load("abc") is None
+    assert cache.contains("abc") != removed
+
+
+##  The fingerprint of a slice doesn't depend on the order in which settings
+#   were added, but does depend on their values and on the engine.
+def test_fingerprintIsStable(tmpdir):
+    def getFingerprint(parts, engine_path):
+        with unittest.mock.patch("UM.Application.Application.getInstance"):
+            job = StartSliceJob(unittest.mock.MagicMock())
+        for part in parts:
+            job._addToFingerprint(*part)
+        with unittest.mock.patch("UM.Preferences.Preferences.getInstance") as preferences:
+            preferences.return_value.getValue.return_value = engine_path
+            return CuraEngineBackend._getSliceFingerprint(unittest.mock.MagicMock(), job)
+
+    engine_path = str(tmpdir.join("CuraEngine"))
+    with open(engine_path, "wb") as f:
+        f.write(b"engine")
+    parts = [("global", "layer_height", 0.1), ("global", "infill_sparse_density", 20), ("object", 0, 0, b"mesh")]
+
+    fingerprint = getFingerprint(parts, engine_path)
+    assert getFingerprint(list(reversed(parts)), engine_path) == fingerprint
+    assert getFingerprint(parts[:1] + [("global", "infill_sparse_density", 30)] + parts[2:], engine_path) != fingerprint
+
+    os.utime(engine_path, (1000, 1000))
+    assert getFingerprint(parts, engine_path) != fingerprint
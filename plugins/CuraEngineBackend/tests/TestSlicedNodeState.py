@@ -0,0 +1,72 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+import unittest.mock #To mock the per-object setting containers.
+
+from plugins.CuraEngineBackend.StartSliceJob import SlicedNodeState #The class we're testing.
+
+
+##  Scene node with a mesh, a transformation and optionally per-object
+#   settings.
+class FakeNode:
+    def __init__(self, parent = None, settings = None):
+        self.mesh_data = object()
+        self.transformation = numpy.identity(4)
+        self.parent = parent
+        self.stack = None
+        if settings is not None:
+            self.stack = unittest.mock.MagicMock()
+            self.stack.getTop.return_value.getAllKeys.side_effect = lambda: set(settings)
+            self.stack.getTop.return_value.getProperty.side_effect = lambda key, property_name: settings[key]
+
+    def getMeshData(self):
+        return self.mesh_data
+
+    def getWorldTransformation(self):
+        transformation = unittest.mock.MagicMock()
+        transformation.getData.return_value = self.transformation
+        return transformation
+
+    def getParent(self):
+        return self.parent
+
+    def callDecoration(self, name):
+        return self.stack if name == "getStack" else None
+
+
+def test_meshAndTransformation():
+    node = FakeNode()
+    state = SlicedNodeState(node)
+    assert state.isUnchanged(node)
+
+    node.transformation = numpy.identity(4) * 2
+    assert not state.isUnchanged(node)
+    node.transformation = numpy.identity(4)
+    node.mesh_data = object()
+    assert not state.isUnchanged(node)
+
+
+##  Moving a node into or out of a group changes the slice, also if its world
+#   transformation stays the same.
+def test_parent():
+    node = FakeNode(parent = object())
+    state = SlicedNodeState(node)
+
+    node.parent = object()
+    assert not state.isUnchanged(node)
+
+
+def test_perObjectSettings():
+    settings = {"infill_sparse_density": 20}
+    node = FakeNode(settings = settings)
+    state = SlicedNodeState(node)
+    assert state.isUnchanged(node)
+
+    settings["infill_sparse_density"] = 30
+    assert not state.isUnchanged(node)
+    settings["infill_sparse_density"] = 20
+    assert state.isUnchanged(node)
+
+    node.stack.getNextStack.return_value = object()  # Printed with another extruder.
+    assert not state.isUnchanged(node)
@@ -0,0 +1,93 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from collections import OrderedDict
+import threading
+import weakref
+
+
+##  Keeps the meshes of recently shown layers, so moving the layer slider back
+#   and forth doesn't build the same layer meshes again.
+#
+#   The least recently used meshes are removed when the meshes take more
+#   memory than allowed. A mesh is only used for the same layer object it was
+#   built from, and all meshes are removed when other layer data is shown.
+class LayerMeshCache:
+    ##  \param max_bytes The maximum amount of memory for the meshes, in bytes.
+    def __init__(self, max_bytes):
+        self._lock = threading.Lock()
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()  # Per (layer number, whether it is a mesh or jumps), a tuple of a weak reference to the layer, the mesh and its size.
+        self._size = 0
+        self._layer_data_ref = None
+
+    def setMaxBytes(self, max_bytes):
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._removeLeastRecentlyUsed()
+
+    ##  Set the layer data that the layers come from. If it is different from
+    #   before, all meshes are removed.
+    def setLayerData(self, layer_data):
+        with self._lock:
+            if self._layer_data_ref is not None and self._layer_data_ref() is layer_data:
+                return
+            self._layer_data_ref = weakref.ref(layer_data)
+            self._entries.clear()
+            self._size = 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    ##  Get the mesh of a layer, building it if it is not cached.
+    #
+    #   \param layer_number The number of the layer in the layer data.
+    #   \param layer \type{Layer} The layer.
+    #   \return \type{MeshData} The result of layer.createMesh().
+    def getMesh(self, layer_number, layer):
+        return self._get(layer_number, layer, True)
+
+    ##  Get the travel moves of a layer, building them if they are not cached.
+    #
+    #   \return \type{MeshData} The result of layer.createJumps().
+    def getJumps(self, layer_number, layer):
+        return self._get(layer_number, layer, False)
+
+    def _get(self, layer_number, layer, make_mesh):
+        if layer is None:
+            return None
+        key = (layer_number, make_mesh)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0]() is layer:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        mesh = layer.createMeshOrJumps(make_mesh)
+        size = self._getMeshSize(mesh)
+
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._size -= old_entry[2]
+            if size <= self._max_bytes:
+                self._entries[key] = (weakref.ref(layer), mesh, size)
+                self._size += size
+                self._removeLeastRecentlyUsed()
+        return mesh
+
+    def _removeLeastRecentlyUsed(self):
+        while self._size > self._max_bytes and self._entries:
+            _, (_, _, size) = self._entries.popitem(last = False)
+            self._size -= size
+
+    def _getMeshSize(self, mesh):
+        if mesh is None:
+            return 0
+        size = 0
+        for data in (mesh.getVertices(), mesh.getNormals(), mesh.getIndices(), mesh.getColors()):
+            if data is not None:
+                size += data.nbytes
+        return size
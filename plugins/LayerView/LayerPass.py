@@ -12,10 +12,13 @@ from UM.View.RenderPass import RenderPass
 from UM.View.RenderBatch import RenderBatch
 from UM.View.GL.OpenGL import OpenGL
 
+from cura.LayerData import LayerData
 from cura.Settings.ExtruderManager import ExtruderManager
 
 
 import os.path
+import time
+import weakref
 
 ## RenderPass used to display g-code paths.
 class LayerPass(RenderPass):
@@ -30,6 +33,7 @@ class LayerPass(RenderPass):
 
         self._layer_view = None
         self._compatibility_mode = None
+        self._drawn_chunks = weakref.WeakSet()  # Layer data chunks that were drawn before, so they are uploaded to the graphics card.
 
     def setLayerView(self, layerview):
         self._layer_view = layerview
@@ -79,20 +83,42 @@ class LayerPass(RenderPass):
 
                 # Render all layers below a certain number as line mesh instead of vertices.
                 if self._layer_view._current_layer_num > -1 and ((not self._layer_view._only_show_top_layers) or (not self._layer_view.getCompatibilityMode())):
-                    start = 0
-                    end = 0
-                    element_counts = layer_data.getElementCounts()
-                    for layer in sorted(element_counts.keys()):
-                        if layer > self._layer_view._current_layer_num:
-                            break
-                        if self._layer_view._minimum_layer_num > layer:
-                            start += element_counts[layer]
-                        end += element_counts[layer]
-
-                    # This uses glDrawRangeElements internally to only draw a certain range of lines.
-                    batch = RenderBatch(self._layer_shader, type = RenderBatch.RenderType.Solid, mode = RenderBatch.RenderMode.Lines, range = (start, end))
-                    batch.addItem(node.getWorldTransformation(), layer_data)
-                    batch.render(self._scene.getActiveCamera())
+                    # Layers far below the current layer are drawn with less detail, unless the travel moves are shown.
+                    full_detail_layer_num = self._layer_view._current_layer_num - self._layer_view.getFullDetailLayers()
+                    use_decimated_chunks = not self._layer_view.getShowTravelMoves()
+
+                    # The lines of each chunk are sorted by group of line types, so hidden groups are simply not drawn.
+                    visible_groups = [LayerData.AlwaysShownGroup]
+                    if self._layer_view.getShowSkin():
+                        visible_groups.append(LayerData.SkinGroup)
+                    if self._layer_view.getShowInfill():
+                        visible_groups.append(LayerData.InfillGroup)
+                    if self._layer_view.getShowHelpers():
+                        visible_groups.append(LayerData.HelperGroup)
+                    if self._layer_view.getShowTravelMoves():
+                        visible_groups.append(LayerData.TravelGroup)
+
+                    # The layer data can consist of multiple meshes, each holding a range of layers.
+                    for chunk, decimated_chunk in zip(layer_data.getChunks(), layer_data.getDecimatedChunks()):
+                        if use_decimated_chunks and decimated_chunk is not None and max(chunk.getElementCounts(), default = 0) < full_detail_layer_num:
+                            chunk = decimated_chunk
+
+                        ranges = chunk.getElementRanges(self._layer_view._minimum_layer_num, self._layer_view._current_layer_num, visible_groups)
+                        if not ranges:  # Nothing to show from this chunk.
+                            continue
+
+                        upload_start_time = time.time()
+                        for element_range in ranges:
+                            # This uses glDrawRangeElements internally to only draw a certain range of lines.
+                            batch = RenderBatch(self._layer_shader, type = RenderBatch.RenderType.Solid, mode = RenderBatch.RenderMode.Lines, range = element_range)
+                            batch.addItem(node.getWorldTransformation(), chunk)
+                            batch.render(self._scene.getActiveCamera())
+                        if chunk not in self._drawn_chunks:
+                            # The first time a chunk is drawn, its buffers are created and uploaded.
+                            add_slice_stage_time = getattr(Application.getInstance().getBackend(), "addSliceStageTime", None)
+                            if add_slice_stage_time is not None:  # Only the CuraEngine back-end keeps the timings of slices.
+                                add_slice_stage_time("gpu_upload", time.time() - upload_start_time)
+                            self._drawn_chunks.add(chunk)
 
                 # Create a new batch that is not range-limited
                 batch = RenderBatch(self._layer_shader, type = RenderBatch.RenderType.Solid)
@@ -1,8 +1,6 @@
 # Copyright (c) 2015 Ultimaker B.V.
 # Cura is released under the terms of the AGPLv3 or higher.
 
-import sys
-
 from UM.PluginRegistry import PluginRegistry
 from UM.View.View import View
 from UM.Scene.Iterator.DepthFirstIterator import DepthFirstIterator
@@ -11,7 +9,6 @@ from UM.Event import Event, KeyEvent
 from UM.Signal import Signal
 from UM.Scene.Selection import Selection
 from UM.Math.Color import Color
-from UM.Mesh.MeshBuilder import MeshBuilder
 from UM.Job import Job
 from UM.Preferences import Preferences
 from UM.Logger import Logger
@@ -21,11 +18,13 @@ from UM.Application import Application
 from UM.View.GL.OpenGLContext import OpenGLContext
 
 from cura.ConvexHullNode import ConvexHullNode
+from cura.Layer import Layer
 from cura.Settings.ExtruderManager import ExtruderManager
 
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QApplication
 
+from . import LayerMeshCache
 from . import LayerViewProxy
 
 from UM.i18n import i18nCatalog
@@ -74,6 +73,12 @@ class LayerView(View):
         Preferences.getInstance().addPreference("view/top_layer_count", 5)
         Preferences.getInstance().addPreference("view/only_show_top_layers", False)
         Preferences.getInstance().addPreference("view/force_layer_view_compatibility_mode", False)
+        # Draw layers far below the current layer with less detail. Applies to layers processed after changing it.
+        Preferences.getInstance().addPreference("view/layer_view_level_of_detail", True)
+        # Number of layers below the current layer that are always drawn with full detail.
+        Preferences.getInstance().addPreference("view/layer_view_full_detail_layers", 20)
+        # Maximum amount of memory in MB for the meshes of recently shown layers.
+        Preferences.getInstance().addPreference("view/layer_mesh_cache_size", 128)
 
         Preferences.getInstance().addPreference("layerview/layer_view_type", 0)
         Preferences.getInstance().addPreference("layerview/extruder_opacities", "")
@@ -88,7 +93,9 @@ class LayerView(View):
 
         self._solid_layers = int(Preferences.getInstance().getValue("view/top_layer_count"))
         self._only_show_top_layers = bool(Preferences.getInstance().getValue("view/only_show_top_layers"))
+        self._full_detail_layers = int(Preferences.getInstance().getValue("view/layer_view_full_detail_layers"))
         self._compatibility_mode = True  # for safety
+        self._layer_mesh_cache = LayerMeshCache.LayerMeshCache(int(Preferences.getInstance().getValue("view/layer_mesh_cache_size")) * 1024 * 1024)
 
         self._wireprint_warning_message = Message(catalog.i18nc("@info:status", "Cura does not accurately display layers when Wire Printing is enabled"))
 
@@ -255,14 +262,10 @@ class LayerView(View):
             if not layer_data:
                 continue
 
-            min_layer_number = sys.maxsize
-            max_layer_number = -sys.maxsize
-            for layer_id in layer_data.getLayers():
-                if max_layer_number < layer_id:
-                    max_layer_number = layer_id
-                if min_layer_number > layer_id:
-                    min_layer_number = layer_id
-            layer_count = max_layer_number - min_layer_number
+            layer_number_range = layer_data.getLayerNumberRange()
+            if layer_number_range is None:
+                continue
+            layer_count = layer_number_range[1] - layer_number_range[0]
 
             if new_max_layers < layer_count:
                 new_max_layers = layer_count
@@ -275,12 +278,25 @@ class LayerView(View):
             # slider.
             if new_max_layers > self._current_layer_num:
                 self.maxLayersChanged.emit()
-                self.setLayer(int(self._max_layers))
+                # While layers are still coming in, keep showing the top layer unless the user moved away from it.
+                if self._current_layer_num >= self._old_max_layers:
+                    self.setLayer(int(self._max_layers))
             else:
                 self.setLayer(int(self._max_layers))
                 self.maxLayersChanged.emit()
         self._startUpdateTopLayers()
 
+    ##  Get the statistics of the layers that are shown.
+    #
+    #   \return \type{LayerStatistics} The statistics, or None if there are no
+    #   layers.
+    def getLayerStatistics(self):
+        for node in DepthFirstIterator(self.getController().getScene().getRoot()):
+            layer_data = node.callDecoration("getLayerData")
+            if layer_data:
+                return layer_data.getStatistics()
+        return None
+
     maxLayersChanged = Signal()
     currentLayerNumChanged = Signal()
     globalStackChanged = Signal()
@@ -372,7 +388,7 @@ class LayerView(View):
 
         self.setBusy(True)
 
-        self._top_layers_job = _CreateTopLayersJob(self._controller.getScene(), self._current_layer_num, self._solid_layers)
+        self._top_layers_job = _CreateTopLayersJob(self._controller.getScene(), self._current_layer_num, self._solid_layers, self._layer_mesh_cache)
         self._top_layers_job.finished.connect(self._updateCurrentLayerMesh)
         self._top_layers_job.start()
 
@@ -412,7 +428,19 @@ class LayerView(View):
         self._startUpdateTopLayers()
         self.preferencesChanged.emit()
 
+    ##  Get the number of layers below the current layer that are drawn with
+    #   full detail. Layers further down may be drawn with less detail.
+    def getFullDetailLayers(self):
+        return self._full_detail_layers
+
     def _onPreferencesChanged(self, preference):
+        if preference == "view/layer_view_full_detail_layers":
+            self._full_detail_layers = int(Preferences.getInstance().getValue("view/layer_view_full_detail_layers"))
+            self._controller.getScene().sceneChanged.emit(self._controller.getScene().getRoot())  # Redraw.
+            return
+        if preference == "view/layer_mesh_cache_size":
+            self._layer_mesh_cache.setMaxBytes(int(Preferences.getInstance().getValue("view/layer_mesh_cache_size")) * 1024 * 1024)
+            return
         if preference not in {
             "view/top_layer_count",
             "view/only_show_top_layers",
@@ -430,12 +458,15 @@ class LayerView(View):
 
 
 class _CreateTopLayersJob(Job):
-    def __init__(self, scene, layer_number, solid_layers):
+    ##  \param layer_mesh_cache \type{LayerMeshCache} The meshes of recently
+    #   shown layers.
+    def __init__(self, scene, layer_number, solid_layers, layer_mesh_cache):
         super().__init__()
 
         self._scene = scene
         self._layer_number = layer_number
         self._solid_layers = solid_layers
+        self._layer_mesh_cache = layer_mesh_cache
         self._cancel = False
 
     def run(self):
@@ -448,14 +479,19 @@ class _CreateTopLayersJob(Job):
         if self._cancel or not layer_data:
             return
 
-        layer_mesh = MeshBuilder()
+        self._layer_mesh_cache.setLayerData(layer_data)
+        # The layers may have been moved out of memory, get them back before using them.
+        layer_data.loadLayers(range(self._layer_number - self._solid_layers + 1, self._layer_number + 1))
+
+        layer_meshes = []
+        brightnesses = []
         for i in range(self._solid_layers):
             layer_number = self._layer_number - i
             if layer_number < 0:
                 continue
 
             try:
-                layer = layer_data.getLayer(layer_number).createMesh()
+                layer = self._layer_mesh_cache.getMesh(layer_number, layer_data.getLayer(layer_number))
             except Exception:
                 Logger.logException("w", "An exception occurred while creating layer mesh.")
                 return
@@ -463,14 +499,13 @@ class _CreateTopLayersJob(Job):
             if not layer or layer.getVertices() is None:
                 continue
 
-            layer_mesh.addIndices(layer_mesh.getVertexCount() + layer.getIndices())
-            layer_mesh.addVertices(layer.getVertices())
+            layer_meshes.append(layer)
 
             # Scale layer color by a brightness factor based on the current layer number
             # This will result in a range of 0.5 - 1.0 to multiply colors by.
             brightness = numpy.ones((1, 4), dtype=numpy.float32) * (2.0 - (i / self._solid_layers)) / 2.0
             brightness[0, 3] = 1.0
-            layer_mesh.addColors(layer.getColors() * brightness)
+            brightnesses.append(brightness)
 
             if self._cancel:
                 return
@@ -481,11 +516,12 @@ class _CreateTopLayersJob(Job):
             return
 
         Job.yieldThread()
-        jump_mesh = layer_data.getLayer(self._layer_number).createJumps()
+        jump_mesh = self._layer_mesh_cache.getJumps(self._layer_number, layer_data.getLayer(self._layer_number))
         if not jump_mesh or jump_mesh.getVertices() is None:
             jump_mesh = None
 
-        self.setResult({"layers": layer_mesh.build(), "jumps": jump_mesh})
+        # Join the layers into one mesh in one go, instead of growing a mesh layer by layer.
+        self.setResult({"layers": Layer.joinMeshes(layer_meshes, brightnesses), "jumps": jump_mesh})
 
     def cancel(self):
         self._cancel = True
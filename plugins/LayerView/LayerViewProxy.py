@@ -123,6 +123,44 @@ class LayerViewProxy(QObject):
             return active_view.getExtruderCount()
         return 0
 
+    ##  Get the layer with the highest value of a statistic, e.g. the layer
+    #   with the most retractions.
+    #
+    #   \param statistic One of LayerStatistics.Statistics: "segments",
+    #   "extruded_length", "travel_distance" or "retractions".
+    #   \return The layer number, or -1 if there are no layers.
+    @pyqtSlot(str, result = int)
+    def getLayerWithMost(self, statistic):
+        active_view = self._controller.getActiveView()
+        if type(active_view) == LayerView.LayerView.LayerView:
+            statistics = active_view.getLayerStatistics()
+            if statistics is not None:
+                layer_number = statistics.getLayerWithMost(statistic)
+                if layer_number is not None:
+                    return layer_number
+        return -1
+
+    ##  Get the statistics of a single layer.
+    #
+    #   \return Map with the number of segments, the extruded length and travel
+    #   distance in mm, the number of retractions and the number of lines per
+    #   line type. Empty if the layer is unknown.
+    @pyqtSlot(int, result = "QVariantMap")
+    def getLayerStatistics(self, layer_num):
+        active_view = self._controller.getActiveView()
+        if type(active_view) == LayerView.LayerView.LayerView:
+            statistics = active_view.getLayerStatistics()
+            summary = statistics.getSummary(layer_num) if statistics is not None else None
+            if summary is not None:
+                return {
+                    "segments": summary.getSegmentCount(),
+                    "extruded_length": summary.getExtrudedLength(),
+                    "travel_distance": summary.getTravelDistance(),
+                    "retractions": summary.getRetractionCount(),
+                    "line_type_counts": [int(count) for count in summary.getLineTypeCounts()]
+                }
+        return {}
+
     def _layerActivityChanged(self):
         self.activityChanged.emit()
             
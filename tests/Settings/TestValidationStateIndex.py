@@ -0,0 +1,173 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import pytest #This module contains unit tests.
+import unittest.mock #To create setting definitions and relations.
+
+from UM.Settings.SettingRelation import RelationType
+from UM.Settings.Validator import ValidatorState
+
+from cura.Settings.ValidationStateIndex import ValidationStateIndex #The class we're testing.
+
+##  Setting "b" depends on "a", and "c" depends on "b".
+dependencies = {"a": ["b"], "b": ["c"]}
+
+
+##  Signal that calls its listeners directly.
+class FakeSignal:
+    def __init__(self):
+        self._listeners = []
+
+    def connect(self, listener):
+        self._listeners.append(listener)
+
+    def disconnect(self, listener):
+        self._listeners.remove(listener)
+
+    def emit(self, *args):
+        for listener in self._listeners:
+            listener(*args)
+
+
+##  Container stack with a validation state per setting, which remembers which
+#   settings were checked.
+class FakeStack:
+    def __init__(self, keys, next_stack = None, own_keys = ()):
+        self.propertyChanged = FakeSignal()
+        self.containersChanged = FakeSignal()
+        self.validation_states = {key: ValidatorState.Valid for key in keys}
+        self.checked_keys = []
+        self._next_stack = next_stack
+        self._top = unittest.mock.MagicMock()
+        self._top.getAllKeys.return_value = set(own_keys)
+        self._top.getInstance = lambda key: key if key in own_keys else None
+
+    def setValidationState(self, key, validation_state):
+        self.validation_states[key] = validation_state
+        self.propertyChanged.emit(key, "validationState")
+
+    def getId(self):
+        return "FakeStack"
+
+    def getTop(self):
+        return self._top
+
+    def getNextStack(self):
+        return self._next_stack
+
+    def getAllKeys(self):
+        return set(self.validation_states)
+
+    def getProperty(self, key, property_name):
+        self.checked_keys.append(key)
+        return self.validation_states.get(key, ValidatorState.Valid)
+
+    def getSettingDefinition(self, key):
+        definition = unittest.mock.MagicMock()
+        definition.relations = []
+        for target_key in dependencies.get(key, []):
+            relation = unittest.mock.MagicMock(type = RelationType.RequiredByTarget)
+            relation.target.key = target_key
+            definition.relations.append(relation)
+        return definition
+
+
+@pytest.fixture
+def index():
+    return ValidationStateIndex()
+
+
+##  A changed setting is checked again together with the settings that depend
+#   on it, but only once the errors are asked for.
+def test_dependentsAreCheckedAgain(index):
+    stack = FakeStack(["a", "b", "c", "d"])
+    assert not index.hasErrors(stack)
+    assert sorted(stack.checked_keys) == ["a", "b", "c", "d"]
+
+    stack.checked_keys.clear()
+    stack.validation_states["c"] = ValidatorState.MaximumError
+    stack.propertyChanged.emit("a", "value")
+    assert stack.checked_keys == []  # Nothing is checked until the errors are asked for.
+
+    assert index.getErrorKeys(stack) == {"c"}
+    assert sorted(stack.checked_keys) == ["a", "b", "c"]
+
+    stack.checked_keys.clear()
+    stack.setValidationState("c", ValidatorState.Valid)
+    assert not index.hasErrors(stack)
+    assert stack.checked_keys == ["c"]
+
+
+##  It doesn't matter whether the errors are asked for by a listener to the
+#   stack that is called before or after the index.
+def test_listenerBeforeIndex(index):
+    stack = FakeStack(["a", "b"])
+    results = []
+    stack.propertyChanged.connect(lambda key, property_name: results.append(index.hasErrors(stack)))  # Connected before the index is.
+    assert not index.hasErrors(stack)
+
+    stack.setValidationState("b", ValidatorState.MinimumError)
+    assert index.hasErrors(stack)
+
+
+##  A change in one stack is also checked in the other global and extruder
+#   stacks, since they may refer to it.
+def test_changesAreCheckedInOtherStacks(index):
+    global_stack = FakeStack(["a", "b", "c"])
+    extruder_stack = FakeStack(["a", "b", "c"], next_stack = global_stack)
+    assert not index.hasErrors(global_stack)
+    assert not index.hasErrors(extruder_stack)
+
+    extruder_stack.validation_states["b"] = ValidatorState.MaximumError
+    global_stack.propertyChanged.emit("a", "value")
+
+    assert index.getErrorKeys(extruder_stack) == {"b"}
+
+
+##  Per-object stacks are only checked for their own settings and the
+#   settings depending on those, and only after a change in themselves or in
+#   the stacks below them.
+def test_perObjectStacks(index):
+    global_stack = FakeStack(["a", "b", "c", "d"])
+    extruder_stack = FakeStack(["a", "b", "c", "d"], next_stack = global_stack)
+    other_stack = FakeStack(["a", "b", "c", "d"])
+    object_stack = FakeStack(["a", "b", "c", "d"], next_stack = extruder_stack, own_keys = ["b"])
+    for stack in (global_stack, extruder_stack, other_stack):
+        assert not index.hasErrors(stack)
+    assert not index.hasErrors(object_stack, own_settings_only = True)
+    assert sorted(object_stack.checked_keys) == ["b", "c"]
+
+    # A change in an unrelated stack is not checked in the per-object stack.
+    object_stack.checked_keys.clear()
+    object_stack.validation_states["c"] = ValidatorState.MaximumError
+    other_stack.propertyChanged.emit("a", "value")
+    assert not index.hasErrors(object_stack, own_settings_only = True)
+    assert object_stack.checked_keys == []
+
+    # A change in the global stack below it is, but only for its own settings and their dependents.
+    global_stack.propertyChanged.emit("a", "value")
+    assert index.getErrorKeys(object_stack, own_settings_only = True) == {"c"}
+    assert sorted(object_stack.checked_keys) == ["b", "c"]
+
+    # A change in the per-object stack is not checked in the other stacks.
+    assert not index.hasErrors(global_stack)
+    global_stack.checked_keys.clear()
+    object_stack.setValidationState("c", ValidatorState.Valid)
+    assert not index.hasErrors(object_stack, own_settings_only = True)
+    assert not index.hasErrors(global_stack)
+    assert global_stack.checked_keys == []
+
+
+##  Adding a setting to the top container of a per-object stack changes which
+#   settings are checked.
+def test_perObjectStackNewSetting(index):
+    global_stack = FakeStack(["a", "b", "c", "d"])
+    object_stack = FakeStack(["a", "b", "c", "d"], next_stack = global_stack, own_keys = ["c"])
+    assert not index.hasErrors(object_stack, own_settings_only = True)
+
+    object_stack.validation_states["d"] = ValidatorState.Exception
+    object_stack._top.getAllKeys.return_value = {"c", "d"}
+    object_stack._top.getInstance = lambda key: key if key in ("c", "d") else None
+    object_stack.propertyChanged.emit("d", "value")
+
+    assert index.getErrorKeys(object_stack, own_settings_only = True) == {"d"}
@@ -0,0 +1,115 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+import os
+import pytest
+import struct
+
+from cura.BatchSlicer import BatchJob, BatchSlicer, _getStackValues, _parseTransformation, _writeBinaryStl
+
+resources_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resources")
+
+
+@pytest.fixture
+def slicer(tmpdir):
+    return BatchSlicer("CuraEngine", resources_path, str(tmpdir.join("output")), 2)
+
+
+##  A 3MF transformation has 3 columns and 4 rows, of which the last is the
+#   translation.
+def test_parseTransformation():
+    assert numpy.array_equal(_parseTransformation(""), numpy.identity(4))
+
+    matrix = _parseTransformation("0 1 0 -1 0 0 0 0 1 10 20 30")
+    assert numpy.allclose(numpy.array([1, 0, 0, 1]).dot(matrix), [10, 21, 30, 1])
+
+
+##  Containers higher in a stack override the values of lower containers.
+def test_getStackValues():
+    containers = {
+        "user": {"layer_height": "0.1"},
+        "quality": {"layer_height": "0.2", "infill_sparse_density": "20"},
+        "material": {"infill_sparse_density": "30", "material_print_temperature": "200"}
+    }
+    assert _getStackValues(["user", "quality", "missing", "material", "fdmprinter"], containers) == {"layer_height": "0.1", "infill_sparse_density": "20", "material_print_temperature": "200"}
+
+
+def test_writeBinaryStl(tmpdir):
+    triangles = numpy.array([[[0, 0, 0], [1, 0, 0], [0, 1, 0]], [[0, 0, 1], [1, 0, 1], [0, 1, 1]]], dtype = numpy.float64)
+    path = str(tmpdir.join("mesh.stl"))
+    _writeBinaryStl(path, triangles)
+
+    with open(path, "rb") as f:
+        data = f.read()
+    assert len(data) == 80 + 4 + 2 * 50
+    assert struct.unpack("<I", data[80:84]) == (2, )
+    vertices = numpy.frombuffer(data[84:], dtype = [("normal", "<f4", (3, )), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")])["vertices"]
+    assert numpy.array_equal(vertices, triangles)
+
+
+def test_getEngineCommand(slicer):
+    job = BatchJob("part", "ultimaker3", ["part.stl"], global_settings = {"layer_height": 0.1, "adhesion_type": "brim"}, extruder_settings = {1: {"extruder_nr": 1}, 0: {"extruder_nr": 0}})
+
+    assert slicer.getEngineCommand(job, "part.gcode") == [
+        "CuraEngine", "slice", "-v", "-j", os.path.join(resources_path, "definitions", "ultimaker3.def.json"),
+        "-s", "adhesion_type=brim", "-s", "layer_height=0.1",
+        "-l", "part.stl",
+        "-e0", "-s", "extruder_nr=0",
+        "-e1", "-s", "extruder_nr=1",
+        "-o", "part.gcode"
+    ]
+
+
+##  The engine gets the value of every setting, with the formulas of the
+#   definitions and profiles evaluated.
+def test_settingsAreEvaluated(slicer, tmpdir):
+    profile_file = str(tmpdir.join("profile.inst.cfg"))
+    with open(profile_file, "w", encoding = "utf-8") as f:
+        f.write("[general]\nversion = 2\nname = Test\n\n[metadata]\ntype = quality\n\n[values]\nspeed_infill = =speed_print * 2\ninfill_sparse_density = 25\n")
+
+    job = slicer.addMesh("part.stl", "fdmprinter", [profile_file], {"infill_sparse_density": "50", "speed_print": "40", "machine_start_gcode": "M104 S{material_print_temperature}"})
+
+    # The defaults of the definition are for 20% grid infill.
+    assert job.global_settings["infill_sparse_density"] == 50
+    assert job.global_settings["infill_pattern"] == "lines"
+    assert job.global_settings["infill_line_distance"] == pytest.approx(job.global_settings["infill_line_width"] * 100 / 50)
+    assert job.global_settings["speed_infill"] == 80
+    assert job.global_settings["speed_wall"] == 20  # Half of the print speed.
+
+    # Like in Cura, settings can be used in the start g-code.
+    assert job.global_settings["machine_start_gcode"] == "M104 S{0}".format(job.global_settings["material_print_temperature"])
+    assert not job.global_settings["material_print_temp_prepend"]
+    assert job.extruder_settings == {}  # A single extruder uses the global settings.
+
+
+##  Machines with more than one extruder get the settings of each extruder.
+def test_extruderSettings(slicer):
+    job = slicer.addMesh("part.stl", "ultimaker3")
+
+    assert sorted(job.extruder_settings) == [0, 1]
+    assert job.extruder_settings[1]["extruder_nr"] == 1
+    assert "machine_extruder_count" not in job.extruder_settings[0]  # Not settable per extruder.
+    assert job.global_settings["machine_extruder_count"] == 2
+
+
+##  A formula that can't be evaluated makes adding the job fail, instead of
+#   silently slicing with a wrong value.
+def test_invalidFormula(slicer):
+    with pytest.raises(ValueError):
+        slicer.addMesh("part.stl", "fdmprinter", settings = {"infill_sparse_density": "=no_such_setting * 2"})
+    assert slicer.getJobs() == []
+
+
+##  The extracted meshes are removed, also if slicing fails.
+def test_temporaryDirectoryIsRemoved(slicer, monkeypatch):
+    def sliceJob(job):
+        raise RuntimeError("Slicing failed.")
+    monkeypatch.setattr(slicer, "_sliceJob", sliceJob)
+    slicer.addMesh("part.stl")
+    temporary_directory = slicer._temporary_directory.name
+    assert os.path.isdir(temporary_directory)
+
+    with pytest.raises(RuntimeError):
+        slicer.run()
+    assert not os.path.exists(temporary_directory)
@@ -0,0 +1,108 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+import pytest
+
+from cura.ChunkedLayerData import ChunkedLayerData
+from cura.Layer import Layer
+from cura.LayerData import LayerData
+from cura.LayerPolygon import LayerPolygon
+
+material_color_map = numpy.array([[1, 1, 0, 1]], dtype = numpy.float32)
+
+
+##  Creates a layer with three straight wall lines, a travel move and two
+#   infill lines. The Y coordinate of its points is the layer number.
+def createLayer(layer_number):
+    points = numpy.array([[0, 0], [1, 0], [2, 0], [3, 0], [3, 5], [4, 6], [5, 5]], dtype = "f4")
+    line_types = bytes([LayerPolygon.Inset0Type] * 3 + [LayerPolygon.MoveCombingType] + [LayerPolygon.InfillType] * 2)
+    line_widths = numpy.full(6, 0.4, dtype = "f4").tobytes()
+    return Layer.fromPathSegments(layer_number, layer_number * 1000, 100, [(0, 0, points.tobytes(), line_types, line_widths)])
+
+
+def createLayerData(layer_count, decimate = False):
+    layer_data = ChunkedLayerData(material_color_map, layers_per_chunk = 2, decimate = decimate)
+    for layer_number in range(layer_count):
+        layer_data.setLayer(layer_number, createLayer(layer_number))
+    layer_data.update()
+    return layer_data
+
+
+##  Get the layer number and line type of each line in some element ranges
+#   of a chunk.
+def getLines(chunk, ranges):
+    indices = chunk.getIndices()
+    line_types = chunk.getAttribute("line_types")["value"]
+    lines = []
+    for start, end in ranges:
+        for first_vertex in indices[start:end:2]:
+            lines.append((int(round(chunk.getVertices()[first_vertex, 1])), int(line_types[first_vertex])))
+    return lines
+
+
+##  Layers are only visible after update(), in chunks of consecutive layers.
+def test_update():
+    layer_data = ChunkedLayerData(material_color_map, layers_per_chunk = 2)
+    for layer_number in range(5):
+        layer_data.setLayer(layer_number, createLayer(layer_number))
+    assert layer_data.hasChanges()
+    assert layer_data.getChunks() == []
+    assert layer_data.getLayers() == {}
+
+    layer_data.update()
+    assert not layer_data.hasChanges()
+    assert [sorted(chunk.getLayers()) for chunk in layer_data.getChunks()] == [[0, 1], [2, 3], [4]]
+    assert sorted(layer_data.getLayers()) == [0, 1, 2, 3, 4]
+    assert layer_data.getElementCounts() == {layer_number: 12 for layer_number in range(5)}  # 6 lines per layer.
+
+
+##  Only the chunks with changed layers are rebuilt.
+def test_onlyChangedChunksAreRebuilt():
+    layer_data = createLayerData(5)
+    old_chunks = layer_data.getChunks()
+
+    layer_data.setLayer(3, createLayer(3))
+    layer_data.removeLayer(4)
+    layer_data.update()
+
+    chunks = layer_data.getChunks()
+    assert len(chunks) == 2
+    assert chunks[0] is old_chunks[0]
+    assert chunks[1] is not old_chunks[1]
+    assert sorted(layer_data.getLayers()) == [0, 1, 2, 3]
+
+
+##  The element ranges of the chunks together hold exactly the lines of the
+#   shown layers and line type groups, also when the layer range crosses
+#   chunk boundaries.
+@pytest.mark.parametrize("minimum_layer, maximum_layer", [(0, 4), (1, 2), (1, 3), (3, 3), (5, 6)])
+def test_elementRanges(minimum_layer, maximum_layer):
+    layer_data = createLayerData(5)
+    groups = [LayerData.AlwaysShownGroup, LayerData.SkinGroup, LayerData.TravelGroup]
+
+    lines = []
+    for chunk in layer_data.getChunks():
+        lines.extend(getLines(chunk, chunk.getElementRanges(minimum_layer, maximum_layer, groups)))
+
+    expected_lines = []
+    for layer_number in range(minimum_layer, min(maximum_layer, 4) + 1):
+        expected_lines.extend([(layer_number, LayerPolygon.Inset0Type)] * 3 + [(layer_number, LayerPolygon.MoveCombingType)])
+    assert sorted(lines) == sorted(expected_lines)
+
+
+##  Decimated chunks leave out travel moves and join straight runs of lines.
+def test_decimatedChunks():
+    layer_data = createLayerData(3, decimate = True)
+    chunks = layer_data.getChunks()
+    decimated_chunks = layer_data.getDecimatedChunks()
+    assert len(decimated_chunks) == len(chunks)
+
+    for chunk, decimated_chunk in zip(chunks, decimated_chunks):
+        assert decimated_chunk.getVertices() is chunk.getVertices()
+        lines = getLines(decimated_chunk, decimated_chunk.getElementRanges(0, 2, range(LayerData.LineTypeGroupCount)))
+        for layer_number in chunk.getLayers():
+            # The three walls become one line, the infill lines go in different directions.
+            assert sorted(line_type for line_layer, line_type in lines if line_layer == layer_number) == [LayerPolygon.Inset0Type, LayerPolygon.InfillType, LayerPolygon.InfillType]
+
+    assert createLayerData(1).getDecimatedChunks() == [None]
@@ -0,0 +1,41 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from cura.GCodeBuffer import GCodeBuffer
+
+
+##  The buffer should read like a list of g-code strings.
+def test_listInterface():
+    gcode = GCodeBuffer()
+    gcode.append(b"G1 X10\n")
+    gcode.append("G1 X20\n")
+    gcode.insert(0, b";FLAVOR:Marlin\n")
+
+    assert len(gcode) == 3
+    assert list(gcode) == [";FLAVOR:Marlin\n", "G1 X10\n", "G1 X20\n"]
+    assert gcode[1] == "G1 X10\n"
+
+    gcode[1] = "G1 X15\n"
+    assert gcode[1] == "G1 X15\n"
+
+
+##  Only chunks with placeholders are changed, and unknown placeholders stay.
+def test_replaceTokens():
+    gcode = GCodeBuffer([b";PRINT.TIME:{print_time}\n;{unknown}\n", b"G1 X10\n", b"M117 {jobname} {jobname}\n"])
+    assert gcode.getTokenChunkIndices() == [0, 2]
+
+    gcode.replaceTokens({"print_time": 1234, "jobname": "UM2_box"})
+
+    assert list(gcode) == [";PRINT.TIME:1234\n;{unknown}\n", "G1 X10\n", "M117 UM2_box UM2_box\n"]
+
+
+##  Replacing placeholders in a copy doesn't change the original.
+def test_copy():
+    gcode = GCodeBuffer([b";PRINT.TIME:{print_time}\n", b"G1 X10\n"])
+    gcode_copy = gcode.copy()
+    gcode_copy.replaceTokens({"print_time": 1234})
+    gcode_copy.append(b"G1 X20\n")
+
+    assert list(gcode) == [";PRINT.TIME:{print_time}\n", "G1 X10\n"]
+    assert list(gcode_copy) == [";PRINT.TIME:1234\n", "G1 X10\n", "G1 X20\n"]
+    assert gcode_copy.getTokenChunkIndices() == [0]
@@ -0,0 +1,42 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+
+from cura.Layer import Layer
+from cura.LayerPolygon import LayerPolygon
+
+
+##  Creates the tuple of a 2D path segment as sent by the engine.
+def createSegment(points, line_type = LayerPolygon.Inset0Type):
+    line_count = max(len(points) - 1, 0)
+    return (0, 0, numpy.array(points, dtype = "f4").tobytes(), bytes([line_type] * line_count), numpy.ones(line_count, dtype = "f4").tobytes())
+
+
+##  Path segments without points or with a single point are skipped without
+#   affecting the other path segments of the layer.
+def test_fromPathSegmentsWithoutLines():
+    segments = [
+        createSegment([[0, 0], [1, 0], [2, 0]]),
+        createSegment([]),
+        createSegment([[5, 5]]),
+        createSegment([[3, 0], [4, 0]], LayerPolygon.InfillType),
+        createSegment([])
+    ]
+    layer = Layer.fromPathSegments(0, 200, 100, segments)
+
+    polygon = layer.polygons[0]
+    assert polygon.types.ravel().tolist() == [LayerPolygon.Inset0Type, LayerPolygon.Inset0Type, LayerPolygon.InfillType]
+    line_points = polygon.getLinePoints()
+    assert line_points[:, 0].tolist() == [0, 1, 3]
+    assert line_points[:, 3].tolist() == [1, 2, 4]
+
+
+##  The line type and width can be given once for a whole path segment.
+def test_fromPathSegmentsWithSingleLineType():
+    segment = (0, 0, numpy.array([[0, 0], [1, 0], [2, 0]], dtype = "f4").tobytes(), bytes([LayerPolygon.SkinType]), numpy.array([0.4], dtype = "f4").tobytes())
+    layer = Layer.fromPathSegments(0, 200, 100, [segment, createSegment([])])
+
+    polygon = layer.polygons[0]
+    assert polygon.types.ravel().tolist() == [LayerPolygon.SkinType, LayerPolygon.SkinType]
+    assert numpy.allclose(polygon.lineWidths.ravel(), [0.4, 0.4])
@@ -0,0 +1,118 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import gc
+import numpy
+
+from cura.Layer import Layer
+from cura.LayerDataStorage import LayerDataStorage
+from cura.LayerPolygon import LayerPolygon
+
+
+##  Creates a layer with a single polygon of 100 lines.
+def createLayer(layer_number):
+    layer = Layer(layer_number)
+    data = numpy.zeros((101, 3), dtype = numpy.float32)
+    data[:, 0] = numpy.arange(101) + layer_number
+    line_types = numpy.full((100, 1), LayerPolygon.InfillType, dtype = numpy.uint8)
+    line_widths = numpy.full((100, 1), 0.4, dtype = numpy.float32)
+    layer.polygons.append(LayerPolygon(0, line_types, data, line_widths, line_widths))
+    return layer
+
+
+def getLayerSize(layer):
+    return sum(buffer.nbytes for polygon in layer.polygons for buffer in polygon.getBuffers().values())
+
+
+##  The least recently used layers are moved to the scratch file when the
+#   budget is exceeded, and keep their data.
+def test_leastRecentlyUsedLayersAreStored():
+    layers = [createLayer(layer_number) for layer_number in range(3)]
+    storage = LayerDataStorage(2 * getLayerSize(layers[0]))
+    for layer in layers:
+        storage.addLayer(layer)
+
+    assert not storage.isLayerLoaded(layers[0])
+    assert storage.isLayerLoaded(layers[1])
+    assert storage.isLayerLoaded(layers[2])
+    assert not layers[0].polygons[0].data.flags.owndata  # A view on the scratch file.
+    assert layers[0].polygons[0].data[5, 0] == 5
+
+    # Loading the stored layer moves the least recently used other layer out.
+    storage.loadLayers([layers[0]])
+    assert storage.isLayerLoaded(layers[0])
+    assert layers[0].polygons[0].data.flags.owndata
+    assert layers[0].polygons[0].data[5, 0] == 5
+    assert not storage.isLayerLoaded(layers[1])
+    assert storage.isLayerLoaded(layers[2])
+
+
+##  The arrays of a stored layer can still be changed.
+def test_storedLayersAreWritable():
+    layers = [createLayer(layer_number) for layer_number in range(2)]
+    storage = LayerDataStorage(getLayerSize(layers[0]))
+    for layer in layers:
+        storage.addLayer(layer)
+    assert not storage.isLayerLoaded(layers[0])
+
+    layers[0].polygons[0].types[0] = LayerPolygon.SkinType
+    assert layers[0].polygons[0].types[0] == LayerPolygon.SkinType
+
+    storage.loadLayers([layers[0]])
+    assert layers[0].polygons[0].types[0] == LayerPolygon.SkinType
+
+
+##  A removed layer is no longer counted towards the budget.
+def test_removeLayer():
+    layers = [createLayer(layer_number) for layer_number in range(3)]
+    storage = LayerDataStorage(2 * getLayerSize(layers[0]))
+    storage.addLayer(layers[0])
+    storage.addLayer(layers[1])
+    storage.removeLayer(layers[0])
+    storage.addLayer(layers[2])
+
+    assert storage.isLayerLoaded(layers[1])
+    assert storage.isLayerLoaded(layers[2])
+
+
+##  The meshes built from the layers count towards the budget.
+def test_meshSize():
+    layers = [createLayer(layer_number) for layer_number in range(3)]
+    storage = LayerDataStorage(3 * getLayerSize(layers[0]))
+    for layer in layers:
+        storage.addLayer(layer)
+    assert all(storage.isLayerLoaded(layer) for layer in layers)
+
+    storage.setMeshSize(2 * getLayerSize(layers[0]))
+    assert not storage.isLayerLoaded(layers[0])
+    assert not storage.isLayerLoaded(layers[1])
+    assert storage.isLayerLoaded(layers[2])
+
+
+##  A layer that is stored again gets the same space in the scratch file, and
+#   the space of a deleted layer is used for other layers.
+def test_spaceIsReused():
+    layers = [createLayer(layer_number) for layer_number in range(4)]
+    storage = LayerDataStorage(getLayerSize(layers[0]))
+    storage.SegmentSize = 3 * sum(storage._getAlignedSize(buffer.nbytes) for buffer in layers[0].polygons[0].getBuffers().values())
+    for layer in layers[:3]:
+        storage.addLayer(layer)
+    storage.loadLayers([layers[0]])  # Stores the third layer.
+    assert [storage.isLayerLoaded(layer) for layer in layers[:3]] == [True, False, False]
+    deleted_layer_range = storage._layer_ranges[layers[1]][1]
+
+    storage.loadLayers([layers[2]])  # Stores the first layer again.
+    assert not storage.isLayerLoaded(layers[0])
+    assert storage._free_ranges == [[]]  # The segment is full.
+
+    storage.removeLayer(layers[1])
+    del layers[1]
+    gc.collect()
+    storage.addLayer(layers[2])  # The fourth layer.
+    storage.loadLayers([layers[1]])  # Stores the fourth layer, in the range of the deleted layer.
+    assert not storage.isLayerLoaded(layers[2])
+    assert storage._layer_ranges[layers[2]][1] == deleted_layer_range
+
+    assert len(storage._segments) == 1  # All stored arrays are views on the same mapping.
+    for layer in layers:
+        assert layer.polygons[0].data[5, 0] == 5 + layer.polygons[0].data[0, 0]
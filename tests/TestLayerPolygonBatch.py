@@ -0,0 +1,43 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+
+from cura.LayerPolygon import LayerPolygon
+from cura.LayerPolygonBatch import LayerPolygonBatch
+
+
+##  Creates a batch of polygons with the given number of points each, with
+#   points (0, 0, 0), (1, 0, 0), (2, 0, 0), etc.
+def createBatch(point_counts):
+    point_offsets = numpy.concatenate(([0], numpy.cumsum(point_counts)))
+    line_count = int(numpy.sum(numpy.maximum(numpy.array(point_counts) - 1, 0)))
+    data = numpy.zeros((point_offsets[-1], 3), dtype = numpy.float32)
+    data[:, 0] = numpy.arange(point_offsets[-1])
+    line_types = numpy.full((line_count, 1), LayerPolygon.Inset0Type, dtype = numpy.uint8)
+    line_widths = numpy.ones((line_count, 1), dtype = numpy.float32)
+    return LayerPolygonBatch(numpy.zeros(len(point_counts), dtype = numpy.int32), line_types, data, line_widths, line_widths, point_offsets)
+
+
+##  Polygons without points or with a single point have no lines, and don't
+#   shift the lines of the polygons after them.
+def test_polygonsWithoutLines():
+    batch = createBatch([3, 0, 1, 2, 0])
+
+    assert batch.polygonCount == 5
+    line_points = batch.getLinePoints()
+    assert line_points[:, 0].tolist() == [0, 1, 4]  # Start points.
+    assert line_points[:, 3].tolist() == [1, 2, 5]  # End points.
+
+    batch.buildCache()
+    vertex_count = batch.lineMeshVertexCount()
+    vertices = numpy.zeros((vertex_count, 3), dtype = numpy.float32)
+    line_dimensions = numpy.zeros((vertex_count, 2), dtype = numpy.float32)
+    extruders = numpy.zeros(vertex_count, dtype = numpy.float32)
+    line_types = numpy.zeros(vertex_count, dtype = numpy.float32)
+    indices = numpy.zeros((batch.lineMeshElementCount(), 2), dtype = numpy.int32)
+    batch.build(0, 0, vertices, line_dimensions, extruders, line_types, indices)
+
+    # No line is drawn from the end of the first polygon to the start of the last one.
+    lines = vertices[indices][:, :, 0].tolist()
+    assert lines == [[0, 1], [1, 2], [4, 5]]
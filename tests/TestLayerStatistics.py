@@ -0,0 +1,68 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+
+from cura.Layer import Layer
+from cura.LayerData import LayerData
+from cura.LayerPolygon import LayerPolygon
+from cura.LayerStatistics import LayerStatistics
+
+
+##  Creates a layer with a single path through the given points.
+def createLayer(points, line_types):
+    layer = Layer(0)
+    data = numpy.array(points, dtype = numpy.float32)
+    line_types = numpy.array(line_types, dtype = numpy.uint8).reshape((-1, 1))
+    line_widths = numpy.ones(line_types.shape, dtype = numpy.float32)
+    layer.polygons.append(LayerPolygon(0, line_types, data, line_widths, line_widths))
+    return layer
+
+
+##  The lengths, counts and bounding box of a layer are summarised.
+def test_summary():
+    statistics = LayerStatistics()
+    # Two walls of 10 mm, a retracted travel move in two parts and 5 mm of infill.
+    statistics.setLayer(3, createLayer([[0, 0, 0], [10, 0, 0], [10, 0, 10], [10, 0, 13], [10, 0, 14], [5, 0, 14]],
+                                       [LayerPolygon.Inset0Type, LayerPolygon.Inset0Type, LayerPolygon.MoveRetractionType, LayerPolygon.MoveRetractionType, LayerPolygon.InfillType]))
+
+    summary = statistics.getSummary(3)
+    assert summary.getSegmentCount() == 5
+    assert summary.getExtrudedLength() == 25
+    assert summary.getTravelDistance() == 4
+    assert summary.getRetractionCount() == 1
+    assert summary.getLineTypeCounts()[LayerPolygon.Inset0Type] == 2
+    minimum, maximum = summary.getBoundingBox()
+    assert list(minimum) == [0, 0, 0]
+    assert list(maximum) == [10, 0, 14]
+    assert statistics.getSummary(4) is None
+
+
+##  The layer numbers and the layers with the most of something stay correct
+#   as layers are added, replaced and removed.
+def test_layerWithMost():
+    statistics = LayerStatistics()
+    assert statistics.getLayerNumberRange() is None
+    assert statistics.getLayerWithMost("extruded_length") is None
+
+    statistics.setLayer(1, createLayer([[0, 0, 0], [1, 0, 0]], [LayerPolygon.SkinType]))
+    statistics.setLayer(2, createLayer([[0, 0, 0], [3, 0, 0]], [LayerPolygon.SkinType]))
+    statistics.setLayer(0, createLayer([[0, 0, 0], [2, 0, 0]], [LayerPolygon.SkinType]))
+    assert statistics.getLayerNumberRange() == (0, 2)
+    assert statistics.getLayerWithMost("extruded_length") == 2
+
+    statistics.setLayer(2, createLayer([[0, 0, 0], [0.5, 0, 0]], [LayerPolygon.SkinType]))
+    assert statistics.getLayerWithMost("extruded_length") == 0
+
+    statistics.removeLayer(0)
+    assert statistics.getLayerNumberRange() == (1, 2)
+    assert statistics.getLayerWithMost("extruded_length") == 1
+
+
+##  The layer range of a plain LayerData doesn't need the statistics.
+def test_layerNumberRangeWithoutStatistics():
+    layer_data = LayerData(layers = {2: Layer(2), 5: Layer(5), 3: Layer(3)}, element_counts = {})
+
+    assert layer_data.getLayerNumberRange() == (2, 5)
+    assert layer_data._statistics is None
+    assert LayerData(layers = {}, element_counts = {}).getLayerNumberRange() is None